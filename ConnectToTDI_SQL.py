@@ -1,9 +1,69 @@
-import MySQLdb
 import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from TDIBackends import makeBackend, SCHEMA_FILE
 
 class TDISQL:
 	'Data structure for SQL manipulation using Python'
 
+	#maximum number of genes/patients bound into a single 'IN (...)' list by the batch query functions
+	BATCH_SIZE = 500
+
+	#approximate size in bytes of the blocks read by the chunked file parser
+	CHUNK_BYTES = 64 * 1024 * 1024
+
+	#maximum number of statements kept prepared per connection by 'executeStatement'
+	MAX_STATEMENTS = 256
+
+	#maximum number of patient profiles cached per connection by 'getPatientProfile' (the least recently used are evicted)
+	PROFILE_CACHE_SIZE = 1000
+
+	#foreign keys of MakeTDITables.sql (table -> list of (column, referenced table, referenced column)), checked by 'findOrphans'
+	FOREIGN_KEYS = {
+		'Patients': [('cancer_type_id', 'Cancer_Types', 'cancer_type_id')],
+		'SGA_Unit_Group': [('cancer_type_id', 'Cancer_Types', 'cancer_type_id')],
+		'Gene_Group_XRef': [('gene_id', 'Genes', 'gene_id'), ('group_id', 'SGA_Unit_Group', 'group_id')],
+		'Somatic_Mutations': [('patient_id', 'Patients', 'patient_id'), ('gene_id', 'Genes', 'gene_id')],
+		'SM_Positions': [('gene_id', 'Genes', 'gene_id')],
+		'SCNAs': [('patient_id', 'Patients', 'patient_id'), ('gene_id', 'Genes', 'gene_id'), ('platform_id', 'Exp_Platforms', 'platform_id')],
+		'SGAs': [('patient_id', 'Patients', 'patient_id'), ('gene_id', 'Genes', 'gene_id'), ('source_sm_id', 'Somatic_Mutations', 'sm_id'),
+				 ('source_scna_id', 'SCNAs', 'scna_id'), ('source_sga_unit', 'SGA_Unit_Group', 'group_id')],
+		'DEGs': [('patient_id', 'Patients', 'patient_id'), ('gene_id', 'Genes', 'gene_id'), ('platform_id', 'Exp_Platforms', 'platform_id')],
+		'TDI_Results': [('patient_id', 'Patients', 'patient_id'), ('gt_gene_id', 'Genes', 'gene_id'), ('gt_unit_group_id', 'SGA_Unit_Group', 'group_id'),
+						('ge_gene_id', 'Genes', 'gene_id'), ('exp_id', 'Experiments', 'exp_id')],
+	}
+
+	#UNIQUE keys of MakeTDITables.sql that the loaders rely on to skip duplicates with INSERT IGNORE; 'bulkLoad' keeps
+	#unique checks on when it loads one of these tables
+	UNIQUE_KEYS = {
+		'Genes': ['gene_name'],
+		'Cancer_Types': ['abbv'],
+		'Patients': ['name'],
+		'SGA_Unit_Group': ['name'],
+	}
+
+	"""
+	Layout of the input files read by the populate functions, used by 'validateInputFile'.
+		columns: number of columns expected on every line
+		keys: column index -> dimension map the value must resolve against ('driver' is a gene or an SGA unit/group)
+		ints/floats: column indexes that must parse as numbers
+		unique: column indexes that together identify a line, used to report duplicates
+		skip: column index -> values for which the loader silently skips the line
+	"""
+	INPUT_SPECS = {
+		'cancer_type': {'columns': 2, 'keys': {}, 'ints': [], 'floats': [], 'unique': [1]},
+		'gene': {'columns': 6, 'keys': {}, 'ints': [3, 4], 'floats': [], 'unique': [0]},
+		'platform': {'columns': 2, 'keys': {}, 'ints': [], 'floats': [], 'unique': [0, 1]},
+		'sga_unit_group': {'columns': 4, 'keys': {1: 'cancer_type'}, 'ints': [], 'floats': [], 'unique': [0]},
+		'patient': {'columns': 7, 'keys': {6: 'cancer_type'}, 'ints': [1, 3], 'floats': [], 'unique': [0]},
+		'sm': {'columns': 10, 'keys': {0: 'patient', 1: 'gene'}, 'ints': [5, 6], 'floats': [], 'unique': [0, 1, 5, 7], 'skip': {1: ['Unknown', 'unknown']}},
+		'scna': {'columns': 5, 'keys': {0: 'patient', 1: 'gene', 4: 'platform'}, 'ints': [3], 'floats': [], 'unique': [0, 1, 4]},
+		'scna_segment': {'columns': 7, 'keys': {0: 'patient', 6: 'platform'}, 'ints': [2, 3, 5], 'floats': [], 'unique': [0, 1, 2, 3]},
+		'deg': {'columns': 5, 'keys': {0: 'patient', 1: 'gene', 3: 'platform'}, 'ints': [4], 'floats': [], 'unique': [0, 1, 3]},
+		'tdi': {'columns': 5, 'keys': {0: 'patient', 1: 'driver', 2: 'gene'}, 'ints': [], 'floats': [3], 'unique': [0, 1, 2]},
+	}
+
 	"""
 	Function: init
 	Initializes connection to MySQL database
@@ -11,10 +71,18 @@ class TDISQL:
 		host: host name for the database you are connecting to
 		user: username for the database
 		password: corresponding password for the given username
-		dbName: name of the MySQL database you want to work on
+		dbName: name of the MySQL database you want to work on (for SQLite, the path of the database file)
+		backend: optional, 'mysql' (default) or 'sqlite' for an embedded database file (see TDIBackends)
 	"""
-	def __init__(self, host, user, password, dbName):
-		self.db = MySQLdb.connect(host, user, password, dbName)
+	def __init__(self, host, user, password, dbName, backend = 'mysql'):
+		self.backend = makeBackend(backend, host, user, password, dbName)
+		self.db = self.backend.connect()
+		self.geneIntervalIndex = None
+		self.dimensionMaps = None
+		self.geneNameArray = None
+		self.statementCursors = {}
+		self.patientProfiles = OrderedDict()
+		self.profileCacheSize = self.PROFILE_CACHE_SIZE
 
 	"""
 	Parses a string containing the normal amino acid, the location and
@@ -74,99 +142,269 @@ class TDISQL:
 	"""
 	Function reads in a line from the raw input file, 
 	parses out all the different data for each data field,
-	then returns the data formatted for an 'SQL insert' command.
+	then returns the values to bind to the placeholders of a parameterized 'SQL insert' statement.
+	The values are bound by the database driver, so quotes in names need no escaping.
 
 	param: splitLine - Line of input text as a list of strings split by their delimiter
-	param isString - List of binary values indicating whether or not the corresponding index in splitLine should be interpreted
-						as a string or not.
-	param firstNull: whether the first element in the insert should be 'NULL' (due to auto-incrementing the primary key)
-	return valueString: Data formatted as a string for input into an 'SQL insert' command.
-	"""
-	def processValues(self, splitLine, isString, firstNull = True):
-		valueString = ""
-		if firstNull:
-			valueString += "NULL"
+	param isString - List of values indicating how the corresponding index in splitLine should be interpreted:
+						1 for a string, 0 for a number (or an ID already resolved by a lookup) and 2 for an amino acid
+						code, which is expanded into three values (AA location, normal AA, mutated AA)
+	return params: list of values, with None for 'null'/'NULL' fields
+	"""
+	def processParams(self, splitLine, isString):
+		params = []
 		for i in range(len(splitLine)):
 			if splitLine[i] == "null" or splitLine[i] == "NULL":
-				valueString += ",NULL"
+				params.append(None)
+			elif isString[i] == 2:
+				parsedCode = self.parseAACode(splitLine[i])
+				params += [None if x == "NULL" else x for x in (parsedCode[1], parsedCode[0], parsedCode[2])]
 			else:
-				if isString[i] == 1:
-					if "'" in splitLine[i]:
-						splitLine[i] = splitLine[i].replace("'", "\\'")
-						#print splitLine[i]
-					quotedItem = ",'" + splitLine[i] + "'"
-					valueString += quotedItem
-				elif isString[i] == 0:
-					item = "," + str(splitLine[i])
-					valueString += item
-				elif isString[i] == 2:
-					parsedCode = parseAACode(splitLine[i])
-					valueString += "," + str(parsedCode[1]) + ",'" + str(parsedCode[0]) + "','" + str(parsedCode[2]) + "'" 
-		return valueString
-
-	def exists(self, cursor, query):
-		cursor.execute(query)
+				params.append(splitLine[i])
+		return params
+
+	"""
+	Executes a parameterized statement and returns the cursor holding its results. Each distinct statement text gets
+	its own cursor, kept for the life of the connection, so a statement is prepared once and only re-bound when it is
+	run again for the next input line or the next call (SQLite keeps the compiled statement on the cursor; MySQLdb
+	binds the values on the client, and the constant statement text is what the server digests and caches).
+
+	@param sql: statement with %s placeholders. Only identifiers may be formatted into it, never values.
+	@param params: values to bind to the placeholders
+	@return cursor
+	"""
+	def executeStatement(self, sql, params):
+		cursor = self.statementCursors.get(sql)
+		if cursor is None:
+			if len(self.statementCursors) >= self.MAX_STATEMENTS:
+				self.closeStatements()
+			cursor = self.db.cursor()
+			self.statementCursors[sql] = cursor
+		cursor.execute(sql, params)
+		return cursor
+
+	"""
+	Closes the cursors of the statements cached by 'executeStatement'.
+	"""
+	def closeStatements(self):
+		for cursor in self.statementCursors.values():
+			try:
+				cursor.close()
+			except:
+				pass
+		self.statementCursors = {}
+
+	def exists(self, cursor, query, params = None):
+		cursor.execute(query, params)
 		results = cursor.fetchall()
 		if len(results) > 0:
 			return True
 		else:
 			return False
 
-	def populateCancerTypeTable(self, inputFile, delimiter):
+	"""
+	Creates the tables, indexes and views of MakeTDITables.sql, translated to the dialect of the backend.
+
+	@param schemaFile (optional): path of the schema script (default: MakeTDITables.sql next to this module)
+	"""
+	def createSchema(self, schemaFile = SCHEMA_FILE):
+		cursor = self.db.cursor()
+		schemaInput = open(schemaFile, "r")
+		statements = self.backend.schemaStatements(schemaInput.read())
+		schemaInput.close()
+		for statement in statements:
+			try:
+				cursor.execute(statement)
+			except:
+				print "Error creating schema. Statement:"
+				print statement
+				self.db.rollback()
+				raise
+		self.db.commit()
+
+	"""
+	Bulk-load session. Inside it the backend's bulk-load settings apply (MySQL: foreign_key_checks off, and unique_checks
+	off unless a table of 'UNIQUE_KEYS' is loaded; SQLite: no fsync, foreign keys off, a large page cache) and the
+	non-unique secondary indexes of the loaded tables are dropped, so inserts do not maintain them row by row. On leaving
+	the session, even after an error, the indexes are rebuilt (one sorted pass per table on MySQL) and the loaded tables
+	are checked for orphaned foreign keys with one set-based query per key ('findOrphans').
+
+	The populate functions commit as they load, so the check cannot keep orphaned rows from being committed: it reports
+	them afterwards, and 'deleteOrphans' removes them in the same session.
+
+		with tdi.bulkLoad(["Somatic_Mutations", "DEGs"]) as report:
+			tdi.populateSMTable("sm.txt", "\t")
+			tdi.bulkPopulateDEGTable("deg.txt", "\t")
+		print report['orphans']
+
+	@param tables (optional): tables that will be loaded. Default is every table of 'FOREIGN_KEYS'.
+	@param dropIndexes (optional): drop and rebuild the secondary indexes of 'tables'
+	@param verify (optional): check the foreign keys of 'tables' once they are loaded
+	@param deleteOrphans (optional): delete the rows whose foreign keys have no referenced row once they are loaded
+	@return context manager yielding a report dictionary, filled in when the session ends:
+		'indexes': table -> names of the rebuilt indexes
+		'orphans': 'table.column' -> {'count': orphaned rows, 'samples': some orphaned IDs}, as returned by 'findOrphans'
+		'deleted': number of orphaned rows deleted
+	"""
+	@contextmanager
+	def bulkLoad(self, tables = None, dropIndexes = True, verify = True, deleteOrphans = False):
+		if tables is None:
+			tables = sorted(self.FOREIGN_KEYS)
+		report = {'indexes': {}, 'orphans': {}, 'deleted': 0}
+
+		uniqueChecks = len([x for x in tables if x in self.UNIQUE_KEYS]) > 0
+		with self.backend.bulkLoadSettings(self.db, uniqueChecks):
+			dropped = {}
+			if dropIndexes:
+				for table in tables:
+					dropped[table] = []
+					for name, columns in self.backend.secondaryIndexes(self.db, table):
+						try:
+							self.backend.dropIndex(self.db, table, name)
+							dropped[table].append((name, columns))
+						except:
+							print "Keeping index %s on %s, which could not be dropped." %(name, table)
+				self.db.commit()
+
+			try:
+				yield report
+			finally:
+				self.db.commit()
+				self.patientProfiles = OrderedDict()
+				for table in tables:
+					if len(dropped.get(table, [])) > 0:
+						self.backend.createIndexes(self.db, table, dropped[table])
+						report['indexes'][table] = [x[0] for x in dropped[table]]
+
+				if verify:
+					report['orphans'] = self.findOrphans(tables)
+					for key in sorted(report['orphans']):
+						print "Warning: %s rows of %s reference missing IDs (e.g. %s)." %(report['orphans'][key]['count'], key,
+																							  ", ".join(str(x) for x in report['orphans'][key]['samples']))
+					if deleteOrphans and len(report['orphans']) > 0:
+						report['deleted'] = self.deleteOrphans(tables)
+				self.db.commit()
+
+	"""
+	Finds rows whose foreign keys reference IDs missing from the referenced table (patients, genes, platforms, ...),
+	with one anti-join per foreign key of 'FOREIGN_KEYS'. NULL keys are not orphans.
+
+	@param tables (optional): tables to check. Default is every table of 'FOREIGN_KEYS'.
+	@param sampleSize (optional): number of orphaned IDs reported per foreign key
+	@return dictionary 'table.column' -> {'count': number of orphaned rows, 'samples': list of orphaned IDs},
+			with only the foreign keys that have orphans
+	"""
+	def findOrphans(self, tables = None, sampleSize = 10):
+		cursor = self.db.cursor()
+		orphans = {}
+		for table in (tables if tables is not None else sorted(self.FOREIGN_KEYS)):
+			for column, parent, parentColumn in self.FOREIGN_KEYS.get(table, []):
+				query = "SELECT child.%s, COUNT(*)\
+						 FROM %s child LEFT JOIN %s parent ON parent.%s = child.%s\
+						 WHERE child.%s IS NOT NULL AND parent.%s IS NULL\
+						 GROUP BY child.%s" %(column, table, parent, parentColumn, column, column, parentColumn, column)
+				try:
+					cursor.execute(query)
+					results = cursor.fetchall()
+				except:
+					print "Error checking foreign key %s.%s." %(table, column)
+					print query
+					continue
+				if len(results) > 0:
+					orphans["%s.%s" %(table, column)] = {'count': sum(int(x[1]) for x in results),
+														  'samples': sorted(x[0] for x in results)[:sampleSize]}
+		return orphans
+
+	"""
+	Deletes the rows whose foreign keys reference missing IDs (see 'findOrphans').
+
+	@param tables (optional): tables to clean. Default is every table of 'FOREIGN_KEYS'.
+	@return number of rows deleted
+	"""
+	def deleteOrphans(self, tables = None):
 		cursor = self.db.cursor()
+		self.patientProfiles = OrderedDict()
+		numDeleted = 0
+		for table in (tables if tables is not None else sorted(self.FOREIGN_KEYS)):
+			for column, parent, parentColumn in self.FOREIGN_KEYS.get(table, []):
+				sqlDelete = "DELETE FROM %s\
+							 WHERE %s IS NOT NULL AND %s NOT IN (SELECT %s FROM %s)" %(table, column, column, parentColumn, parent)
+				try:
+					cursor.execute(sqlDelete)
+					numDeleted += max(cursor.rowcount, 0)
+					self.db.commit()
+				except:
+					print "Error deleting orphaned rows of %s.%s." %(table, column)
+					self.db.rollback()
+		return numDeleted
+
+	def populateCancerTypeTable(self, inputFile, delimiter, validate = False):
+		if validate:
+			return self.validateInputFile('cancer_type', inputFile, delimiter)
+
+		self.dimensionMaps = None
 		cancerTypeInput = open(inputFile, "r")
 		#read header
 		header = cancerTypeInput.readline()
 		header = header.strip().split(delimiter)
 		isString = [1, 1]
+		sql = "INSERT INTO Cancer_Types(\
+				cancer_type_id, %s, %s)\
+				VALUES(NULL, %%s, %%s)" %(header[0], header[1])
 		for line in cancerTypeInput:
 			dataFields = line.strip().split(delimiter)
-			valLine = self.processValues(dataFields, isString)
-			sql = "INSERT INTO Cancer_Types(\
-					cancer_type_id, %s, %s)\
-					VALUES(%s)" %(header[0], header[1], valLine)
+			params = self.processParams(dataFields, isString)
 
 			try:
-				cursor.execute(sql)
+				self.executeStatement(sql, params)
 				self.db.commit()
 			except:
 				print "Error trying to input data %s, %s into cancer type table. Please check these values again." %(dataFields[0], dataFields[1])
 				self.db.rollback()
 
-	def populateGeneTable(self, inputFile, delimiter):
-		cursor = self.db.cursor()
+	def populateGeneTable(self, inputFile, delimiter, validate = False):
+		if validate:
+			return self.validateInputFile('gene', inputFile, delimiter)
+
+		self.dimensionMaps = None
+		self.geneNameArray = None
 		geneTableInput = open(inputFile, "r")
 		#read header line
 		header = geneTableInput.readline()
 		header = header.strip().split(delimiter)
 		isString = [1, 1, 1, 0, 0, 1]
+
+		#form the sql statement once from the header; each line only binds its values
+		sql = "INSERT IGNORE INTO Genes(\
+				gene_id, %s, %s, %s,\
+				%s, %s, %s)\
+				VALUES(NULL, %s)" %(header[0], header[1], header[2], header[3], header[4], header[5], self.placeholderString(6))
+
 		for line in geneTableInput:
 			dataFields = line.strip().split(delimiter)
-			valLine = self.processValues(dataFields, isString)
+			params = self.processParams(dataFields, isString)
 
 			# existQuery = "SELECT *\
 			# 			  FROM Genes\
-			# 			  WHERE gene_name = '%s'" %(dataFields[0])
-			# if(self.exists(cursor, existQuery)):
+			# 			  WHERE gene_name = %s"
+			# if(self.exists(cursor, existQuery, [dataFields[0]])):
 			# 	continue
 
-			#form the sql query by parsing a line from the input file
-			sql = "INSERT IGNORE INTO Genes(\
-					gene_id, %s, %s, %s,\
-					%s, %s, %s)\
-					VALUES(%s)" %(header[0], header[1], header[2], header[3], header[4], header[5], valLine)
-
 			try:
-				cursor.execute(sql)
+				self.executeStatement(sql, params)
 				self.db.commit()
 			except:
 				print "Error trying to input gene into table."
 				print sql
+				print params
 				self.db.rollback()
 				sys.exit()
 
-	def populateExpPlatformTable(self, inputFile, delimiter):
-		cursor = self.db.cursor()
+	def populateExpPlatformTable(self, inputFile, delimiter, validate = False):
+		if validate:
+			return self.validateInputFile('platform', inputFile, delimiter)
+
+		self.dimensionMaps = None
 		platformInput = open(inputFile, "r")
 
 		#read header line
@@ -174,17 +412,17 @@ class TDISQL:
 		header = header.strip().split(delimiter)
 		isString = [1, 1]
 
+		#form the sql statement from the header
+		sql = "INSERT INTO Exp_Platforms(\
+				platform_id, %s, %s)\
+				VALUES(NULL, %%s, %%s)" %(header[0], header[1])
+
 		for line in platformInput:
 			dataFields = line.strip().split(delimiter)
-			valLine = self.processValues(dataFields, isString)
-
-			#form the sql query by parsing a line from the input file
-			sql = "INSERT INTO Exp_Platforms(\
-					platform_id, %s, %s)\
-					VALUES(%s)" %(header[0], header[1], valLine)
+			params = self.processParams(dataFields, isString)
 
 			try:
-				cursor.execute(sql)
+				self.executeStatement(sql, params)
 				self.db.commit()
 			except:
 				print "Error trying to input Exp_Platform into table."
@@ -203,21 +441,23 @@ class TDISQL:
 		exp_date: String of the date the experiment was done (format: "yyyy-mm-dd")
 	"""
 	def populateExperimentTable(self, model, description, parameter_set, name, exp_date):
-		cursor = self.db.cursor()
-
 		sqlInsert = "INSERT INTO Experiments\
-					 VALUES(NULL, \"%s\", \"%s\", \"%s\", \"%s\", \"%s\")" %(model, description, parameter_set, name, exp_date)
+					 VALUES(NULL, %s, %s, %s, %s, %s)"
+		params = [model, description, parameter_set, name, exp_date]
 
 		try:
-			cursor.execute(sqlInsert)
+			self.executeStatement(sqlInsert, params)
 			self.db.commit()
 		except:
 			print "Error trying to insert into 'Experiments' table. Please check arguments again."
-			print sqlInsert
+			print params
 			self.db.rollback()
 
-	def populateSGAUnitGroupTable(self, inputFile, delimiter):
-		cursor = self.db.cursor()
+	def populateSGAUnitGroupTable(self, inputFile, delimiter, validate = False):
+		if validate:
+			return self.validateInputFile('sga_unit_group', inputFile, delimiter)
+
+		self.dimensionMaps = None
 		groupInput = open(inputFile, "r")
 
 		#read header line
@@ -226,45 +466,47 @@ class TDISQL:
 		header[1] = "cancer_type_id"
 		isString = [1, 0, 1, 1]
 
+		#this database has a foreign key for the cancer_type_id, we need to find the corresponding ID given the cancer name
+		sqlQuery = "SELECT cancer_type_id\
+					FROM Cancer_Types\
+					WHERE abbv = %s"
+
+		#form the sql insert
+		sqlInsert = "INSERT INTO SGA_Unit_Group(\
+					group_id, %s, %s, %s, %s)\
+					VALUES(NULL, %s)" %(header[0], header[1], header[2], header[3], self.placeholderString(4))
+
 		for line in groupInput:
 			dataFields = line.strip().split(delimiter)
 
-			#this database has a foreign key for the cancer_type_id, we need to find the corresponding ID given the cancer name
-			sqlQuery = "SELECT cancer_type_id\
-						FROM Cancer_Types\
-						WHERE abbv = '%s'" %(dataFields[1])
 			try:
-				cursor.execute(sqlQuery)
-				results = cursor.fetchall()
+				results = self.executeStatement(sqlQuery, [dataFields[1]]).fetchall()
 				if len(results) > 1:
 					print "Found multiple rows with cancer name %s. Skipping." %(dataFields[1])
 					continue
 				#if corresponding ID was sucessfully found, replace the cancer_name in the input with the cancer_id
 				dataFields[1] = results[0][0]
 			except:
-				print "Error: unable to fetch data."
-				print sqlQuery
+				print "Error: unable to fetch data for cancer type %s." %(dataFields[1])
 				continue
 
-			#convert the values into proper SQL syntax
-			valLine = self.processValues(dataFields, isString)
-
-			#form the sql query
-			sqlInsert = "INSERT INTO SGA_Unit_Group(\
-						group_id, %s, %s, %s, %s)\
-						VALUES(%s)" %(header[0], header[1], header[2], header[3], valLine)
-			#print sqlInsert
+			#convert the values into statement parameters
+			params = self.processParams(dataFields, isString)
 
 			try:
-				cursor.execute(sqlInsert)
+				self.executeStatement(sqlInsert, params)
 				self.db.commit()
 			except:
 				print "Error trying to input SGA unit/group into table."
 				self.db.rollback()	
 				#sys.exit()
 
-	def populatePatientTable(self, inputFile, delimiter):
-		cursor = self.db.cursor()
+	def populatePatientTable(self, inputFile, delimiter, validate = False):
+		if validate:
+			return self.validateInputFile('patient', inputFile, delimiter)
+
+		self.dimensionMaps = None
+		self.patientProfiles = OrderedDict()
 		patientInput = open(inputFile, "r")
 
 		#read header
@@ -273,44 +515,53 @@ class TDISQL:
 		header[6] = "cancer_type_id" #cancer_name needs to be corresponding ID in our table (foreign key)
 		isString = [1, 1, 1, 1, 1, 1, 0]
 
+		#this database has a foreign key for the cancer_type_id, we need to find the corresponding ID given the cancer name
+		sqlQuery = "SELECT cancer_type_id\
+					FROM Cancer_Types\
+					WHERE abbv = %s"
+
+		#form the sql insert
+		sqlInsert = "INSERT INTO Patients(\
+					patient_id, %s, %s, %s, %s, %s, %s, %s)\
+					VALUES(NULL, %s)" %(header[0], header[1], header[2], header[3], header[4], header[5], header[6], self.placeholderString(7))
+
 		for line in patientInput:
 			dataFields = line.strip().split(delimiter)
 
-			#this database has a foreign key for the cancer_type_id, we need to find the corresponding ID given the cancer name
-			sqlQuery = "SELECT cancer_type_id\
-						FROM Cancer_Types\
-						WHERE abbv = '%s'" %(dataFields[6])
 			try:
-				cursor.execute(sqlQuery)
-				results = cursor.fetchall()
+				results = self.executeStatement(sqlQuery, [dataFields[6]]).fetchall()
 				if len(results) > 1:
 					print "Found multiple rows with cancer name %s. Skipping." %(dataFields[6])
 					continue
 				#if corresponding ID was sucessfully found, replace the cancer_name in the input with the cancer_id
 				dataFields[6] = results[0][0]
 			except:
-				print "Error: unable to fetch data."
-				print sqlQuery
+				print "Error: unable to fetch data for cancer type %s." %(dataFields[6])
 				continue
 
-			#convert the values into proper SQL syntax
-			valLine = self.processValues(dataFields, isString)
+			#convert the values into statement parameters
+			params = self.processParams(dataFields, isString)
 
-			#form the sql query
-			sqlInsert = "INSERT INTO Patients(\
-						patient_id, %s, %s, %s, %s, %s, %s, %s)\
-						VALUES(%s)" %(header[0], header[1], header[2], header[3], header[4], header[5], header[6], valLine)
 			try:
-				cursor.execute(sqlInsert)
+				self.executeStatement(sqlInsert, params)
 				self.db.commit()
 			except:
 				print "Error trying to input patient into table."
-				print sqlInsert
-				self.db.rollback()	
+				print params
+				self.db.rollback()
 				sys.exit()
 
-	def populateSMTable(self, inputFile, delimiter):
-		cursor = self.db.cursor()
+	"""
+	Loads somatic mutations, then rebuilds the position table SM_Positions (see 'rebuildPositionTable').
+
+	@param rebuildPositions (optional): rebuild SM_Positions after loading. Pass False when loading several files and
+										call 'rebuildPositionTable' once after the last one.
+	"""
+	def populateSMTable(self, inputFile, delimiter, validate = False, rebuildPositions = True):
+		if validate:
+			return self.validateInputFile('sm', inputFile, delimiter)
+
+		self.patientProfiles = OrderedDict()
 		smInput = open(inputFile, "r")
 
 		#read header
@@ -320,6 +571,18 @@ class TDISQL:
 		header[1] = "gene_id"
 		isString = [0, 0, 1, 1, 1, 0, 0, 2, 1, 1]
 
+		patientQuery = "SELECT patient_id\
+						FROM Patients\
+						WHERE name = %s"
+		geneQuery = "SELECT gene_id\
+					 FROM Genes\
+					 WHERE gene_name = %s"
+
+		#the amino acid code column expands into aa_loc, aa_norm and aa_mut
+		sqlInsert = "INSERT INTO Somatic_Mutations(\
+					sm_id, %s, %s, %s, %s, %s, %s, %s, aa_loc, aa_norm, aa_mut, %s, %s)\
+					VALUES(NULL, %s)" %(header[0], header[1], header[2], header[3], header[4], header[5], header[6], header[8], header[9], self.placeholderString(12))
+
 		for line in smInput:
 			dataFields = line.strip().split(delimiter)
 
@@ -328,57 +591,161 @@ class TDISQL:
 				continue
 
 			#query for patient id
-			sqlQuery = "SELECT patient_id\
-						FROM Patients\
-						WHERE name = '%s'" %(dataFields[0])
 			try:
-				cursor.execute(sqlQuery)
-				results = cursor.fetchall()
+				results = self.executeStatement(patientQuery, [dataFields[0]]).fetchall()
 				if len(results) > 1:
 					print "Retrieved more than one entry for patient %s. Skip." %(dataFields[0])
 					continue
 				dataFields[0] = results[0][0]
 			except:
-				print "Error: unable to fetch patient data."
-				print sqlQuery
+				print "Error: unable to fetch patient data for %s." %(dataFields[0])
 				#sys.exit()
 				continue
 
 			#query for gene id
-			sqlQuery = "SELECT gene_id\
-						FROM Genes\
-						WHERE gene_name = '%s'" %(dataFields[1])
 			try:
-				cursor.execute(sqlQuery)
-				results = cursor.fetchall()
+				results = self.executeStatement(geneQuery, [dataFields[1]]).fetchall()
 				if len(results) > 1:
 					print "Found more than one result for gene %s. Skip." %(dataFields[1])
 					continue
 				dataFields[1] = results[0][0]
 			except:
-				print "Error. Unable to fetch gene data."
-				print sqlQuery
+				print "Error. Unable to fetch gene data for %s." %(dataFields[1])
 				#sys.exit()
 				continue
 
-			#process the rest of the line using 'processValues'
-			valLine = self.processValues(dataFields, isString)
-			
-			sqlInsert = "INSERT INTO Somatic_Mutations(\
-						sm_id, %s, %s, %s, %s, %s, %s, %s, aa_loc, aa_norm, aa_mut, %s, %s)\
-						VALUES(%s)" %(header[0], header[1], header[2], header[3], header[4], header[5], header[6], header[8], header[9], valLine)
+			#process the rest of the line using 'processParams'
+			params = self.processParams(dataFields, isString)
+
 			try:
-				cursor.execute(sqlInsert)
+				self.executeStatement(sqlInsert, params)
 				self.db.commit()
 			except:
 				print "Error trying to insert SM."
-				print sqlInsert
+				print params
 				self.db.rollback()
 				sys.exit()  
 
+		if rebuildPositions:
+			self.rebuildPositionTable()
+
+	"""
+	Rebuilds the SM_Positions table from Somatic_Mutations: one row per (gene, amino acid location, mutation type)
+	with the number of distinct tumors mutated there and a bitmap of their patient IDs (see 'encodePatientBitmap').
+	'populateSMTable' calls it after loading, so that location queries are primary key lookups instead of scans of
+	every mutation of the gene. Mutations without a type are stored with an empty mut_type.
+
+	@param batchSize (optional): number of rows inserted per batch
+	@return number of positions written
+	"""
+	def rebuildPositionTable(self, batchSize = 10000):
+		import numpy as np
+
+		streamCursor = self.backend.streamingCursor(self.db)
+		mutTypes = {}
+		columns = [[], [], [], []]
+		query = "SELECT gene_id, aa_loc, mut_type, patient_id\
+				 FROM Somatic_Mutations\
+				 WHERE gene_id IS NOT NULL AND aa_loc IS NOT NULL AND patient_id IS NOT NULL"
+		try:
+			streamCursor.execute(query)
+			while True:
+				rows = streamCursor.fetchmany(100000)
+				if not rows:
+					break
+				genes, locs, types, patients = zip(*rows)
+				columns[0] += genes
+				columns[1] += locs
+				columns[2] += [mutTypes.setdefault(x or "", len(mutTypes)) for x in types]
+				columns[3] += patients
+		except:
+			print "Error reading somatic mutations to rebuild SM_Positions."
+			print query
+			return
+		finally:
+			streamCursor.close()
+
+		genes, locs, types, patients = [np.array(x, dtype=np.int64) for x in columns]
+		typeNames = sorted(mutTypes, key=mutTypes.get)
+
+		#sort by position and patient, then drop repeated (position, patient) pairs
+		order = np.lexsort((patients, types, locs, genes))
+		genes, locs, types, patients = genes[order], locs[order], types[order], patients[order]
+		newPosition = np.ones(len(genes), dtype=bool)
+		newPosition[1:] = (genes[1:] != genes[:-1]) | (locs[1:] != locs[:-1]) | (types[1:] != types[:-1])
+		keep = newPosition.copy()
+		keep[1:] |= patients[1:] != patients[:-1]
+		genes, locs, types, patients, newPosition = genes[keep], locs[keep], types[keep], patients[keep], newPosition[keep]
+
+		starts = np.flatnonzero(newPosition)
+		ends = np.append(starts[1:], len(genes))
+		rows = []
+		for start, end in zip(starts.tolist(), ends.tolist()):
+			offset, bitmap = encodePatientBitmap(patients[start:end])
+			rows.append((int(genes[start]), int(locs[start]), typeNames[types[start]], end - start, offset, bitmap))
+
+		cursor = self.db.cursor()
+		try:
+			cursor.execute("DELETE FROM SM_Positions")
+		except:
+			print "Error clearing SM_Positions. Please create the table with the statement in MakeTDITables.sql."
+			self.db.rollback()
+			return
+		sqlInsert = "INSERT INTO SM_Positions(gene_id, aa_loc, mut_type, num_tumors, bitmap_offset, patient_bitmap)\
+					 VALUES(%s, %s, %s, %s, %s, %s)"
+		numInserted = self.executeBatches(sqlInsert, rows, batchSize, "SM_Positions")
+		self.db.commit()
+		return numInserted
+
+	"""
+	Returns the tumors mutated at an amino acid location of a gene, read from SM_Positions with a primary key lookup.
+
+	@param geneID: gene ID
+	@param aaLoc: amino acid location
+	@param mutType (optional): only count this mutation type (e.g. 'nonsynonymous SNV'). Default is every type.
+	@return sorted list of patient IDs
+	"""
+	def getTumorsAtPosition(self, geneID, aaLoc, mutType = None):
+		query = "SELECT bitmap_offset, patient_bitmap\
+				 FROM SM_Positions\
+				 WHERE gene_id = %s AND aa_loc = %s"
+		params = [geneID, aaLoc]
+		if mutType is not None:
+			query += " AND mut_type = %s"
+			params.append(mutType)
+
+		patients = set()
+		for offset, bitmap in self.executeStatement(query, params).fetchall():
+			patients.update(decodePatientBitmap(offset, bitmap))
+		return sorted(patients)
+
+	"""
+	Tumors with gtGene called as a driver in TDI_Results that are mutated in gtGene at 'aaLoc'. The mutated tumors
+	come from SM_Positions, so only they are probed in the (gt_gene_id, patient_id) index of TDI_Results.
+
+	@return sorted list of patient IDs
+	"""
+	def getDriverTumorsAtLocation(self, geneID, aaLoc, cohort = None):
+		mutatedTumors = self.getTumorsAtPosition(geneID, aaLoc)
+		if len(mutatedTumors) == 0:
+			return []
 
-	def populateSCNATable(self, inputFile, delimiter):
 		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
+		driverTumors = []
+		for chunk in self.chunkList(mutatedTumors, self.BATCH_SIZE):
+			query = "SELECT DISTINCT(patient_id)\
+					 FROM TDI_Results\
+					 WHERE gt_gene_id = %%s AND patient_id IN (%s)%s" %(self.placeholderString(len(chunk)), cohortSQL)
+			cursor.execute(query, [geneID] + chunk + cohortParams)
+			driverTumors += [int(x[0]) for x in cursor.fetchall()]
+		return sorted(driverTumors)
+
+	def populateSCNATable(self, inputFile, delimiter, validate = False):
+		if validate:
+			return self.validateInputFile('scna', inputFile, delimiter)
+
+		self.patientProfiles = OrderedDict()
 		scnaInput = open(inputFile, "r")
 
 		#read header line
@@ -389,34 +756,38 @@ class TDISQL:
 		header[4] = "platform_id"
 		isString = [0, 0, 1, 0, 0]
 
+		patientQuery = "SELECT patient_id\
+						FROM Patients\
+						WHERE name = %s"
+		geneQuery = "SELECT gene_id\
+					 FROM Genes\
+					 WHERE gene_name = %s"
+		platformQuery = "SELECT platform_id\
+						 FROM Exp_Platforms\
+						 WHERE platform = %s"
+		sqlInsert = "INSERT INTO SCNAs\
+					(scna_id, %s, %s, %s, %s, %s)\
+					VALUES(NULL, %s)" %(header[0], header[1], header[2], header[3], header[4], self.placeholderString(5))
+
 		for line in scnaInput:
 			dataFields = line.strip().split(delimiter)
 
 			#query for the foreign keys
 			if dataFields[0] != "null" and dataFields[0] != "NULL":
-				sqlQuery = "SELECT patient_id\
-							FROM Patients\
-							WHERE name = '%s'" %(dataFields[0])
 				try:
-					cursor.execute(sqlQuery)
-					results = cursor.fetchall()
+					results = self.executeStatement(patientQuery, [dataFields[0]]).fetchall()
 					if len(results) > 1:
 						print "Retrieved more than one entry for patient %s. Skip." %(dataFields[0])
 						continue
 					dataFields[0] = results[0][0]
 				except:
-					print "Error: unable to fetch patient data."
-					print sqlQuery
+					print "Error: unable to fetch patient data for %s." %(dataFields[0])
 					#sys.exit()
 					continue
 
 			if dataFields[1] != "null" and dataFields[1] != "NULL":
-				sqlQuery = "SELECT gene_id\
-							FROM Genes\
-							WHERE gene_name = '%s'" %(dataFields[1])
 				try:
-					cursor.execute(sqlQuery)
-					results = cursor.fetchall()
+					results = self.executeStatement(geneQuery, [dataFields[1]]).fetchall()
 					if len(results) > 1:
 						print "Retrieved more than one entry for gene %s. Skip." %(dataFields[1])
 						continue
@@ -424,16 +795,11 @@ class TDISQL:
 					dataFields[1] = results[0][0]
 				except:
 					print "Error: unable to fetch gene id."
-					#print sqlQuery
 					continue
 
 			if dataFields[4] != "null" and dataFields[4] != "NULL":
-				sqlQuery = "SELECT platform_id\
-							FROM Exp_Platforms\
-							WHERE platform = '%s'" %(dataFields[4])
 				try:
-					cursor.execute(sqlQuery)
-					results = cursor.fetchall()
+					results = self.executeStatement(platformQuery, [dataFields[4]]).fetchall()
 					if len(results) > 1:
 						print "Retrieved more than one entry for platform %s. Skip." %(dataFields[4])
 						continue
@@ -442,21 +808,21 @@ class TDISQL:
 					print "Error: unable to fetch exp_platform_id."
 					continue
 
-			valLine = self.processValues(dataFields, isString)
-			sqlInsert = "INSERT INTO SCNAs\
-						(scna_id, %s, %s, %s, %s, %s)\
-						VALUES(%s)" %(header[0], header[1], header[2], header[3], header[4], valLine)
+			params = self.processParams(dataFields, isString)
 			try:
-				cursor.execute(sqlInsert)
+				self.executeStatement(sqlInsert, params)
 				self.db.commit()
 			except:
 				print "Error trying to insert scna."
-				print sqlInsert
+				print params
 				self.db.rollback()
 				sys.exit()
 
-	def populateDEGTable(self, inputFile, delimiter):
-		cursor = self.db.cursor()
+	def populateDEGTable(self, inputFile, delimiter, validate = False):
+		if validate:
+			return self.validateInputFile('deg', inputFile, delimiter)
+
+		self.patientProfiles = OrderedDict()
 		degInput = open(inputFile, "r")
 
 		#read header
@@ -467,77 +833,75 @@ class TDISQL:
 		header[3] = "platform_id"
 		isString = [0, 0, 1, 0, 1]
 
+		patientQuery = "SELECT patient_id\
+						FROM Patients\
+						WHERE name = %s"
+		geneQuery = "SELECT gene_id\
+					 FROM Genes\
+					 WHERE gene_name = %s"
+		platformQuery = "SELECT platform_id\
+						 FROM Exp_Platforms\
+						 WHERE platform = %s"
+		sqlInsert = "INSERT INTO DEGs(\
+					deg_id, %s, %s, %s, %s, %s)\
+					VALUES(NULL, %s)" %(header[0], header[1], header[2], header[3], header[4], self.placeholderString(5))
+
 		for line in degInput:
 			dataFields = line.strip().split(delimiter)
 
 			#query to find patient id
-			patientQuery = "SELECT patient_id\
-							FROM Patients\
-							WHERE name = '%s'" %(dataFields[0])
 			try:
-				cursor.execute(patientQuery)
-				results = cursor.fetchall()
+				results = self.executeStatement(patientQuery, [dataFields[0]]).fetchall()
 				if len(results) > 1:
 					print "Retrieved more than one entry for patient %s. Skip." %(dataFields[0])
 					continue
 				dataFields[0] = results[0][0]
 			except:
-				print "Error: unable to fetch patient_id."
-				print patientQuery
+				print "Error: unable to fetch patient_id for %s." %(dataFields[0])
 				continue
 				#sys.exit()
 
 			#query to find gene_id
-			geneQuery = "SELECT gene_id\
-						FROM Genes\
-						WHERE gene_name = '%s'" %(dataFields[1])
 			try:
-				cursor.execute(geneQuery)
-				results = cursor.fetchall()
+				results = self.executeStatement(geneQuery, [dataFields[1]]).fetchall()
 				if len(results) > 1:
 					print "Retrieved more than one entry for gene %s. Skip." %(dataFields[1])
 					continue
 				dataFields[1] = results[0][0]
 			except:
-				print "Error: unable to fetch gene_id."
-				print geneQuery
+				print "Error: unable to fetch gene_id for %s." %(dataFields[1])
 				continue
 				#sys.exit()
 
 			#query to find platform_id (given not null)
 			if dataFields[3] != "null" and dataFields[3] != "Null":
-				platformQuery = "SELECT platform_id\
-								 FROM Exp_Platforms\
-								 WHERE platform = '%s'" %(dataFields[3])
-			 	try:
-			 		cursor.execute(platformQuery)
-			 		results = cursor.fetchall()
-			 		if len(results) > 1:
-			 			print "Retrieved more than one entry for platform %s. Skip." %(dataFields[3])
-			 			continue
-		 			dataFields[3] = results[0][0]
-	 			except:
-	 				print "Error: unable to fetch platform_id."
-	 				print platformQuery
-	 				continue
-	 				#sys.exit()
-
-			valLine = self.processValues(dataFields, isString)
-
-			sqlInsert = "INSERT INTO DEGs(\
-						deg_id, %s, %s, %s, %s, %s)\
-						VALUES(%s)" %(header[0], header[1], header[2], header[3], header[4], valLine)
+				try:
+					results = self.executeStatement(platformQuery, [dataFields[3]]).fetchall()
+					if len(results) > 1:
+						print "Retrieved more than one entry for platform %s. Skip." %(dataFields[3])
+						continue
+					dataFields[3] = results[0][0]
+				except:
+					print "Error: unable to fetch platform_id for %s." %(dataFields[3])
+					continue
+					#sys.exit()
+
+			params = self.processParams(dataFields, isString)
+
 			try:
-				cursor.execute(sqlInsert)
+				self.executeStatement(sqlInsert, params)
 				self.db.commit()
 			except:
 				print "Error trying to insert DEG."
-				print sqlInsert
+				print params
 				self.db.rollback()
 				sys.exit()
 
-	def populateTDIResults(self, inputFile, delimiter):
-		cursor = self.db.cursor()
+	def populateTDIResults(self, inputFile, delimiter, validate = False):
+		if validate:
+			return self.validateInputFile('tdi', inputFile, delimiter)
+
+		self.patientProfiles = OrderedDict()
 		tdiFile = open(inputFile, "r")
 
 		header = tdiFile.readline()
@@ -549,23 +913,36 @@ class TDISQL:
 		isString = [0, 0, 0, 0, 1]
 		gene_or_group_flag = 0 #0 if gene, 1 if group
 
+		patientQuery = "SELECT patient_id\
+						FROM Patients\
+						WHERE name = %s"
+		geneQuery = "SELECT gene_id\
+					 FROM Genes\
+					 WHERE gene_name = %s"
+		groupQuery = "SELECT group_id\
+					  FROM SGA_Unit_Group\
+					  WHERE name = %s"
+
+		#one insert per kind of driver column
+		geneInsert = "INSERT INTO TDI_Results(\
+					  tdi_id, %s, %s, %s, %s, %s)\
+					  VALUES(NULL, %s)" %(header[0], "gt_gene_id", header[2], header[3], header[4], self.placeholderString(5))
+		groupInsert = "INSERT INTO TDI_Results(\
+					   tdi_id, %s, %s, %s, %s, %s)\
+					   VALUES(NULL, %s)" %(header[0], "gt_unit_group_id", header[2], header[3], header[4], self.placeholderString(5))
+
 		for line in tdiFile:
 			dataFields = line.strip().split(delimiter)
 
 			#query for patient id
-			patientQuery = "SELECT patient_id\
-							FROM Patients\
-							WHERE name = '%s'" %(dataFields[0])
 			try:
-				cursor.execute(patientQuery)
-				results = cursor.fetchall()
+				results = self.executeStatement(patientQuery, [dataFields[0]]).fetchall()
 				if len(results) > 1:
 					print "Retrieved more than one entry for patient %s. Skip." %(dataFields[0])
 					continue
 				dataFields[0] = results[0][0]
 			except:
-				print "Error: unable to fetch patient_id."
-				print patientQuery
+				print "Error: unable to fetch patient_id for %s." %(dataFields[0])
 				continue
 				#sys.exit()
 
@@ -574,54 +951,39 @@ class TDISQL:
 				gene_or_group_flag = 0
 
 				#query for gt gene id
-				gtQuery = "SELECT gene_id\
-						   	FROM Genes\
-						   	WHERE gene_name = '%s'" %(dataFields[1])
 				try:
-					cursor.execute(gtQuery)
-					results = cursor.fetchall()
+					results = self.executeStatement(geneQuery, [dataFields[1]]).fetchall()
 					if len(results) > 1:
 						print "Retrieved more than one entry for GT %s. Skip." %(dataFields[1])
 						continue
 					dataFields[1] = results[0][0]
 				except:
-					print "Error: unable to fetch GT id."
-					print gtQuery
+					print "Error: unable to fetch GT id for %s." %(dataFields[1])
 					continue
 					#sys.exit()
 			else:
 				gene_or_group_flag = 1
 
-				gtQuery = "SELECT group_id\
-						   FROM SGA_Unit_Group\
-						   WHERE name = '%s'" %(dataFields[1])
 				try:
-					cursor.execute(gtQuery)
-					results = cursor.fetchall()
+					results = self.executeStatement(groupQuery, [dataFields[1]]).fetchall()
 					if len(results) > 1:
 						print "Retrieved more than one entry for GT %s. Skip." %(dataFields[1])
 						continue
 					dataFields[1] = results[0][0]
 				except:
-					print "Error: unable to fetch group id."
-					print gtQuery
+					print "Error: unable to fetch group id for %s." %(dataFields[1])
 					continue
 					#sys.exit()
 
 			#query for the ge gene id
-			geQuery = "SELECT gene_id\
-						FROM Genes\
-						WHERE gene_name = '%s'" %(dataFields[2])
 			try:
-				cursor.execute(geQuery)
-				results = cursor.fetchall()
+				results = self.executeStatement(geneQuery, [dataFields[2]]).fetchall()
 				if len(results) > 1:
 					print "Retrieved more than one entry for GE %s. Skip." %(dataFields[1])
 					continue
 				dataFields[2] = results[0][0]
 			except:
-				print "Error: unable to fetch GE id."
-				print geQuery
+				print "Error: unable to fetch GE id for %s." %(dataFields[2])
 				continue
 				#sys.exit()
 
@@ -629,54 +991,520 @@ class TDISQL:
 			# if dataFields[4] != "null" and dataFields[4] != "Null":
 			# 	expQuery = "SELECT exp_id\
 			# 				FROM Experiments\
-			# 				WHERE name = '%s'" %(dataFields[4])
+			# 				WHERE name = %s"
 			# 	try:
-			# 		cursor.execute(expQuery)
-			# 		results = cursor.fetchall()
+			# 		results = self.executeStatement(expQuery, [dataFields[4]]).fetchall()
 			# 		if len(results) > 1:
 			# 			print "Retrieved more than one entry for experiment %s. Skip." %(dataFields[4])
 			# 			continue
 			# 		dataFields[4] = results[0][0]
 			# 	except:
 			# 		print "Error: unable to fetch experiment id."
-			# 		print expQuery
 			# 		continue
-			dataFields[4] = "1"
-
-			valLine = self.processValues(dataFields, isString)
+			dataFields[4] = 1
 
+			params = self.processParams(dataFields, isString)
 
 			#insert entry into TDI table
 			if gene_or_group_flag == 0:
-				sqlInsert = "INSERT INTO TDI_Results(\
-							 tdi_id, %s, %s, %s, %s, %s)\
-							 VALUES(%s)" %(header[0], "gt_gene_id", header[2], header[3], header[4], valLine)
+				sqlInsert = geneInsert
 			else:
-				sqlInsert = "INSERT INTO TDI_Results(\
-							 tdi_id, %s, %s, %s, %s, %s)\
-							 VALUES(%s)" %(header[0], "gt_unit_group_id", header[2], header[3], header[4], valLine)
+				sqlInsert = groupInsert
 			try:
-				cursor.execute(sqlInsert)
+				self.executeStatement(sqlInsert, params)
 				self.db.commit()
 			except:
 				print "Error: unable to insert TDI entry."
-				print sqlInsert
+				print params
 				self.db.rollback()
 				sys.exit()
 
+	"""
+	Reads a whole dimension table into a dictionary mapping names to IDs with one query, so that loaders can
+	resolve foreign keys without a SELECT per input line.
+
+	@param table: name of the table (e.g. "Patients")
+	@param nameColumn: column holding the name (e.g. "name")
+	@param idColumn: column holding the ID (e.g. "patient_id")
+	@return dictionary where keys are names and values are IDs
+	"""
+	def getNameToIDMap(self, table, nameColumn, idColumn):
+		cursor = self.db.cursor()
+		cursor.execute("SELECT %s, %s FROM %s WHERE %s IS NOT NULL" %(nameColumn, idColumn, table, nameColumn))
+		return dict((x[0], int(x[1])) for x in cursor.fetchall())
+
+	"""
+	Returns the name -> ID maps of every dimension table, reading each table once and caching the maps on the object.
+	The populate functions of the dimension tables clear the cache.
+
+	@param refresh (optional): reload the maps from the database
+	@return dictionary with the keys 'patient', 'gene', 'platform', 'cancer_type' and 'group', each a name -> ID dictionary
+	"""
+	def getDimensionMaps(self, refresh = False):
+		if self.dimensionMaps is None or refresh:
+			self.dimensionMaps = {
+				'patient': self.getNameToIDMap("Patients", "name", "patient_id"),
+				'gene': self.getNameToIDMap("Genes", "gene_name", "gene_id"),
+				'platform': self.getNameToIDMap("Exp_Platforms", "platform", "platform_id"),
+				'cancer_type': self.getNameToIDMap("Cancer_Types", "abbv", "cancer_type_id"),
+				'group': self.getNameToIDMap("SGA_Unit_Group", "name", "group_id"),
+			}
+		return self.dimensionMaps
+
+	"""
+	Dry run of a populate function. Streams the input file once without writing to the database, resolves every
+	foreign key against the cached dimension maps, type checks the numeric columns and looks for duplicate lines.
+	The layout of each input type is described in 'INPUT_SPECS'.
+
+	@param inputType: one of the keys of 'INPUT_SPECS' ('cancer_type', 'gene', 'platform', 'sga_unit_group', 'patient',
+					  'sm', 'scna', 'scna_segment', 'deg' or 'tdi')
+	@param inputFile: path to the input file
+	@param delimiter: column delimiter of the input file
+	@param sampleSize (optional): maximum number of examples kept for each kind of problem
+	@return report: dictionary with the number of 'lines', 'valid' lines and 'skipped' lines, and for each of 'malformed',
+					'badNumeric', 'duplicates' and 'unknown_<key>' a dictionary with its 'count' and a list of 'samples'
+					((line number, value) tuples)
+	"""
+	def validateInputFile(self, inputType, inputFile, delimiter, sampleSize = 10):
+		if inputType not in self.INPUT_SPECS:
+			print "Error with inputType argument. Please ensure that it is one of: %s." %(", ".join(sorted(self.INPUT_SPECS.keys())))
+			return
+
+		spec = self.INPUT_SPECS[inputType]
+		maps = self.getDimensionMaps()
+		numColumns = spec['columns']
+		keys = spec['keys'].items()
+		numeric = [(i, int) for i in spec['ints']] + [(i, float) for i in spec['floats']]
+		unique = spec['unique']
+		skip = spec.get('skip', {}).items()
+		nulls = ("null", "NULL", "Null")
+
+		report = {'lines': 0, 'valid': 0, 'skipped': 0}
+		problems = ['malformed', 'badNumeric', 'duplicates'] + ["unknown_" + x for x in set(spec['keys'].values())]
+		for problem in problems:
+			report[problem] = {'count': 0, 'samples': []}
+
+		def record(problem, lineNumber, value):
+			report[problem]['count'] += 1
+			if len(report[problem]['samples']) < sampleSize:
+				report[problem]['samples'].append((lineNumber, value))
+
+		seen = set()
+		inputData = open(inputFile, "r")
+		#skip header
+		inputData.readline()
+
+		lineNumber = 1
+		for line in inputData:
+			lineNumber += 1
+			report['lines'] += 1
+			dataFields = line.rstrip("\r\n").split(delimiter)
+
+			if len(dataFields) != numColumns:
+				record('malformed', lineNumber, line.rstrip("\r\n"))
+				continue
+
+			if any(dataFields[i] in values for i, values in skip):
+				report['skipped'] += 1
+				continue
+
+			valid = True
+			for i, keyType in keys:
+				value = dataFields[i]
+				if value in nulls:
+					continue
+				if keyType == 'driver':
+					if "group" in value or "unit" in value:
+						known = value in maps['group']
+					else:
+						known = value in maps['gene']
+				else:
+					known = value in maps[keyType]
+				if not known:
+					record("unknown_" + keyType, lineNumber, value)
+					valid = False
+
+			for i, numberType in numeric:
+				value = dataFields[i]
+				if value in nulls:
+					continue
+				try:
+					numberType(value)
+				except ValueError:
+					record('badNumeric', lineNumber, value)
+					valid = False
+
+			key = tuple([dataFields[i] for i in unique])
+			if key in seen:
+				record('duplicates', lineNumber, delimiter.join(key))
+				valid = False
+			else:
+				seen.add(key)
+
+			if valid:
+				report['valid'] += 1
+
+		inputData.close()
+		return report
+
+	"""
+	Returns a NumPy object array mapping gene ID -> gene name, shared by all 'ResultTable' objects. The names are interned,
+	so every result decodes to the same string objects. Cached on the object; 'populateGeneTable' clears the cache.
+
+	@param refresh (optional): reload the gene names from the database
+	@return NumPy object array indexed by gene ID (None for unused IDs)
+	"""
+	def getGeneNameArray(self, refresh = False):
+		import numpy as np
+
+		if self.geneNameArray is None or refresh:
+			geneIDs = self.getDimensionMaps(refresh)['gene']
+			geneNames = np.empty(max(geneIDs.values() + [0]) + 1, dtype=object)
+			for name, geneID in geneIDs.iteritems():
+				geneNames[geneID] = intern(str(name))
+			self.geneNameArray = geneNames
+		return self.geneNameArray
+
+	"""
+	Runs a query through a server-side cursor and collects the rows block by block into a 'ResultTable', so the rows
+	never exist as one Python tuple each at the same time.
+
+	@param query: SQL query with %s placeholders for params
+	@param params: list of query parameters
+	@param columnNames: names of the selected columns
+	@param dtypes: NumPy dtypes of the selected columns (e.g. np.int32, np.float32)
+	@param geneColumns (optional): names of the columns that hold gene IDs
+	@param fetchSize (optional): number of rows fetched from the server at a time
+	@return ResultTable (None if the query fails)
+	"""
+	def fetchResultTable(self, query, params, columnNames, dtypes, geneColumns = (), fetchSize = 100000):
+		import numpy as np
+
+		blocks = [[] for x in columnNames]
+		streamCursor = self.backend.streamingCursor(self.db)
+		try:
+			streamCursor.execute(query, params)
+			while True:
+				fetched = streamCursor.fetchmany(fetchSize)
+				if not fetched:
+					break
+				for i, values in enumerate(zip(*fetched)):
+					blocks[i].append(np.array(values, dtype=dtypes[i]))
+		except:
+			print "Error fetching query results into a result table."
+			print query
+			return
+		finally:
+			streamCursor.close()
+
+		columns = [np.concatenate(x) if len(x) > 0 else np.zeros(0, dtype=dtype) for x, dtype in zip(blocks, dtypes)]
+		return ResultTable(columnNames, columns, self.getGeneNameArray(), geneColumns)
+
+	"""
+	Pulls TDI results into a compact 'ResultTable' with int32 patient and gene IDs and float32 posteriors, for loading
+	whole cohorts into memory (e.g. a notebook) without one Python tuple per row.
+
+	@param driverGenes (optional): list of TCGA driver gene names to restrict to
+	@param targetGenes (optional): list of TCGA target gene names to restrict to
+	@param minPosterior (optional): ignore entries with a posterior below this value
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return ResultTable with the columns patient_id, gt_gene_id, ge_gene_id and posterior (gene columns decode to names)
+	"""
+	def getTDIResultTable(self, driverGenes = None, targetGenes = None, minPosterior = 0.0, cohort = None):
+		import numpy as np
+
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
+		params = [minPosterior]
+		filterSQL = ""
+		for column, genes in (("gt_gene_id", driverGenes), ("ge_gene_id", targetGenes)):
+			if genes is None:
+				continue
+			geneIDs = self.getGeneIDs(genes).values()
+			if len(geneIDs) == 0:
+				filterSQL += " AND 1 = 0"
+				continue
+			filterSQL += " AND %s IN (%s)" %(column, self.placeholderString(len(geneIDs)))
+			params += geneIDs
+
+		query = "SELECT patient_id, gt_gene_id, ge_gene_id, posterior\
+				 FROM TDI_Results\
+				 WHERE gt_gene_id IS NOT NULL AND posterior >= %%s%s%s" %(filterSQL, cohortSQL)
+		return self.fetchResultTable(query, params + cohortParams, ["patient_id", "gt_gene_id", "ge_gene_id", "posterior"],
+									 [np.int32, np.int32, np.int32, np.float32], geneColumns=("gt_gene_id", "ge_gene_id"))
+
+	"""
+	Builds (or returns the already built) in-memory 'GeneIntervalIndex' over the coordinates and cytobands in the Genes table.
+
+	@param rebuild (optional): reload the Genes table even if an index was already built
+	@return GeneIntervalIndex
+	"""
+	def getGeneIntervalIndex(self, rebuild = False):
+		if self.geneIntervalIndex is None or rebuild:
+			cursor = self.db.cursor()
+			cursor.execute("SELECT gene_id, gene_name, chromosome, start_pos, end_pos, cytoband FROM Genes")
+			self.geneIntervalIndex = GeneIntervalIndex(cursor.fetchall())
+		return self.geneIntervalIndex
+
+	"""
+	Find the genes overlapping a genomic region.
+
+	@param chromosome: chromosome name, with or without a 'chr' prefix
+	@param start: start position of the region (inclusive)
+	@param end: end position of the region (inclusive)
+	@return list of TCGA gene names sorted by start position
+	"""
+	def findGenesInRegion(self, chromosome, start, end):
+		return self.getGeneIntervalIndex().findOverlappingGenes(chromosome, start, end)
+
+	"""
+	Find the genes in a cytoband. Bands match hierarchically, so '17p13' also returns genes in '17p13.1'.
+
+	@param cytoband: cytoband name (e.g. '17p13.1')
+	@return list of TCGA gene names
+	"""
+	def findGenesInCytoband(self, cytoband):
+		return self.getGeneIntervalIndex().findGenesInCytoband(cytoband)
+
+	"""
+	Loads segment-level copy number calls into the SCNAs table by expanding every segment to one gene-level row per
+	gene it overlaps. The input file has a header line and the columns: patient name, chromosome, segment start,
+	segment end, tissue, gistic score and platform. Segments are read into arrays and expanded chromosome by chromosome
+	against the 'GeneIntervalIndex', and the resulting rows are inserted with 'executemany' in batches.
+
+	@param inputFile: path to the segment file
+	@param delimiter: column delimiter of the input file
+	@param batchSize (optional): number of SCNA rows inserted per batch
+	@param validate (optional): only validate the input file with 'validateInputFile' and return its report
+	@return number of SCNA rows inserted
+	"""
+	def populateSCNASegmentTable(self, inputFile, delimiter, batchSize = 10000, validate = False):
+		if validate:
+			return self.validateInputFile('scna_segment', inputFile, delimiter)
+
+		self.patientProfiles = OrderedDict()
+		import numpy as np
+
+		cursor = self.db.cursor()
+		geneIndex = self.getGeneIntervalIndex()
+		maps = self.getDimensionMaps()
+		patientIDs = maps['patient']
+		platformIDs = maps['platform']
+
+		segmentInput = open(inputFile, "r")
+		#read header line
+		segmentInput.readline()
+
+		segPatients = []
+		segChromosomes = []
+		segStarts = []
+		segEnds = []
+		segTissues = []
+		segScores = []
+		segPlatforms = []
+		unknownPlatforms = {}
+		for line in segmentInput:
+			dataFields = line.strip().split(delimiter)
+			if len(dataFields) < 7:
+				continue
+			if dataFields[0] not in patientIDs:
+				print "Unknown patient %s in segment file. Skip." %(dataFields[0])
+				continue
+			#a null platform is loaded as NULL; a platform missing from Exp_Platforms rejects the segment
+			platform = dataFields[6] if dataFields[6] not in ("", "null", "NULL", "Null") else None
+			if platform is not None and platform not in platformIDs:
+				unknownPlatforms[platform] = unknownPlatforms.get(platform, 0) + 1
+				continue
+			try:
+				start, end, score = int(dataFields[2]), int(dataFields[3]), int(dataFields[5])
+			except ValueError:
+				print "Malformed segment line: %s" %(line.strip())
+				continue
+			segStarts.append(start)
+			segEnds.append(end)
+			segScores.append(score)
+			segPatients.append(patientIDs[dataFields[0]])
+			segChromosomes.append(GeneIntervalIndex.normalizeChromosome(dataFields[1]))
+			segTissues.append(dataFields[4] if dataFields[4] not in ("null", "NULL") else None)
+			segPlatforms.append(platformIDs[platform] if platform is not None else None)
+		segmentInput.close()
+
+		for platform in sorted(unknownPlatforms):
+			print "Unknown platform %s in segment file. Skipped %s segments." %(platform, unknownPlatforms[platform])
+
+		segChromosomes = np.array(segChromosomes, dtype=object)
+		segStarts = np.array(segStarts, dtype=np.int64)
+		segEnds = np.array(segEnds, dtype=np.int64)
+
+		sqlInsert = "INSERT INTO SCNAs(scna_id, patient_id, gene_id, tissue, gistic_score, platform_id)\
+					 VALUES(NULL, %s, %s, %s, %s, %s)"
+		numInserted = 0
+		for chromosome in np.unique(segChromosomes):
+			onChromosome = np.flatnonzero(segChromosomes == chromosome)
+			segmentIndex, geneIDs = geneIndex.expandSegments(chromosome, segStarts[onChromosome], segEnds[onChromosome])
+			segmentIndex = onChromosome[segmentIndex]
+
+			for start in range(0, len(geneIDs), batchSize):
+				rows = [(segPatients[i], int(g), segTissues[i], segScores[i], segPlatforms[i]) for i, g in zip(segmentIndex[start:start + batchSize], geneIDs[start:start + batchSize])]
+				try:
+					cursor.executemany(sqlInsert, rows)
+					self.db.commit()
+					numInserted += len(rows)
+				except:
+					print "Error trying to insert a batch of %s scnas from segments on chromosome %s." %(len(rows), chromosome)
+					self.db.rollback()
+
+		return numInserted
+
+	"""
+	Reads a large delimited input file in blocks of whole lines and yields each block as column lists. The file is
+	memory-mapped and cut into byte ranges on line boundaries ('findFileChunks'); each range is split into fields
+	with a few string operations over the whole block ('parseFileChunk') rather than per line. With numProcesses > 1
+	the blocks are parsed by a 'multiprocessing' pool and still yielded in file order.
+
+	@param inputFile: path to the input file (the first line is a header and is skipped)
+	@param delimiter: column delimiter of the input file
+	@param numColumns: number of columns on every line; lines with a different number are dropped and counted
+	@param chunkBytes (optional): approximate size of each block in bytes
+	@param numProcesses (optional): number of worker processes used for parsing
+	@return generator of (columns, numMalformed) where columns is a list of numColumns lists of strings
+	"""
+	def readColumnChunks(self, inputFile, delimiter, numColumns, chunkBytes = CHUNK_BYTES, numProcesses = 1):
+		tasks = [(chunk, delimiter, numColumns) for chunk in findFileChunks(inputFile, chunkBytes)]
+		if numProcesses > 1 and len(tasks) > 1:
+			from multiprocessing import Pool
+			pool = Pool(numProcesses)
+			try:
+				for parsed in pool.imap(parseFileChunk, tasks):
+					yield parsed
+			finally:
+				pool.terminate()
+		else:
+			for task in tasks:
+				yield parseFileChunk(task)
+
+	"""
+	Bulk version of 'populateDEGTable' for very large DEG files. The file is parsed in blocks by 'readColumnChunks',
+	names are resolved with the cached dimension maps and rows are inserted with 'executemany' in batches.
+	Lines with an unknown patient or gene are skipped and counted.
+
+	@param inputFile: path to the DEG file (patient, gene, sample type, platform, value)
+	@param delimiter: column delimiter of the input file
+	@param chunkBytes (optional): approximate size of each parsed block in bytes
+	@param numProcesses (optional): number of worker processes used for parsing
+	@param batchSize (optional): number of rows inserted per batch
+	@return number of DEG rows inserted
+	"""
+	def bulkPopulateDEGTable(self, inputFile, delimiter, chunkBytes = CHUNK_BYTES, numProcesses = 1, batchSize = 10000):
+		self.patientProfiles = OrderedDict()
+		maps = self.getDimensionMaps()
+		patientIDs = maps['patient']
+		geneIDs = maps['gene']
+		platformIDs = maps['platform']
+		nullable = lambda x: None if x in ("null", "NULL", "Null") else x
+
+		sqlInsert = "INSERT INTO DEGs(deg_id, patient_id, gene_id, sample_type, platform_id, value)\
+					 VALUES(NULL, %s, %s, %s, %s, %s)"
+		numInserted = 0
+		numSkipped = 0
+		for columns, numMalformed in self.readColumnChunks(inputFile, delimiter, 5, chunkBytes, numProcesses):
+			rows = zip(map(patientIDs.get, columns[0]), map(geneIDs.get, columns[1]), map(nullable, columns[2]),
+					   map(platformIDs.get, columns[3]), map(nullable, columns[4]))
+			numRows = len(rows)
+			rows = [x for x in rows if x[0] is not None and x[1] is not None]
+			numSkipped += numMalformed + numRows - len(rows)
+			numInserted += self.executeBatches(sqlInsert, rows, batchSize, "DEG")
+
+		if numSkipped > 0:
+			print "Skipped %s malformed DEG lines or lines with an unknown patient or gene." %(numSkipped)
+		return numInserted
+
+	"""
+	Bulk version of 'populateTDIResults' for multi-GB TDI result files. The file is parsed in blocks by 'readColumnChunks',
+	drivers are resolved as genes or, when the name contains 'group' or 'unit', as SGA units/groups, posteriors are
+	converted with NumPy for the whole block and rows are inserted with 'executemany' in batches.
+	Lines with an unknown patient, driver or target, or a non-numeric posterior, are skipped and counted.
+
+	@param inputFile: path to the TDI results file (patient, driver, target, posterior, experiment)
+	@param delimiter: column delimiter of the input file
+	@param expID (optional): experiment ID stored with every row (the experiment column of the file is ignored, as in 'populateTDIResults')
+	@param chunkBytes (optional): approximate size of each parsed block in bytes
+	@param numProcesses (optional): number of worker processes used for parsing
+	@param batchSize (optional): number of rows inserted per batch
+	@return number of TDI rows inserted
+	"""
+	def bulkPopulateTDIResults(self, inputFile, delimiter, expID = 1, chunkBytes = CHUNK_BYTES, numProcesses = 1, batchSize = 10000):
+		import numpy as np
+
+		self.patientProfiles = OrderedDict()
+		maps = self.getDimensionMaps()
+		patientIDs = maps['patient']
+		geneIDs = maps['gene']
+		groupIDs = maps['group']
+		isGroup = lambda x: "group" in x or "unit" in x
+
+		def toFloat(value):
+			try:
+				return float(value)
+			except ValueError:
+				return None
+
+		sqlInsert = "INSERT INTO TDI_Results(tdi_id, patient_id, gt_gene_id, gt_unit_group_id, ge_gene_id, posterior, exp_id)\
+					 VALUES(NULL, %s, %s, %s, %s, %s, %s)"
+		numInserted = 0
+		numSkipped = 0
+		for columns, numMalformed in self.readColumnChunks(inputFile, delimiter, 5, chunkBytes, numProcesses):
+			try:
+				posteriors = np.array(columns[3]).astype(np.float64).tolist()
+			except ValueError:
+				posteriors = map(toFloat, columns[3])
+			driverIsGroup = map(isGroup, columns[1])
+			gtGenes = [None if g else geneIDs.get(x) for x, g in zip(columns[1], driverIsGroup)]
+			gtGroups = [groupIDs.get(x) if g else None for x, g in zip(columns[1], driverIsGroup)]
+
+			rows = zip(map(patientIDs.get, columns[0]), gtGenes, gtGroups, map(geneIDs.get, columns[2]), posteriors)
+			numRows = len(rows)
+			rows = [x + (expID,) for x in rows if x[0] is not None and (x[1] is not None or x[2] is not None) and x[3] is not None and x[4] is not None]
+			numSkipped += numMalformed + numRows - len(rows)
+			numInserted += self.executeBatches(sqlInsert, rows, batchSize, "TDI")
+
+		if numSkipped > 0:
+			print "Skipped %s malformed TDI lines or lines with an unknown patient, driver or target." %(numSkipped)
+		return numInserted
+
+	"""
+	Inserts rows with 'executemany' in batches, committing after each batch. A failing batch is rolled back and reported.
+
+	@param sqlInsert: INSERT statement with one %s placeholder per column
+	@param rows: list of row tuples
+	@param batchSize: number of rows per batch
+	@param label: name of the data type, used in error messages
+	@return number of rows inserted
+	"""
+	def executeBatches(self, sqlInsert, rows, batchSize, label):
+		cursor = self.db.cursor()
+		numInserted = 0
+		for start in range(0, len(rows), batchSize):
+			batch = rows[start:start + batchSize]
+			try:
+				cursor.executemany(sqlInsert, batch)
+				self.db.commit()
+				numInserted += len(batch)
+			except:
+				print "Error trying to insert a batch of %s %s rows." %(len(batch), label)
+				self.db.rollback()
+		return numInserted
+
 	"""
 	Given a TCGA gene name, return the corresponding geneID from the 'Genes' table
 	param geneName: TCGA gene name
 	return geneID: id of gene in TDI database
 	"""
 	def getGeneID(self, geneName):
-		cursor = self.db.cursor()
 		query = "SELECT gene_id\
 				 FROM Genes\
-				 WHERE gene_name = '%s'" %(geneName)
+				 WHERE gene_name = %s"
 		try:
-			cursor.execute(query)
-			results = cursor.fetchall()
+			results = self.executeStatement(query, [geneName]).fetchall()
 			return int(results[0][0])
 		except:
 			print "Error finding gene id. Please ensure that given gene %s is a proper gene name. Otherwise %s is not in the database." %(geneName, geneName)
@@ -687,12 +1515,14 @@ class TDISQL:
 
 	param gtGene: TCGA gene name
 	param mutType: optional parameter to condition the query only on tumors with synonymous or nonsynonymous mutations of gtGene
+	param cohort: optional cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
 
 	return list of patient IDs
 	"""
 
-	def findTumorsWithGT(self, gtGene, mutType = 'all'):
+	def findTumorsWithGT(self, gtGene, mutType = 'all', cohort = None):
 		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "TDI_Results.patient_id")
 
 		if mutType != 'all' and mutType != 'syn' and mutType != 'nonsyn':
 			print "Error with type argument, proceeding to find all tumors. Please ensure that the given 'mutType' argument\
@@ -703,24 +1533,24 @@ class TDISQL:
 			query = "SELECT DISTINCT Patients.patient_id\
 					FROM TDI_Results JOIN Patients ON TDI_Results.patient_id = Patients.patient_id\
 				    JOIN Genes ON TDI_Results.gt_gene_id = Genes.gene_id\
-					WHERE Genes.gene_name = '%s' AND TDI_Results.gt_gene_id IS NOT NULL" %(gtGene)
+					WHERE Genes.gene_name = %%s AND TDI_Results.gt_gene_id IS NOT NULL%s" %(cohortSQL)
 
 		elif mutType == 'syn':
 			query = "SELECT DISTINCT Patients.patient_id\
 					FROM TDI_Results JOIN Patients ON TDI_Results.patient_id = Patients.patient_id\
 				    JOIN Genes ON TDI_Results.gt_gene_id = Genes.gene_id\
 				    JOIN Somatic_Mutations ON Somatic_Mutations.patient_id = Patients.patient_id AND Somatic_Mutations.gene_id = Genes.gene_id\
-					WHERE Genes.gene_name = '%s' AND TDI_Results.gt_gene_id IS NOT NULL AND Somatic_Mutations.mut_type = 'synonymous SNV'" %(gtGene)
+					WHERE Genes.gene_name = %%s AND TDI_Results.gt_gene_id IS NOT NULL AND Somatic_Mutations.mut_type = 'synonymous SNV'%s" %(cohortSQL)
 
 		elif mutType == 'nonsyn':
 			query = "SELECT DISTINCT Patients.patient_id\
 					FROM TDI_Results JOIN Patients ON TDI_Results.patient_id = Patients.patient_id\
 				    JOIN Genes ON TDI_Results.gt_gene_id = Genes.gene_id\
 				    JOIN Somatic_Mutations ON Somatic_Mutations.patient_id = Patients.patient_id AND Somatic_Mutations.gene_id = Genes.gene_id\
-					WHERE Genes.gene_name = '%s' AND TDI_Results.gt_gene_id IS NOT NULL AND Somatic_Mutations.mut_type = 'nonsynonymous SNV'" %(gtGene)
+					WHERE Genes.gene_name = %%s AND TDI_Results.gt_gene_id IS NOT NULL AND Somatic_Mutations.mut_type = 'nonsynonymous SNV'%s" %(cohortSQL)
 
 		try:
-			cursor.execute(query)
+			cursor.execute(query, [gtGene] + cohortParams)
 			results = cursor.fetchall()
 			return [r[0] for r in results]
 		except:
@@ -729,73 +1559,72 @@ class TDISQL:
 			return
 
 	"""
-	Get number of tumors in the database with a given driver gene occuring at a given amino acid location
+	Get number of tumors in the database with a given driver gene occuring at a given amino acid location.
+	The mutated tumors are read from the position table SM_Positions (see 'getDriverTumorsAtLocation').
 
 	param gtGene: TCGA driver gene
 	param aaLoc: int representing a particular amino acid position
+	param cohort: optional cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
 
 	return: number of tumors (patients) with 'gtGene' called as a driver, with the mutation occurring at 'aaLoc'
 	"""
-	def numberOfTumorsWithGTAtLocation(self, gtGene, aaLoc):
-		cursor = self.db.cursor()
-
-		geneID = self.getGeneID(gtGene)
-
-		query = "SELECT COUNT(DISTINCT(patient_id))\
-				 FROM TDI_SM\
-				 WHERE gt_gene_id = %s AND aa_loc = %s" %(geneID, aaLoc)
-		try:
-			cursor.execute(query)
-			results = cursor.fetchall()
-			return int(results[0][0])
-		except:
-			print "Error executing query."
-			print query
+	def numberOfTumorsWithGTAtLocation(self, gtGene, aaLoc, cohort = None):
+		tumors = self.getTumorsMutatedWithGTAtLocation(gtGene, aaLoc, cohort)
+		if tumors is None:
 			return
+		return len(tumors)
 
 	"""
-	Retrieve the tumor IDs of tumors with gtGene as a driver at aaLoc. (could merge this function with the one above)
+	Retrieve the tumor IDs of tumors with gtGene as a driver at aaLoc.
 
 	param: gtGene: TCGA driver gene name
 	param: aaLoc: int representing a particular amino acid position
+	param: cohort: optional cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
 
 	return: list of patient IDs that have gtGene as driver at aaLoc.
 	"""
-	def getTumorsMutatedWithGTAtLocation(self, gtGene, aaLoc):
-		cursor = self.db.cursor()
-
+	def getTumorsMutatedWithGTAtLocation(self, gtGene, aaLoc, cohort = None):
 		geneID = self.getGeneID(gtGene)
+		if geneID == "null":
+			return []
 
-		query = "SELECT DISTINCT(patient_id)\
-				 FROM TDI_SM\
-				 WHERE gt_gene_id = %s AND aa_loc = %s" %(geneID, aaLoc)
 		try:
-			cursor.execute(query)
-			results = cursor.fetchall()
-			return [x[0] for x in results]
+			return self.getDriverTumorsAtLocation(geneID, int(aaLoc), cohort)
 		except:
 			print "Error executing query to get tumors at a given location."
-			print query
-			return	
+			return
 
 	"""
 	Arguments: geneName - a TCGA geneID
 			   hsLocation - an (int) representation of a nucleosome location of interest
+			   cohort - optional cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+			   compact - optional, return a 'ResultTable' (ge_gene_id, num_tumors) instead of tuples
 	return: hotspotDict[ge] = # of tumors with ge affected by given gt
 	"""
-	def findDEGsAtHotspot(self, geneName, hsLocation):
+	def findDEGsAtHotspot(self, geneName, hsLocation, cohort = None, compact = False):
 		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
 		#first find geneID of the given gene name
 		geneID = self.getGeneID(geneName)
 
+		if compact:
+			import numpy as np
+			hotspotQuery = "SELECT ge_gene_id, COUNT(DISTINCT(patient_id)) AS num_tumors\
+							FROM TDI_SM\
+							WHERE aa_loc = %%s AND gt_gene_id = %%s%s\
+							GROUP BY ge_gene_id\
+							ORDER BY num_tumors DESC" %(cohortSQL)
+			return self.fetchResultTable(hotspotQuery, [hsLocation, geneID] + cohortParams, ["ge_gene_id", "num_tumors"],
+										 [np.int32, np.int32], geneColumns=("ge_gene_id",))
+
 		#find all degs
 		hotspotQuery = "SELECT gene_name, COUNT(DISTINCT(patient_id)) AS num_tumors\
 						FROM TDI_SM JOIN Genes ON Genes.gene_id = TDI_SM.ge_gene_id\
-						WHERE aa_loc = %s AND gt_gene_id = %s\
+						WHERE aa_loc = %%s AND gt_gene_id = %%s%s\
 						GROUP BY ge_gene_id\
-						ORDER BY num_tumors DESC" %(hsLocation, geneID)
+						ORDER BY num_tumors DESC" %(cohortSQL)
 		try:
-			cursor.execute(hotspotQuery)
+			cursor.execute(hotspotQuery, [hsLocation, geneID] + cohortParams)
 			results = cursor.fetchall()
 			return results
 			# hsDict = {}
@@ -804,7 +1633,7 @@ class TDISQL:
 			# return hsDict
 		except:
 			print "Error. Unable to process query."
-			print query
+			print hotspotQuery
 			return
 
 	def getDEGsForPatientAndGT(self, gtGene, patientID):
@@ -813,9 +1642,9 @@ class TDISQL:
 
 		degQuery = "SELECT DISTINCT(gene_name)\
 					FROM TDI_Results JOIN Genes ON TDI_Results.ge_gene_id = Genes.gene_id\
-					WHERE gt_gene_id = %s AND patient_id = %s" %(geneID, patientID)
+					WHERE gt_gene_id = %s AND patient_id = %s"
 		try:
-			cursor.execute(degQuery)
+			cursor.execute(degQuery, [geneID, patientID])
 			results = cursor.fetchall()
 			return [x[0] for x in results]
 		except:
@@ -823,18 +1652,19 @@ class TDISQL:
 			return "null"
 
 
-	def findTopHotspotsAndDEGs(self, geneName, numHotspots):
+	def findTopHotspotsAndDEGs(self, geneName, numHotspots, cohort = None):
 		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
 		geneID = self.getGeneID(geneName)
 
 		#find top hotspots for gene
 		hotspotQuery = "SELECT aa_loc, COUNT(DISTINCT(patient_id)) AS num_tumors\
 						FROM TDI_SM\
-						WHERE gt_gene_id = %s\
+						WHERE gt_gene_id = %%s%s\
 						GROUP BY aa_loc\
-						ORDER BY num_tumors DESC LIMIT %s" %(geneID, numHotspots)
+						ORDER BY num_tumors DESC LIMIT %%s" %(cohortSQL)
 		try:
-			cursor.execute(hotspotQuery)
+			cursor.execute(hotspotQuery, [geneID] + cohortParams + [int(numHotspots)])
 			results = cursor.fetchall()
 			hsList = [[int(tup[0]), int(tup[1])] for tup in results]
 		except:
@@ -844,13 +1674,13 @@ class TDISQL:
 
 		hsDict = {}
 
+		geQuery = "SELECT gene_name, COUNT(DISTINCT(patient_id)) AS num_tumors\
+					FROM TDI_SM JOIN Genes ON Genes.gene_id = TDI_SM.ge_gene_id\
+					WHERE aa_loc = %%s AND gt_gene_id = %%s%s\
+					GROUP BY ge_gene_id" %(cohortSQL)
 		for hs in hsList:
-			geQuery = "SELECT gene_name, COUNT(DISTINCT(patient_id)) AS num_tumors\
-						FROM TDI_SM JOIN Genes ON Genes.gene_id = TDI_SM.ge_gene_id\
-						WHERE aa_loc = %s AND gt_gene_id = %s\
-						GROUP BY ge_gene_id" %(hs[0], geneID)
 			try:
-				cursor.execute(geQuery)
+				cursor.execute(geQuery, [hs[0], geneID] + cohortParams)
 				results = cursor.fetchall()
 				hsDict[hs[0]] = []
 				for tup in results:
@@ -868,17 +1698,20 @@ class TDISQL:
 
 	@param gene1: TCGA gene ID for driver gene 1
 	@param gene2: TCGA gene ID for driver gene 2
-	@return commonTargets: list of DEGs that have cases of being driven by gene1 or gene2 
+	@param minNumberOfTumors (optional): a DEG only counts as a target of a driver if it is driven in more than this many tumors
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return commonTargets: list of DEGs that have cases of being driven by gene1 or gene2
 	"""
-	def findOverlappingTargets(self, gene1, gene2):
+	def findOverlappingTargets(self, gene1, gene2, minNumberOfTumors = 5, cohort = None):
 		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
 
 		#get gene IDs from given gene names
 		gene1Query = "SELECT gene_id\
 					  FROM Genes\
-					  WHERE gene_name = '%s'" %(gene1)
+					  WHERE gene_name = %s"
 		try:
-			cursor.execute(gene1Query)
+			cursor.execute(gene1Query, [gene1])
 			geneID1 = int(cursor.fetchall()[0][0])
 		except:
 			print "Error retrieving gene ID for gene: %s." %(gene1)
@@ -886,9 +1719,9 @@ class TDISQL:
 
 		gene2Query = "SELECT gene_id\
 					  FROM Genes\
-					  WHERE gene_name = '%s'" %(gene2)
+					  WHERE gene_name = %s"
 		try:
-			cursor.execute(gene2Query)
+			cursor.execute(gene2Query, [gene2])
 			geneID2 = int(cursor.fetchall()[0][0])
 		except:
 			print "Error retrieving gene ID for gene: %s." %(gene2)
@@ -897,12 +1730,12 @@ class TDISQL:
 		#get degList and frequencies for gene1
 		degQuery1 = "SELECT gene_name, COUNT(DISTINCT(patient_id)) AS num_tumors\
 					 FROM TDI_Results JOIN Genes ON TDI_Results.ge_gene_id = Genes.gene_id\
-					 WHERE gt_gene_id = %s\
+					 WHERE gt_gene_id = %%s%s\
 					 GROUP BY ge_gene_id\
-					 HAVING COUNT(DISTINCT(patient_id)) > 5\
-					 ORDER BY num_tumors DESC" %(geneID1)
+					 HAVING COUNT(DISTINCT(patient_id)) > %%s\
+					 ORDER BY num_tumors DESC" %(cohortSQL)
 		try:
-			cursor.execute(degQuery1)
+			cursor.execute(degQuery1, [geneID1] + cohortParams + [minNumberOfTumors])
 			degsForGene1 = cursor.fetchall()
 		except:
 			print "Error finding targets for gene %s" %(gene1)
@@ -912,12 +1745,12 @@ class TDISQL:
 		#get degList and frequencies for gene2
 		degQuery2 = "SELECT gene_name, COUNT(DISTINCT(patient_id)) AS num_tumors\
 					 FROM TDI_Results JOIN Genes ON TDI_Results.ge_gene_id = Genes.gene_id\
-					 WHERE gt_gene_id = %s\
+					 WHERE gt_gene_id = %%s%s\
 					 GROUP BY ge_gene_id\
-					 HAVING COUNT(DISTINCT(patient_id)) > 5\
-					 ORDER BY num_tumors DESC" %(geneID2)
+					 HAVING COUNT(DISTINCT(patient_id)) > %%s\
+					 ORDER BY num_tumors DESC" %(cohortSQL)
 		try:
-			cursor.execute(degQuery2)
+			cursor.execute(degQuery2, [geneID2] + cohortParams + [minNumberOfTumors])
 			degsForGene2 = cursor.fetchall()
 		except:
 			print "Error finding targets for gene %s" %(gene2)
@@ -929,6 +1762,145 @@ class TDISQL:
 		commonTargets = geneList1.intersection(geneList2)
 		return commonTargets
 
+	"""
+	Builds the binary driver x target incidence matrix from TDI_Results with a single grouped query.
+	Entry (i, j) is 1 if driver i drives target j in more than 'minNumberOfTumors' tumors.
+
+	@param driverGenes (optional): Python list of TCGA driver gene names to restrict the rows to. Default is every driver in TDI_Results.
+	@param minNumberOfTumors (optional): a DEG only counts as a target of a driver if it is driven in more than this many tumors
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return (incidence, driverNames, targetNames): scipy.sparse CSR matrix with one row per driver and one column per target,
+			and the gene names labelling its rows and columns
+	"""
+	def buildDriverTargetIncidence(self, driverGenes = None, minNumberOfTumors = 5, cohort = None):
+		import numpy as np
+		from scipy import sparse
+
+		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
+
+		if driverGenes is None:
+			chunks = [None]
+		else:
+			chunks = list(self.chunkList(self.getGeneIDs(driverGenes).values(), self.BATCH_SIZE))
+
+		pairs = []
+		for chunk in chunks:
+			driverFilter = ""
+			params = []
+			if chunk is not None:
+				driverFilter = " AND gt_gene_id IN (%s)" %(self.placeholderString(len(chunk)))
+				params = list(chunk)
+
+			incidenceQuery = "SELECT gt_gene_id, ge_gene_id\
+							  FROM TDI_Results\
+							  WHERE gt_gene_id IS NOT NULL%s%s\
+							  GROUP BY gt_gene_id, ge_gene_id\
+							  HAVING COUNT(DISTINCT(patient_id)) > %%s" %(driverFilter, cohortSQL)
+			try:
+				cursor.execute(incidenceQuery, params + cohortParams + [minNumberOfTumors])
+				pairs.extend(cursor.fetchall())
+			except:
+				print "Error building driver-target incidence."
+				print incidenceQuery
+				return
+
+		if len(pairs) == 0:
+			return sparse.csr_matrix((0, 0), dtype=np.int32), [], []
+
+		pairs = np.array(pairs, dtype=np.int64)
+		driverIDs, rows = np.unique(pairs[:, 0], return_inverse=True)
+		targetIDs, cols = np.unique(pairs[:, 1], return_inverse=True)
+		incidence = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(driverIDs), len(targetIDs)))
+
+		geneNames = {}
+		allIDs = [int(x) for x in np.union1d(driverIDs, targetIDs)]
+		for chunk in self.chunkList(allIDs, self.BATCH_SIZE):
+			nameQuery = "SELECT gene_id, gene_name\
+						 FROM Genes\
+						 WHERE gene_id IN (%s)" %(self.placeholderString(len(chunk)))
+			cursor.execute(nameQuery, chunk)
+			for tup in cursor.fetchall():
+				geneNames[int(tup[0])] = tup[1]
+
+		driverNames = [geneNames.get(int(x), str(x)) for x in driverIDs]
+		targetNames = [geneNames.get(int(x), str(x)) for x in targetIDs]
+		return incidence, driverNames, targetNames
+
+	"""
+	All-pairs version of 'findOverlappingTargets'. Builds the driver x target incidence once and computes, for every
+	pair of drivers, the number of shared targets, the Jaccard index of their target sets and the hypergeometric p-value
+	of an overlap at least that large (the population being every target in the incidence). Overlaps are computed as a
+	sparse matrix product one block of drivers at a time, so the full driver x driver matrix never has to be held in memory
+	unless it is asked for.
+
+	@param driverGenes (optional): Python list of TCGA driver gene names. Default is every driver in TDI_Results.
+	@param minNumberOfTumors (optional): a DEG only counts as a target of a driver if it is driven in more than this many tumors
+	@param topK (optional): only keep the 'topK' pairs with the smallest p-values. Default keeps every overlapping pair.
+	@param outputFile (optional): tab delimited file that every overlapping pair is streamed to as it is computed
+	@param matrixFile (optional): '.npz' file the full sparse driver x driver overlap matrix is saved to (with 'scipy.sparse.save_npz')
+	@param blockSize (optional): number of drivers multiplied against the incidence at a time
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return pairs: list of (driver 1, driver 2, number of shared targets, jaccard, p-value) tuples sorted by p-value
+	"""
+	def findAllOverlappingTargets(self, driverGenes = None, minNumberOfTumors = 5, topK = None, outputFile = None, matrixFile = None, blockSize = 256, cohort = None):
+		import numpy as np
+		from scipy import sparse, stats
+
+		built = self.buildDriverTargetIncidence(driverGenes, minNumberOfTumors, cohort)
+		if built is None:
+			return
+		incidence, driverNames, targetNames = built
+
+		numTargets = len(targetNames)
+		targetCounts = np.asarray(incidence.sum(axis=1)).ravel()
+		incidenceT = incidence.T.tocsc()
+
+		out = None
+		if outputFile is not None:
+			out = open(outputFile, "w")
+			out.write("driver1\tdriver2\toverlap\tjaccard\tp_value\n")
+
+		blocks = []
+		keep = None
+		for start in range(0, len(driverNames), blockSize):
+			overlap = (incidence[start:start + blockSize] * incidenceT).tocoo()
+			rows = overlap.row + start
+			upper = overlap.col > rows
+			rows, cols, shared = rows[upper], overlap.col[upper], overlap.data[upper]
+
+			if matrixFile is not None:
+				blocks.append(overlap)
+
+			jaccard = shared / (targetCounts[rows] + targetCounts[cols] - shared).astype(np.float64)
+			pValues = stats.hypergeom.sf(shared - 1, numTargets, targetCounts[rows], targetCounts[cols])
+
+			if out is not None:
+				for i in range(len(rows)):
+					out.write("%s\t%s\t%d\t%.6g\t%.6g\n" %(driverNames[rows[i]], driverNames[cols[i]], shared[i], jaccard[i], pValues[i]))
+
+			block = (rows, cols, shared, jaccard, pValues)
+			if keep is None:
+				keep = block
+			else:
+				keep = tuple(np.concatenate((keep[i], block[i])) for i in range(5))
+
+			if topK is not None and len(keep[0]) > topK:
+				best = np.argpartition(keep[4], topK - 1)[:topK]
+				keep = tuple(x[best] for x in keep)
+
+		if out is not None:
+			out.close()
+
+		if matrixFile is not None:
+			sparse.save_npz(matrixFile, sparse.vstack(blocks).tocsr() if len(blocks) > 0 else sparse.csr_matrix((0, 0)))
+
+		if keep is None:
+			return []
+
+		order = np.lexsort((-keep[2], keep[4]))
+		return [(driverNames[keep[0][i]], driverNames[keep[1][i]], int(keep[2][i]), float(keep[3][i]), float(keep[4][i])) for i in order]
+
 	"""
 	Given a TCGA gene ID for a target gene, find all driver genes that
 	drive the target gene in at least a given number of tumors.
@@ -936,22 +1908,35 @@ class TDISQL:
 	@param targetGene: TCGA gene ID for a target gene of interest
 	@param minNumberOfTumors (optional): the minimum number of tumors for which we see a particular
  										 driver-target interaction in order for the algorithm to deem it significant
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@param compact (optional): return a 'ResultTable' (gt_gene_id, num_tumors) instead of tuples
  	@return Results table detailing the driver genes found by the algorithm as well as the number of tumors with the given driver-target interaction
 	"""
-	def findDriversForGene(self, targetGene, minNumberOfTumors = 0):
+	def findDriversForGene(self, targetGene, minNumberOfTumors = 0, cohort = None, compact = False):
 		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
 
 		targetGeneID = self.getGeneID(targetGene)
-		if targetGeneID != "null":
+		if targetGeneID != "null" and compact:
+			import numpy as np
+			driverGeneAndFreqQuery = "SELECT gt_gene_id, COUNT(DISTINCT(patient_id)) AS num_tumors\
+									  FROM TDI_Results\
+									  WHERE ge_gene_id = %%s AND gt_gene_id IS NOT NULL%s\
+									  GROUP BY gt_gene_id\
+									  HAVING num_tumors > %%s\
+									  ORDER BY num_tumors DESC" %(cohortSQL)
+			return self.fetchResultTable(driverGeneAndFreqQuery, [targetGeneID] + cohortParams + [minNumberOfTumors],
+										 ["gt_gene_id", "num_tumors"], [np.int32, np.int32], geneColumns=("gt_gene_id",))
+		elif targetGeneID != "null":
 			driverGeneAndFreqQuery = "SELECT gene_name, COUNT(DISTINCT(patient_id)) AS num_tumors\
 									  FROM TDI_Results JOIN Genes ON TDI_Results.gt_gene_id = Genes.gene_id\
-									  WHERE ge_gene_id = %s\
+									  WHERE ge_gene_id = %%s%s\
 									  GROUP BY gt_gene_id\
-									  HAVING num_tumors > %s\
-									  ORDER BY num_tumors DESC" %(targetGeneID, minNumberOfTumors)
+									  HAVING num_tumors > %%s\
+									  ORDER BY num_tumors DESC" %(cohortSQL)
 
 			try:
-				cursor.execute(driverGeneAndFreqQuery)
+				cursor.execute(driverGeneAndFreqQuery, [targetGeneID] + cohortParams + [minNumberOfTumors])
 				results = cursor.fetchall()
 				return results
 			except:
@@ -960,61 +1945,174 @@ class TDISQL:
 		else:
 			return "null"
 
+	"""
+	Ranks the partners of a gene in TDI_Results by posterior probability. If role is 'driver', the given gene is
+	the driver (gt) and its targets (ge) are ranked; if role is 'target', the given gene is the target and its
+	drivers are ranked. Only entries with a posterior of at least 'minPosterior' are counted, so the query is a
+	range scan on the (gene, posterior) indexes of TDI_Results.
+
+	@param geneName: TCGA gene name
+	@param role: 'driver' or 'target'
+	@param k (optional): number of partners to return
+	@param rankBy (optional): 'sum' ranks by the summed posterior over tumors, 'mean' by the mean posterior, 'max' by the maximum posterior
+	@param minPosterior (optional): ignore entries with a posterior below this value
+	@param minNumberOfTumors (optional): only rank partners seen in at least this many tumors
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return list of (partner gene name, score, number of tumors) tuples sorted by score
+	"""
+	def findTopByPosterior(self, geneName, role, k = 20, rankBy = 'sum', minPosterior = 0.0, minNumberOfTumors = 1, cohort = None):
+		cursor = self.db.cursor()
+
+		aggregates = {'sum': "SUM(posterior)", 'mean': "AVG(posterior)", 'max': "MAX(posterior)"}
+		if rankBy not in aggregates:
+			print "Error with rankBy argument, proceeding to rank by summed posterior. Please ensure that the given 'rankBy' argument\
+					is either 'sum', 'mean', or 'max'."
+			rankBy = 'sum'
+
+		if role == 'driver':
+			geneColumn, partnerColumn = "gt_gene_id", "ge_gene_id"
+		elif role == 'target':
+			geneColumn, partnerColumn = "ge_gene_id", "gt_gene_id"
+		else:
+			print "Error with role argument. Please ensure that the given 'role' argument is either 'driver' or 'target'."
+			return
+
+		geneID = self.getGeneID(geneName)
+		if geneID == "null":
+			return "null"
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
+
+		topQuery = "SELECT gene_name, %s AS score, COUNT(DISTINCT(patient_id)) AS num_tumors\
+					FROM TDI_Results JOIN Genes ON TDI_Results.%s = Genes.gene_id\
+					WHERE %s = %%s AND posterior >= %%s%s\
+					GROUP BY %s\
+					HAVING num_tumors >= %%s\
+					ORDER BY score DESC LIMIT %%s" %(aggregates[rankBy], partnerColumn, geneColumn, cohortSQL, partnerColumn)
+		try:
+			cursor.execute(topQuery, [geneID, minPosterior] + cohortParams + [minNumberOfTumors, k])
+			return [(x[0], float(x[1]), int(x[2])) for x in cursor.fetchall()]
+		except:
+			print "Error retrieving top %s partners by posterior for gene %s." %(role, geneName)
+			print topQuery
+			return
+
+	"""
+	Find the top 'k' targets of a driver gene ranked by posterior probability (see 'findTopByPosterior').
+
+	@param gtGene: TCGA driver gene name
+	@return list of (target gene name, score, number of tumors) tuples sorted by score
+	"""
+	def findTopTargetsForDriver(self, gtGene, k = 20, rankBy = 'sum', minPosterior = 0.0, minNumberOfTumors = 1, cohort = None):
+		return self.findTopByPosterior(gtGene, 'driver', k, rankBy, minPosterior, minNumberOfTumors, cohort)
+
+	"""
+	Find the top 'k' drivers of a target gene ranked by posterior probability (see 'findTopByPosterior').
+
+	@param targetGene: TCGA target gene name
+	@return list of (driver gene name, score, number of tumors) tuples sorted by score
+	"""
+	def findTopDriversForTarget(self, targetGene, k = 20, rankBy = 'sum', minPosterior = 0.0, minNumberOfTumors = 1, cohort = None):
+		return self.findTopByPosterior(targetGene, 'target', k, rankBy, minPosterior, minNumberOfTumors, cohort)
+
+	"""
+	Per-patient version of 'findTopByPosterior': for every tumor with the given gene in TDI_Results, returns the
+	'k' partners with the highest posterior in that tumor. The rows come back from one query ordered by
+	(patient, posterior) and are cut to 'k' per patient as they are read.
+
+	@param geneName: TCGA gene name
+	@param role: 'driver' or 'target', as in 'findTopByPosterior'
+	@param k (optional): number of partners to return per patient
+	@param minPosterior (optional): ignore entries with a posterior below this value
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return dictionary where keys are patient IDs and values are lists of (partner gene name, posterior) tuples sorted by posterior
+	"""
+	def findTopPerPatientByPosterior(self, geneName, role, k = 5, minPosterior = 0.0, cohort = None):
+		cursor = self.db.cursor()
+
+		if role == 'driver':
+			geneColumn, partnerColumn = "gt_gene_id", "ge_gene_id"
+		elif role == 'target':
+			geneColumn, partnerColumn = "ge_gene_id", "gt_gene_id"
+		else:
+			print "Error with role argument. Please ensure that the given 'role' argument is either 'driver' or 'target'."
+			return
+
+		geneID = self.getGeneID(geneName)
+		if geneID == "null":
+			return "null"
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
+
+		perPatientQuery = "SELECT patient_id, gene_name, posterior\
+						   FROM TDI_Results JOIN Genes ON TDI_Results.%s = Genes.gene_id\
+						   WHERE %s = %%s AND posterior >= %%s%s\
+						   ORDER BY patient_id, posterior DESC" %(partnerColumn, geneColumn, cohortSQL)
+		try:
+			cursor.execute(perPatientQuery, [geneID, minPosterior] + cohortParams)
+			topDict = {}
+			for tup in cursor.fetchall():
+				partners = topDict.setdefault(tup[0], [])
+				if len(partners) < k:
+					partners.append((tup[1], float(tup[2])))
+			return topDict
+		except:
+			print "Error retrieving per-patient top %s partners by posterior for gene %s." %(role, geneName)
+			print perPatientQuery
+			return
+
 	"""
 	Given a Python list of genes, this function looks at our Somatic_Mutation
 	table and finds the tumors without a mutation in any of the given genes.
 	This list of genes is returned to the user.
 
 	@param geneList: a Python list of TCGA gene IDs of genes to check for the absence of mutation
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
 	@return: A list of TCGA tumors found to not have mutations in any of the given genes in geneList
 	"""
-	def findTumorsWithoutGenes(self, geneList):
+	def findTumorsWithoutGenes(self, geneList, cohort = None):
 		cursor = self.db.cursor()
-		geneString = ""
-		for i in range(len(geneList)):
-			if i == 0:
-				geneString += "'" + geneList[i] + "'"
-			else:
-				geneString += ",'" + geneList[i] + "'"
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "Somatic_Mutations.patient_id")
 
 		tumorQuery = "SELECT DISTINCT(name)\
-		 			  FROM Somatic_Mutations JOIN Patients ON Somatic_Mutations.patient_id = Patients.patient_id\
-					  WHERE Somatic_Mutations.patient_id NOT IN (SELECT DISTINCT(patient_id) FROM Somatic_Mutations JOIN Genes ON Somatic_Mutations.gene_id = Genes.gene_id WHERE gene_name IN (%s))" %(geneString)
+					  FROM Somatic_Mutations JOIN Patients ON Somatic_Mutations.patient_id = Patients.patient_id\
+					  WHERE Somatic_Mutations.patient_id NOT IN (SELECT DISTINCT(patient_id) FROM Somatic_Mutations JOIN Genes ON Somatic_Mutations.gene_id = Genes.gene_id WHERE gene_name IN (%s))%s" %(self.placeholderString(len(geneList)), cohortSQL)
 
-	  	try:
-	  		cursor.execute(tumorQuery)
-	  		results = cursor.fetchall()
-	  		return [x[0] for x in results]
-	  		# return results
-  		except:
-  			print "Error with query."
-  			return
+		try:
+			cursor.execute(tumorQuery, list(geneList) + cohortParams)
+			results = cursor.fetchall()
+			return [x[0] for x in results]
+		except:
+			print "Error with query."
+			return
 
 	"""
-	Given a TCGA driver gene and an integer value 'x' for the top x hotspots,
-	this function first finds the top x hotspots based on somatic mutation frequency,
-	then for each hotspot, it finds the tumors with mutations of the gene at the hotspot.
-	Finally, for each of these tumors, we find the DEGs deemed to be driven by the gtGene
-	in the tumor. These DEGs and their frequency of occurrence are ultimately returned to
-	the user.
+	Given a TCGA driver gene and an integer value 'x' for the top x hotspots, this function finds the top x
+	hotspots based on nonsynonymous somatic mutation frequency and returns the tumors with gtGene as a driver
+	and a mutation of the gene at one of these hotspots.
 
 	@param gtGene: TCGA gene ID of driver gene of interest
 	@param numHotspots: Integer representing the top 'x' hotspots for the algorithm to look at
-	@return degDict: dictionary where keys are DEGs and value is the number of tumors (with mutation at a hotspot) have this DEG.
-	@return len(deletionTumors): total number of tumors found with nonsynonymous mutation at one of the 'x' hotspots
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return mutatedTumors: set of patient IDs with a mutation at one of the 'x' hotspots
 	"""
-	def findDEGsForTumorsAtTopHotspots(self, gtGene, numHotspots):
+	def getTumorsAtTopHotspots(self, gtGene, numHotspots, cohort = None):
 		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
 
 		geneID = self.getGeneID(gtGene)
 
-		#find top 5 hotspots in regards to nonsynonymous
-		hotspotQuery = "SELECT aa_loc\
-						FROM Somatic_Mutations\
-						WHERE gene_id = %s AND mut_type = 'nonsynonymous SNV'\
-						GROUP BY aa_loc ORDER BY COUNT(DISTINCT(patient_id)) DESC LIMIT %s" %(geneID, numHotspots)
+		#find top 5 hotspots in regards to nonsynonymous; without a cohort the counts are precomputed in SM_Positions
+		if cohort is None:
+			hotspotQuery = "SELECT aa_loc\
+							FROM SM_Positions\
+							WHERE gene_id = %s AND mut_type = 'nonsynonymous SNV'\
+							ORDER BY num_tumors DESC LIMIT %s"
+		else:
+			hotspotQuery = "SELECT aa_loc\
+							FROM Somatic_Mutations\
+							WHERE gene_id = %%s AND mut_type = 'nonsynonymous SNV'%s\
+							GROUP BY aa_loc ORDER BY COUNT(DISTINCT(patient_id)) DESC LIMIT %%s" %(cohortSQL)
 		try:
-			cursor.execute(hotspotQuery)
+			cursor.execute(hotspotQuery, [geneID] + cohortParams + [int(numHotspots)])
 			topHotspots = cursor.fetchall()
 			topHotspots = [int(x[0]) for x in topHotspots]
 		except:
@@ -1024,17 +2122,123 @@ class TDISQL:
 		mutatedTumors = set()
 		for hotspot in topHotspots:
 			#find tumors for each hotspot
-			tumorResults = self.getTumorsMutatedWithGTAtLocation(gtGene, hotspot)
+			tumorResults = self.getTumorsMutatedWithGTAtLocation(gtGene, hotspot, cohort)
 			for tumor in tumorResults:
 				mutatedTumors.add(tumor)
 
+		return mutatedTumors
+
+	"""
+	Genome-wide hotspot detection on the position table SM_Positions. Every window of 'windowSize' amino acids that
+	starts at a mutated position is scored against the background of its own gene: with M mutations in the gene and
+	a protein length L (approximated by the highest mutated location of the gene), the number of mutations falling
+	in the window is X ~ Binomial(M, windowSize / L) if they were spread uniformly, and the p-value is P(X >= count).
+	Windows are computed for all genes at once with cumulative sums over the sorted positions, tested with one
+	vectorized binomial tail, corrected with 'benjaminiHochberg', and significant windows that overlap are merged
+	into clusters. Counts are (tumor, position) pairs, so a tumor mutated at two positions of a window counts twice.
+
+	@param windowSize (optional): window length in amino acids
+	@param mutType (optional): mutation type to count (None counts every type)
+	@param minMutations (optional): only report clusters whose windows hold at least this many mutations
+	@param maxFDR (optional): FDR threshold of the windows merged into clusters
+	@return list of (gene name, first aa_loc, last aa_loc, number of mutated positions, mutations in the cluster,
+			mutations in the gene, expected mutations in the best window, p-value, FDR) tuples sorted by p-value,
+			where p-value and FDR are those of the best window of the cluster
+	"""
+	def findHotspotClusters(self, windowSize = 5, mutType = 'nonsynonymous SNV', minMutations = 3, maxFDR = 0.05):
+		import numpy as np
+		from scipy import stats
+
+		if mutType is None:
+			query = "SELECT gene_id, aa_loc, SUM(num_tumors)\
+					 FROM SM_Positions\
+					 WHERE aa_loc > 0\
+					 GROUP BY gene_id, aa_loc\
+					 ORDER BY gene_id, aa_loc"
+			params = []
+		else:
+			query = "SELECT gene_id, aa_loc, num_tumors\
+					 FROM SM_Positions\
+					 WHERE mut_type = %s AND aa_loc > 0\
+					 ORDER BY gene_id, aa_loc"
+			params = [mutType]
+		positions = self.fetchResultTable(query, params, ["gene_id", "aa_loc", "num_tumors"], [np.int64, np.int64, np.int64])
+		if positions is None:
+			return
+		if len(positions) == 0:
+			return []
+		genes, locs, counts = [positions.column(x) for x in ("gene_id", "aa_loc", "num_tumors")]
+
+		#per gene background: mutations in the gene and protein length
+		newGene = np.concatenate(([True], genes[1:] != genes[:-1]))
+		geneStarts = np.flatnonzero(newGene)
+		geneIndex = np.cumsum(newGene) - 1
+		geneTotals = np.add.reduceat(counts, geneStarts)
+		geneLengths = np.maximum(np.maximum.reduceat(locs, geneStarts), windowSize)
+
+		#window counts from cumulative sums; the keys keep windows from running into the next gene
+		keys = genes * (int(locs.max()) + windowSize + 1) + locs
+		cumulative = np.concatenate(([0], np.cumsum(counts)))
+		windowEnds = np.searchsorted(keys, keys + windowSize, side="left")
+		windowCounts = cumulative[windowEnds] - cumulative[:-1]
+
+		totals = geneTotals[geneIndex]
+		probabilities = np.minimum(float(windowSize) / geneLengths[geneIndex], 1.0)
+		pValues = stats.binom.sf(windowCounts - 1, totals, probabilities)
+		qValues = self.benjaminiHochberg(pValues)
+
+		significant = np.flatnonzero((windowCounts >= minMutations) & (qValues <= maxFDR))
+		if len(significant) == 0:
+			return []
+
+		#merge overlapping significant windows: a cluster starts where a window begins after every earlier one ended
+		lastKeys = keys[windowEnds[significant] - 1]
+		reach = np.maximum.accumulate(lastKeys)
+		newCluster = np.concatenate(([True], keys[significant][1:] > reach[:-1]))
+		clusterStarts = np.flatnonzero(newCluster)
+		firstIndex = significant[clusterStarts]
+		endIndex = np.searchsorted(keys, np.maximum.reduceat(lastKeys, clusterStarts), side="right")
+		bestWindow = significant[clusterStarts + np.array([np.argmin(x) for x in np.split(pValues[significant], clusterStarts[1:])], dtype=np.int64)]
+
+		geneNames = self.getGeneNameArray()
+		clusters = []
+		for first, end, best in zip(firstIndex.tolist(), endIndex.tolist(), bestWindow.tolist()):
+			gene = int(genes[first])
+			name = geneNames[gene] if gene < len(geneNames) and geneNames[gene] is not None else str(gene)
+			clusters.append((name, int(locs[first]), int(locs[end - 1]), end - first, int(cumulative[end] - cumulative[first]),
+							 int(totals[first]), float(totals[best] * probabilities[best]), float(pValues[best]), float(qValues[best])))
+		return sorted(clusters, key=lambda x: (x[7], -x[4]))
+
+	"""
+	Given a TCGA driver gene and an integer value 'x' for the top x hotspots,
+	this function first finds the top x hotspots based on somatic mutation frequency,
+	then for each hotspot, it finds the tumors with mutations of the gene at the hotspot.
+	Finally, for each of these tumors, we find the DEGs deemed to be driven by the gtGene
+	in the tumor. These DEGs and their frequency of occurrence are ultimately returned to
+	the user.
+
+	@param gtGene: TCGA gene ID of driver gene of interest
+	@param numHotspots: Integer representing the top 'x' hotspots for the algorithm to look at
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@param compact (optional): return a 'ResultTable' (ge_gene_id, num_tumors) in place of degDict, counted with one
+							   query per chunk of tumors (see 'countTargetsInTumors')
+	@return degDict: dictionary where keys are DEGs and value is the number of tumors (with mutation at a hotspot) have this DEG.
+	@return len(deletionTumors): total number of tumors found with nonsynonymous mutation at one of the 'x' hotspots
+	"""
+	def findDEGsForTumorsAtTopHotspots(self, gtGene, numHotspots, cohort = None, compact = False):
+		mutatedTumors = self.getTumorsAtTopHotspots(gtGene, numHotspots, cohort)
+		if mutatedTumors is None:
+			return
+		if compact:
+			return self.countTargetsInTumors(gtGene, list(mutatedTumors)), len(mutatedTumors)
+
 		degDict = {}
 		for tumor in mutatedTumors:
 			# degQuery = "SELECT DISTINCT(gene_name)\
 			# 			FROM TDI_Results JOIN Genes ON TDI_Results.ge_gene_id = Genes.gene_id\
-			# 			WHERE gt_gene_id = %s AND patient_id = %s" %(geneID, tumor)
+			# 			WHERE gt_gene_id = %s AND patient_id = %s"
 			# try:
-			# 	cursor.execute(degQuery)
+			# 	cursor.execute(degQuery, [geneID, tumor])
 			# 	degList = cursor.fetchall()
 			# except:
 			# 	print "Problem getting DEGs for patient ID: %s" %(tumor)
@@ -1048,30 +2252,78 @@ class TDISQL:
 
 		return degDict, len(mutatedTumors)
 
+	"""
+	Counts, for each target of a driver, the tumors among 'patientIDs' in which the driver drives it, with one grouped
+	query per chunk of patients. Chunks are disjoint so their counts add up.
+
+	@param gtGene: TCGA gene name of the driver
+	@param patientIDs: list of patient IDs
+	@param chunkSize (optional): number of patients bound into each query
+	@return ResultTable (ge_gene_id, num_tumors) sorted by decreasing number of tumors
+	"""
+	def countTargetsInTumors(self, gtGene, patientIDs, chunkSize = BATCH_SIZE):
+		import numpy as np
+
+		cursor = self.db.cursor()
+		geneID = self.getGeneID(gtGene)
+		counts = {}
+		for chunk in self.chunkList(patientIDs, chunkSize):
+			countQuery = "SELECT ge_gene_id, COUNT(DISTINCT(patient_id))\
+						  FROM TDI_Results\
+						  WHERE gt_gene_id = %%s AND patient_id IN (%s)\
+						  GROUP BY ge_gene_id" %(self.placeholderString(len(chunk)))
+			try:
+				cursor.execute(countQuery, [geneID] + list(chunk))
+				for ge, n in cursor.fetchall():
+					counts[ge] = counts.get(ge, 0) + int(n)
+			except:
+				print "Error counting DEGs for a chunk of %s tumors." %(len(chunk))
+				continue
+
+		geneIDs = np.array(counts.keys(), dtype=np.int32)
+		numTumors = np.array(counts.values(), dtype=np.int32)
+		order = np.argsort(-numTumors, kind="mergesort")
+		return ResultTable(["ge_gene_id", "num_tumors"], [geneIDs[order], numTumors[order]], self.getGeneNameArray(), ("ge_gene_id",))
+
 	"""
 	Given a TCGA gene, this function finds the patients (tumors) in the
-	SCNA table that have a deletion of the gene, then, for each patient,
-	gets the DEGs found to be regulated by the deletion.
+	SCNA table that have a deletion of the gene (gistic_score = -2).
 
 	@param gtGene: TCGA gene ID
-	@return degDict: dictionary where keys are DEGs and value is the number of tumors (with deletion of gtGene) have this DEG.
-	@return len(deletionTumors): total number of tumors found with deletion of gtGene in SCNA table
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return deletionTumors: list of patient IDs with a deletion of gtGene in the SCNA table
 	"""
-	def findDEGsWithDeletion(self, gtGene):
+	def getTumorsWithDeletion(self, gtGene, cohort = None):
 		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
 
 		geneID = self.getGeneID(gtGene)
 		deletionTumorsQuery = "SELECT DISTINCT(patient_id)\
 							   FROM SCNAs\
-							   WHERE gene_id = %s AND gistic_score = -2" %(geneID)
+							   WHERE gene_id = %%s AND gistic_score = -2%s" %(cohortSQL)
 		try:
-			cursor.execute(deletionTumorsQuery)
+			cursor.execute(deletionTumorsQuery, [geneID] + cohortParams)
 			deletionTumors = cursor.fetchall()
-			deletionTumors = [x[0] for x in deletionTumors]
+			return [x[0] for x in deletionTumors]
 		except:
 			print "Error retrieving tumors with deletion for gene %s." %(gtGene)
 			return
 
+	"""
+	Given a TCGA gene, this function finds the patients (tumors) in the
+	SCNA table that have a deletion of the gene, then, for each patient,
+	gets the DEGs found to be regulated by the deletion.
+
+	@param gtGene: TCGA gene ID
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return degDict: dictionary where keys are DEGs and value is the number of tumors (with deletion of gtGene) have this DEG.
+	@return len(deletionTumors): total number of tumors found with deletion of gtGene in SCNA table
+	"""
+	def findDEGsWithDeletion(self, gtGene, cohort = None):
+		deletionTumors = self.getTumorsWithDeletion(gtGene, cohort)
+		if deletionTumors is None:
+			return
+
 		#degSet = set()
 		degDict = {}
 		for tumor in deletionTumors:
@@ -1084,8 +2336,1498 @@ class TDISQL:
 
 		return degDict, len(deletionTumors)
 
+	"""
+	Benjamini-Hochberg false discovery rate for a NumPy array of p-values.
+
+	@param pValues: NumPy array of p-values
+	@return NumPy array of FDR adjusted p-values (q-values) in the same order as 'pValues'
+	"""
+	@staticmethod
+	def benjaminiHochberg(pValues):
+		import numpy as np
+
+		pValues = np.asarray(pValues, dtype=np.float64)
+		m = len(pValues)
+		if m == 0:
+			return pValues
+		order = np.argsort(pValues)
+		ranked = pValues[order] * m / np.arange(1, m + 1, dtype=np.float64)
+		ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+		qValues = np.empty(m)
+		qValues[order] = np.minimum(ranked, 1.0)
+		return qValues
+
+	"""
+	Computes the enrichment of every target gene in a subset of tumors with one set of grouped queries
+	and vectorized hypergeometric tests. For each target, 'k' is the number of subset tumors in which it is
+	found as a target in TDI_Results and 'K' the number of background tumors in which it is. The p-value is
+	P(X >= k) for X ~ Hypergeom(N, K, n), which is the one-sided Fisher exact test of the subset against the
+	rest of the background. N is the number of background tumors and n the number of subset tumors in the
+	background. If gtGene is given, only targets of gtGene are counted and the background is the tumors with
+	gtGene as a driver; otherwise every driver is counted and the background is every tumor in TDI_Results.
+	If a cohort is given, the background is further restricted to the tumors in the cohort.
+
+	@param patientList: Python list of patient IDs, or a NumPy boolean array indexed by patient ID
+	@param gtGene (optional): TCGA gene name of the driver whose targets are tested
+	@param minNumberOfTumors (optional): only report targets found in at least this many subset tumors
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return list of (target gene name, k, K, p-value, FDR) tuples sorted by p-value
+	"""
+	def findEnrichedTargets(self, patientList, gtGene = None, minNumberOfTumors = 1, cohort = None):
+		import numpy as np
+		from scipy import stats
+
+		cursor = self.db.cursor()
+
+		if hasattr(patientList, "dtype") and patientList.dtype == np.bool_:
+			patientList = np.flatnonzero(patientList)
+		patientList = sorted(set(int(x) for x in patientList))
+
+		backgroundFilter = ""
+		params = []
+		if gtGene is not None:
+			geneID = self.getGeneID(gtGene)
+			if geneID == "null":
+				return
+			backgroundFilter = " AND gt_gene_id = %s"
+			params = [geneID]
+
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
+		backgroundFilter += cohortSQL
+		params += cohortParams
+
+		backgroundQuery = "SELECT ge_gene_id, COUNT(DISTINCT(patient_id))\
+						   FROM TDI_Results\
+						   WHERE ge_gene_id IS NOT NULL%s\
+						   GROUP BY ge_gene_id\
+						   ORDER BY ge_gene_id" %(backgroundFilter)
+		populationQuery = "SELECT COUNT(DISTINCT(patient_id))\
+						   FROM TDI_Results\
+						   WHERE ge_gene_id IS NOT NULL%s" %(backgroundFilter)
+		try:
+			cursor.execute(backgroundQuery, params)
+			background = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+			cursor.execute(populationQuery, params)
+			N = int(cursor.fetchall()[0][0])
+		except:
+			print "Error retrieving background target counts from TDI_Results."
+			print backgroundQuery
+			return
+
+		if len(background) == 0:
+			return []
+
+		#sorted by target ID for the searchsorted lookup of the subset counts
+		targetIDs = background[:, 0]
+		K = background[:, 1]
+		k = np.zeros(len(targetIDs), dtype=np.int64)
+		n = 0
+
+		for chunk in self.chunkList(patientList, self.BATCH_SIZE):
+			subsetFilter = "%s AND patient_id IN (%s)" %(backgroundFilter, self.placeholderString(len(chunk)))
+			subsetQuery = "SELECT ge_gene_id, COUNT(DISTINCT(patient_id))\
+						   FROM TDI_Results\
+						   WHERE ge_gene_id IS NOT NULL%s\
+						   GROUP BY ge_gene_id" %(subsetFilter)
+			sizeQuery = "SELECT COUNT(DISTINCT(patient_id))\
+						 FROM TDI_Results\
+						 WHERE ge_gene_id IS NOT NULL%s" %(subsetFilter)
+			try:
+				cursor.execute(subsetQuery, params + chunk)
+				counts = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+				cursor.execute(sizeQuery, params + chunk)
+				n += int(cursor.fetchall()[0][0])
+			except:
+				print "Error retrieving target counts for a chunk of %s patients." %(len(chunk))
+				print subsetQuery
+				return
+			k[np.searchsorted(targetIDs, counts[:, 0])] += counts[:, 1]
+
+		pValues = stats.hypergeom.sf(k - 1, N, K, n)
+		qValues = self.benjaminiHochberg(pValues)
+
+		keep = np.flatnonzero(k >= max(minNumberOfTumors, 1))
+		keep = keep[np.lexsort((-k[keep], pValues[keep]))]
+
+		geneNames = {}
+		ids = [int(x) for x in targetIDs[keep]]
+		for chunk in self.chunkList(ids, self.BATCH_SIZE):
+			nameQuery = "SELECT gene_id, gene_name\
+						 FROM Genes\
+						 WHERE gene_id IN (%s)" %(self.placeholderString(len(chunk)))
+			cursor.execute(nameQuery, chunk)
+			for tup in cursor.fetchall():
+				geneNames[int(tup[0])] = tup[1]
+
+		return [(geneNames.get(int(targetIDs[i]), str(targetIDs[i])), int(k[i]), int(K[i]), float(pValues[i]), float(qValues[i])) for i in keep]
+
+	"""
+	Enrichment version of 'findDEGsForTumorsAtTopHotspots'. Tests the targets of gtGene in the tumors mutated at one of
+	its top 'x' hotspots against every tumor with gtGene as a driver.
+
+	@param gtGene: TCGA gene ID of driver gene of interest
+	@param numHotspots: Integer representing the top 'x' hotspots for the algorithm to look at
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return list of (target gene name, k, K, p-value, FDR) tuples sorted by p-value, as returned by 'findEnrichedTargets'
+	"""
+	def findEnrichedDEGsForTumorsAtTopHotspots(self, gtGene, numHotspots, cohort = None):
+		mutatedTumors = self.getTumorsAtTopHotspots(gtGene, numHotspots, cohort)
+		if mutatedTumors is None:
+			return
+		return self.findEnrichedTargets(list(mutatedTumors), gtGene, cohort = cohort)
+
+	"""
+	Enrichment version of 'findDEGsWithDeletion'. Tests the targets of gtGene in the tumors with a deletion of gtGene
+	against every tumor with gtGene as a driver.
+
+	@param gtGene: TCGA gene ID
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return list of (target gene name, k, K, p-value, FDR) tuples sorted by p-value, as returned by 'findEnrichedTargets'
+	"""
+	def findEnrichedDEGsWithDeletion(self, gtGene, cohort = None):
+		deletionTumors = self.getTumorsWithDeletion(gtGene, cohort)
+		if deletionTumors is None:
+			return
+		return self.findEnrichedTargets(deletionTumors, gtGene, cohort = cohort)
+
+	"""
+	Returns the SQL for a (patient_id, gene_id) alteration source shared by 'buildAlterationMatrix' and 'exportFeatureMatrix'.
+	The sources are:
+		'tdi': genes called as drivers by the TDI algorithm (TDI_Results)
+		'sm': genes with a somatic mutation (Somatic_Mutations)
+		'scna': genes with a deep deletion or amplification, |gistic_score| = 2 (SCNAs)
+		'sga': union of 'sm' and 'scna'
+		'deg': differentially expressed genes (DEGs)
+
+	@param source: one of 'tdi', 'sm', 'scna', 'sga' or 'deg'
+	@param expID (optional): experiment ID to restrict TDI_Results to (only used with the 'tdi' source)
+	@param platform (optional): Exp_Platforms.platform name to restrict SCNAs and DEGs to
+	@return (sourceQuery, params): SQL selecting (patient_id, gene_id) rows and the parameters it is bound with
+	"""
+	def alterationSourceQuery(self, source, expID = None, platform = None):
+		expFilter = ""
+		expParams = []
+		if expID is not None:
+			expFilter = " AND exp_id = %s"
+			expParams = [expID]
+
+		platformFilter = ""
+		platformParams = []
+		if platform is not None:
+			platformFilter = " AND platform_id IN (SELECT platform_id FROM Exp_Platforms WHERE platform = %s)"
+			platformParams = [platform]
+
+		sources = {
+			'tdi': [("SELECT patient_id, gt_gene_id AS gene_id FROM TDI_Results WHERE gt_gene_id IS NOT NULL" + expFilter, expParams)],
+			'sm': [("SELECT patient_id, gene_id FROM Somatic_Mutations WHERE gene_id IS NOT NULL", [])],
+			'scna': [("SELECT patient_id, gene_id FROM SCNAs WHERE gistic_score IN (-2, 2)" + platformFilter, platformParams)],
+			'deg': [("SELECT patient_id, gene_id FROM DEGs WHERE gene_id IS NOT NULL" + platformFilter, platformParams)],
+		}
+		sources['sga'] = sources['sm'] + sources['scna']
+
+		if source not in sources:
+			print "Error with source argument. Please ensure that the given 'source' argument is one of 'tdi', 'sm', 'scna', 'sga' or 'deg'."
+			return
+
+		sourceQuery = " UNION ".join([x[0] for x in sources[source]])
+		params = []
+		for x in sources[source]:
+			params += x[1]
+		return sourceQuery, params
+
+	"""
+	Builds the binary patient x gene alteration matrix used by 'findMutualExclusivity'. The alterations come from
+	one of the sources described in 'alterationSourceQuery'.
+
+	@param source (optional): one of 'tdi', 'sm', 'scna', 'sga' or 'deg'
+	@param geneList (optional): Python list of TCGA gene names to restrict the columns to. Default is every altered gene.
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@param expID (optional): experiment ID to restrict TDI_Results to (only used with the 'tdi' source)
+	@param minNumberOfTumors (optional): only keep genes altered in at least this many tumors
+	@return (alterations, patientIDs, geneNames, numPatients): scipy.sparse CSC matrix with one row per altered patient and
+			one column per gene, the labels of its rows and columns, and the number of patients in the source under the
+			given filters (including patients with none of the selected genes altered)
+	"""
+	def buildAlterationMatrix(self, source = 'tdi', geneList = None, cohort = None, expID = None, minNumberOfTumors = 1):
+		import numpy as np
+		from scipy import sparse
+
+		cursor = self.db.cursor()
+
+		source = self.alterationSourceQuery(source, expID)
+		if source is None:
+			return
+		sourceQuery, params = source
+
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "Alterations.patient_id")
+		params += cohortParams
+
+		populationQuery = "SELECT COUNT(DISTINCT(Alterations.patient_id))\
+						   FROM (%s) AS Alterations\
+						   WHERE 1 = 1%s" %(sourceQuery, cohortSQL)
+		try:
+			cursor.execute(populationQuery, params)
+			numPatients = int(cursor.fetchall()[0][0])
+		except:
+			print "Error counting patients for alteration matrix."
+			print populationQuery
+			return
+
+		if geneList is None:
+			chunks = [None]
+		else:
+			chunks = list(self.chunkList(self.getGeneIDs(geneList).values(), self.BATCH_SIZE))
+
+		pairs = []
+		for chunk in chunks:
+			geneFilter = ""
+			chunkParams = list(params)
+			if chunk is not None:
+				geneFilter = " AND Alterations.gene_id IN (%s)" %(self.placeholderString(len(chunk)))
+				chunkParams += chunk
+
+			alterationQuery = "SELECT DISTINCT Alterations.patient_id, Alterations.gene_id\
+							   FROM (%s) AS Alterations\
+							   WHERE 1 = 1%s%s" %(sourceQuery, cohortSQL, geneFilter)
+			try:
+				cursor.execute(alterationQuery, chunkParams)
+				pairs.extend(cursor.fetchall())
+			except:
+				print "Error building alteration matrix."
+				print alterationQuery
+				return
+
+		if len(pairs) == 0:
+			return sparse.csc_matrix((0, 0), dtype=np.int32), [], [], numPatients
+
+		pairs = np.array(pairs, dtype=np.int64)
+		patientIDs, rows = np.unique(pairs[:, 0], return_inverse=True)
+		geneIDs, cols = np.unique(pairs[:, 1], return_inverse=True)
+		alterations = sparse.csc_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(patientIDs), len(geneIDs)))
+
+		frequent = np.flatnonzero(np.asarray(alterations.sum(axis=0)).ravel() >= minNumberOfTumors)
+		alterations = alterations[:, frequent]
+		geneIDs = geneIDs[frequent]
+
+		geneNames = {}
+		for chunk in self.chunkList([int(x) for x in geneIDs], self.BATCH_SIZE):
+			nameQuery = "SELECT gene_id, gene_name\
+						 FROM Genes\
+						 WHERE gene_id IN (%s)" %(self.placeholderString(len(chunk)))
+			cursor.execute(nameQuery, chunk)
+			for tup in cursor.fetchall():
+				geneNames[int(tup[0])] = tup[1]
+
+		return alterations, [int(x) for x in patientIDs], [geneNames.get(int(x), str(x)) for x in geneIDs], numPatients
+
+	"""
+	Finds pairs of genes whose alterations are mutually exclusive or co-occur across tumors. Builds a patient x gene
+	alteration matrix (see 'buildAlterationMatrix'), counts the tumors altered in both genes of every pair with a sparse
+	matrix product one block of genes at a time, and scores each pair with one-sided Fisher exact tests: P(both <= observed)
+	for exclusivity and P(both >= observed) for co-occurrence. Only one block x genes slice of the gene x gene counts is held
+	in memory at a time, or one per process with 'numProcesses' > 1, where the blocks are scored in rounds of one block
+	per process.
+
+	@param source (optional): one of 'tdi', 'sm', 'scna', 'sga' or 'deg', as in 'alterationSourceQuery'
+	@param geneList (optional): Python list of TCGA gene names to test. Default is every gene altered in at least 'minNumberOfTumors' tumors.
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@param expID (optional): experiment ID to restrict TDI_Results to
+	@param minNumberOfTumors (optional): only test genes altered in at least this many tumors
+	@param numProcesses (optional): number of worker processes used to score the pairs
+	@param blockSize (optional): number of genes paired against every later gene per block. With several processes it is
+								 lowered so that each process gets a few blocks.
+	@return list of (gene 1, gene 2, tumors with both, tumors with gene 1, tumors with gene 2, exclusivity p-value, exclusivity FDR,
+			co-occurrence p-value, co-occurrence FDR) tuples sorted by exclusivity p-value
+	"""
+	def findMutualExclusivity(self, source = 'tdi', geneList = None, cohort = None, expID = None, minNumberOfTumors = 5, numProcesses = 1, blockSize = 256):
+		import numpy as np
+
+		built = self.buildAlterationMatrix(source, geneList, cohort, expID, minNumberOfTumors)
+		if built is None:
+			return
+		alterations, patientIDs, geneNames, numPatients = built
+
+		numGenes = len(geneNames)
+		if numGenes < 2:
+			return []
+
+		counts = np.asarray(alterations.sum(axis=0)).ravel().astype(np.int64)
+		alterationsT = alterations.T.tocsr()
+		if numProcesses > 1:
+			blockSize = min(blockSize, int(np.ceil(numGenes / (4.0 * numProcesses))))
+		blockSize = max(blockSize, 1)
+
+		#gene indices and shared counts of every pair, collected as the blocks are built
+		pairRows = []
+		pairCols = []
+		pairBoth = []
+		def buildBlocks():
+			for start in range(0, numGenes - 1, blockSize):
+				end = min(start + blockSize, numGenes)
+				both = (alterationsT[start:end] * alterations[:, start:]).toarray()
+				#pairs (i, j) with i in the block and j > i, as indices into the block x (later genes) slice
+				rows, cols = np.triu_indices(end - start, 1, numGenes - start)
+				both = both[rows, cols].astype(np.int64)
+				rows = (rows + start).astype(np.int32)
+				cols = (cols + start).astype(np.int32)
+				pairRows.append(rows)
+				pairCols.append(cols)
+				pairBoth.append(both.astype(np.int32))
+				yield (both, counts[rows], counts[cols], numPatients)
+
+		if numProcesses > 1:
+			import itertools
+			import multiprocessing
+			#the pool is fed one round of 'numProcesses' blocks at a time, so only that many count slices exist at once
+			pool = multiprocessing.Pool(numProcesses)
+			blocks = buildBlocks()
+			scored = []
+			try:
+				while True:
+					window = list(itertools.islice(blocks, numProcesses))
+					if len(window) == 0:
+						break
+					scored.extend(pool.map(scoreExclusivityBlock, window))
+					del window
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			scored = [scoreExclusivityBlock(block) for block in buildBlocks()]
+
+		rows = np.concatenate(pairRows)
+		cols = np.concatenate(pairCols)
+		both = np.concatenate(pairBoth)
+		pExclusive = np.concatenate([x[0] for x in scored])
+		pCooccur = np.concatenate([x[1] for x in scored])
+		qExclusive = self.benjaminiHochberg(pExclusive)
+		qCooccur = self.benjaminiHochberg(pCooccur)
+
+		order = np.lexsort((pCooccur, pExclusive))
+		return [(geneNames[rows[i]], geneNames[cols[i]], int(both[i]), int(counts[rows[i]]), int(counts[cols[i]]),
+				 float(pExclusive[i]), float(qExclusive[i]), float(pCooccur[i]), float(qCooccur[i])) for i in order]
+
+	"""
+	Looks up the patient IDs for a Python list of patient names (Patients.name), one query per chunk.
+
+	@param patientNames: Python list of patient names
+	@return patientIDs: dictionary where keys are patient names and values are patient IDs. Patients not in the database are left out.
+	"""
+	def getPatientIDs(self, patientNames):
+		cursor = self.db.cursor()
+		patientIDs = {}
+
+		for chunk in self.chunkList(list(set(patientNames)), self.BATCH_SIZE):
+			query = "SELECT name, patient_id\
+					 FROM Patients\
+					 WHERE name IN (%s)" %(self.placeholderString(len(chunk)))
+			try:
+				cursor.execute(query, chunk)
+				for tup in cursor.fetchall():
+					patientIDs[tup[0]] = int(tup[1])
+			except:
+				print "Error finding patient ids for a chunk of %s patients. Skipping." %(len(chunk))
+				continue
+
+		return patientIDs
+
+	"""
+	Exports a binary patient x gene matrix (the SGA and DEG inputs of the TDI algorithm) for one of the sources described in
+	'alterationSourceQuery'. Rows are streamed from the server with a server-side cursor and only the nonzero (row, column)
+	indices are kept on the client, so memory is bounded by the number of alterations rather than the size of the dense matrix.
+
+	The output formats are:
+		'csv': dense matrix with a header line of gene names and the patient name as first column
+		'npy': dense int8 NumPy array written through a memory map
+		'npz': scipy.sparse CSR matrix saved with 'scipy.sparse.save_npz'
+	For 'npy' and 'npz' the row and column labels are written to '<outputFile base>.patients.txt' and '<outputFile base>.genes.txt'.
+
+	@param source: one of 'tdi', 'sm', 'scna', 'sga' or 'deg'
+	@param outputFile: path of the file to write
+	@param outputFormat (optional): one of 'csv', 'npy' or 'npz'
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the rows to (see 'cohortFilter')
+	@param platform (optional): Exp_Platforms.platform name to restrict SCNAs and DEGs to
+	@param expID (optional): experiment ID to restrict TDI_Results to
+	@param patientOrder (optional): Python list of patient names fixing the rows. Default is every patient in the cohort sorted by name.
+	@param geneOrder (optional): Python list of gene names fixing the columns. Default is every gene in the source sorted by name.
+	@param delimiter (optional): column delimiter for the 'csv' format (one-byte delimiters take a vectorized fast path)
+	@param fetchSize (optional): number of rows fetched from the server at a time
+	@return (number of rows, number of columns, number of nonzero entries)
+	"""
+	def exportFeatureMatrix(self, source, outputFile, outputFormat = 'csv', cohort = None, platform = None, expID = None, patientOrder = None, geneOrder = None, delimiter = ",", fetchSize = 100000):
+		import os
+		import numpy as np
+		from scipy import sparse
+
+		if outputFormat not in ('csv', 'npy', 'npz'):
+			print "Error with outputFormat argument. Please ensure that it is one of 'csv', 'npy' or 'npz'."
+			return
+
+		built = self.alterationSourceQuery(source, expID, platform)
+		if built is None:
+			return
+		sourceQuery, params = built
+
+		cursor = self.db.cursor()
+
+		#fix the row order
+		if patientOrder is None:
+			cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
+			patientQuery = "SELECT patient_id, name\
+							FROM Patients\
+							WHERE 1 = 1%s\
+							ORDER BY name" %(cohortSQL)
+			try:
+				cursor.execute(patientQuery, cohortParams)
+				patients = [(int(x[0]), x[1]) for x in cursor.fetchall()]
+			except:
+				print "Error retrieving patients for feature matrix."
+				print patientQuery
+				return
+		else:
+			patientIDs = self.getPatientIDs(patientOrder)
+			patients = [(patientIDs.get(name, -1), name) for name in patientOrder]
+
+		#fix the column order
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "Alterations.patient_id")
+		if geneOrder is None:
+			geneQuery = "SELECT DISTINCT Genes.gene_id, gene_name\
+						 FROM (%s) AS Alterations JOIN Genes ON Genes.gene_id = Alterations.gene_id\
+						 WHERE 1 = 1%s\
+						 ORDER BY gene_name" %(sourceQuery, cohortSQL)
+			try:
+				cursor.execute(geneQuery, params + cohortParams)
+				genes = [(int(x[0]), x[1]) for x in cursor.fetchall()]
+			except:
+				print "Error retrieving genes for feature matrix."
+				print geneQuery
+				return
+		else:
+			geneIDs = self.getGeneIDs(geneOrder)
+			genes = [(geneIDs.get(name, -1), name) for name in geneOrder]
+
+		#map database IDs to matrix rows and columns
+		rowIndex = np.full(max([x[0] for x in patients] + [0]) + 1, -1, dtype=np.int64)
+		for i in range(len(patients)):
+			if patients[i][0] >= 0:
+				rowIndex[patients[i][0]] = i
+		colIndex = np.full(max([x[0] for x in genes] + [0]) + 1, -1, dtype=np.int64)
+		for j in range(len(genes)):
+			if genes[j][0] >= 0:
+				colIndex[genes[j][0]] = j
+
+		#stream the alterations with a server-side cursor
+		streamQuery = "SELECT Alterations.patient_id, Alterations.gene_id\
+					   FROM (%s) AS Alterations\
+					   WHERE 1 = 1%s" %(sourceQuery, cohortSQL)
+		rows = []
+		cols = []
+		streamCursor = self.backend.streamingCursor(self.db)
+		try:
+			streamCursor.execute(streamQuery, params + cohortParams)
+			while True:
+				fetched = streamCursor.fetchmany(fetchSize)
+				if not fetched:
+					break
+				fetched = np.array(fetched, dtype=np.int64).reshape(-1, 2)
+				fetched = fetched[(fetched[:, 0] < len(rowIndex)) & (fetched[:, 1] < len(colIndex))]
+				r = rowIndex[fetched[:, 0]]
+				c = colIndex[fetched[:, 1]]
+				keep = (r >= 0) & (c >= 0)
+				rows.append(r[keep].astype(np.int32))
+				cols.append(c[keep].astype(np.int32))
+		except:
+			print "Error streaming rows for feature matrix."
+			print streamQuery
+			return
+		finally:
+			streamCursor.close()
+
+		rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype=np.int32)
+		cols = np.concatenate(cols) if len(cols) > 0 else np.zeros(0, dtype=np.int32)
+		matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(len(patients), len(genes)))
+		matrix.sum_duplicates()
+		matrix.data[:] = 1
+
+		blockSize = max(1, 10000000 // max(len(genes), 1))
+		if outputFormat == 'csv':
+			out = open(outputFile, "w")
+			out.write(delimiter.join(["patient"] + [x[1] for x in genes]) + "\n")
+			separators = np.empty(2 * len(genes), dtype=np.uint8)
+			cells = np.array(["0", "1"])
+			for start in range(0, len(patients), blockSize):
+				block = matrix[start:start + blockSize].toarray()
+				for i in range(block.shape[0]):
+					if len(genes) == 0:
+						out.write(patients[start + i][1] + "\n")
+					elif len(delimiter) == 1:
+						#write '0'/'1' characters interleaved with the one-byte delimiter in one vectorized step
+						separators[0::2] = block[i] + ord("0")
+						separators[1::2] = ord(delimiter)
+						separators[-1] = ord("\n")
+						out.write(patients[start + i][1] + delimiter + separators.tostring())
+					else:
+						out.write(patients[start + i][1] + delimiter + delimiter.join(cells[block[i]]) + "\n")
+			out.close()
+		else:
+			base = os.path.splitext(outputFile)[0]
+			if outputFormat == 'npy':
+				dense = np.lib.format.open_memmap(outputFile, mode='w+', dtype=np.int8, shape=matrix.shape)
+				for start in range(0, len(patients), blockSize):
+					dense[start:start + blockSize] = matrix[start:start + blockSize].toarray()
+				dense.flush()
+				del dense
+			else:
+				sparse.save_npz(outputFile, matrix)
+
+			labelFile = open(base + ".patients.txt", "w")
+			labelFile.write("\n".join([x[1] for x in patients]) + "\n")
+			labelFile.close()
+			labelFile = open(base + ".genes.txt", "w")
+			labelFile.write("\n".join([x[1] for x in genes]) + "\n")
+			labelFile.close()
+
+		return matrix.shape[0], matrix.shape[1], matrix.nnz
+
+	"""
+	Splits a list into consecutive chunks of at most 'chunkSize' elements. Used by the
+	batch query functions so that 'IN (...)' lists stay below the server's packet and
+	placeholder limits no matter how long the input list is.
+
+	@param items: Python list to split
+	@param chunkSize: maximum number of elements per chunk
+	@return generator yielding lists of at most 'chunkSize' elements
+	"""
+	@staticmethod
+	def chunkList(items, chunkSize):
+		for i in range(0, len(items), chunkSize):
+			yield items[i:i + chunkSize]
+
+	"""
+	Returns a comma separated string of 'n' bound parameter placeholders for an 'IN (...)' clause.
+	"""
+	@staticmethod
+	def placeholderString(n):
+		return ",".join(["%s"] * n)
+
+	"""
+	Builds the SQL that restricts a query to a cohort of tumors. A cohort is either a cancer type abbreviation
+	(Cancer_Types.abbv), which is resolved on the server through the indexed Patients.cancer_type_id column,
+	or an explicit Python list of patient IDs or patient names.
+
+	@param cohort: cancer type abbreviation, Python list of patients, or None for no restriction
+	@param patientColumn: the patient_id column of the query being restricted (e.g. "TDI_Results.patient_id")
+	@return (cohortSQL, cohortParams): an ' AND ...' clause to append to the query's WHERE clause and its bound parameters
+	"""
+	def cohortFilter(self, cohort, patientColumn):
+		if cohort is None:
+			return "", []
+
+		if isinstance(cohort, basestring):
+			cohortSQL = " AND %s IN (SELECT Patients.patient_id\
+									 FROM Patients JOIN Cancer_Types ON Cancer_Types.cancer_type_id = Patients.cancer_type_id\
+									 WHERE Cancer_Types.abbv = %%s)" %(patientColumn)
+			return cohortSQL, [cohort]
+
+		patients = list(cohort)
+		names = [x for x in patients if isinstance(x, basestring)]
+		if len(names) > 0:
+			patientIDs = self.getPatientIDs(names)
+			patients = [x for x in patients if not isinstance(x, basestring)] + patientIDs.values()
+		patients = sorted(set(int(x) for x in patients))
+
+		if len(patients) == 0:
+			return " AND 1 = 0", []
+		return " AND %s IN (%s)" %(patientColumn, self.placeholderString(len(patients))), patients
+
+	"""
+	Given a Python list of TCGA gene names, return the corresponding geneIDs from the 'Genes' table
+	using one query per chunk instead of one query per gene.
+
+	@param geneList: Python list of TCGA gene names
+	@param chunkSize (optional): maximum number of genes looked up per query
+	@return geneIDs: dictionary where keys are gene names and values are gene IDs. Genes not in the database are left out.
+	"""
+	def getGeneIDs(self, geneList, chunkSize = BATCH_SIZE):
+		cursor = self.db.cursor()
+		geneIDs = {}
+		geneList = list(set(geneList))
+
+		for chunk in self.chunkList(geneList, chunkSize):
+			query = "SELECT gene_name, gene_id\
+					 FROM Genes\
+					 WHERE gene_name IN (%s)" %(self.placeholderString(len(chunk)))
+			try:
+				cursor.execute(query, chunk)
+				for tup in cursor.fetchall():
+					geneIDs[tup[0]] = int(tup[1])
+			except:
+				print "Error finding gene ids for a chunk of %s genes. Skipping." %(len(chunk))
+				continue
+
+		missing = [g for g in geneList if g not in geneIDs]
+		if len(missing) > 0:
+			print "Could not find %s of the given genes in the database (e.g. %s)." %(len(missing), ", ".join(missing[:5]))
+
+		return geneIDs
+
+	"""
+	Batch version of 'findTumorsWithGT'. Finds all tumors (patients) for each of the given
+	driver genes with one grouped query per chunk of genes.
+
+	@param gtGenes: Python list of TCGA driver gene names
+	@param mutType (optional): 'all', 'syn' or 'nonsyn', as in 'findTumorsWithGT'
+	@param chunkSize (optional): maximum number of genes per query
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return tumorDict: dictionary where keys are driver gene names and values are lists of patient IDs
+	"""
+	def findTumorsWithGTs(self, gtGenes, mutType = 'all', chunkSize = BATCH_SIZE, cohort = None):
+		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "TDI_Results.patient_id")
+
+		if mutType != 'all' and mutType != 'syn' and mutType != 'nonsyn':
+			print "Error with type argument, proceeding to find all tumors. Please ensure that the given 'mutType' argument\
+					is either 'all', 'syn', or 'nonsyn'."
+			mutType = 'all'
+
+		geneIDs = self.getGeneIDs(gtGenes, chunkSize)
+		idToName = dict((v, k) for k, v in geneIDs.items())
+		tumorDict = dict((gene, []) for gene in geneIDs)
+
+		for chunk in self.chunkList(idToName.keys(), chunkSize):
+			if mutType == 'all':
+				query = "SELECT DISTINCT gt_gene_id, patient_id\
+						 FROM TDI_Results\
+						 WHERE gt_gene_id IN (%s)%s" %(self.placeholderString(len(chunk)), cohortSQL)
+				params = chunk + cohortParams
+			else:
+				query = "SELECT DISTINCT TDI_Results.gt_gene_id, TDI_Results.patient_id\
+						 FROM TDI_Results JOIN Somatic_Mutations ON Somatic_Mutations.patient_id = TDI_Results.patient_id AND Somatic_Mutations.gene_id = TDI_Results.gt_gene_id\
+						 WHERE TDI_Results.gt_gene_id IN (%s) AND Somatic_Mutations.mut_type = %%s%s" %(self.placeholderString(len(chunk)), cohortSQL)
+				if mutType == 'syn':
+					params = chunk + ['synonymous SNV'] + cohortParams
+				else:
+					params = chunk + ['nonsynonymous SNV'] + cohortParams
+
+			try:
+				cursor.execute(query, params)
+				for tup in cursor.fetchall():
+					tumorDict[idToName[int(tup[0])]].append(tup[1])
+			except:
+				print "Error. Unable to process batch query for a chunk of %s genes." %(len(chunk))
+				print query
+				continue
+
+		return tumorDict
+
+	"""
+	Batch version of 'findDriversForGene'. For each of the given target genes, find all driver genes that
+	drive the target gene in more than 'minNumberOfTumors' tumors, using one grouped query per chunk of targets.
+
+	@param targetGenes: Python list of TCGA gene names for target genes of interest
+	@param minNumberOfTumors (optional): the minimum number of tumors for a driver-target interaction to be reported
+	@param chunkSize (optional): maximum number of genes per query
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the tumors to (see 'cohortFilter')
+	@return driverDict: dictionary where keys are target gene names and values are lists of (driver gene name, number of tumors)
+						tuples sorted by number of tumors, as returned by 'findDriversForGene'
+	"""
+	def findDriversForGenes(self, targetGenes, minNumberOfTumors = 0, chunkSize = BATCH_SIZE, cohort = None):
+		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
+
+		geneIDs = self.getGeneIDs(targetGenes, chunkSize)
+		idToName = dict((v, k) for k, v in geneIDs.items())
+		driverDict = dict((gene, []) for gene in geneIDs)
+
+		for chunk in self.chunkList(idToName.keys(), chunkSize):
+			query = "SELECT ge_gene_id, gene_name, COUNT(DISTINCT(patient_id)) AS num_tumors\
+					 FROM TDI_Results JOIN Genes ON TDI_Results.gt_gene_id = Genes.gene_id\
+					 WHERE ge_gene_id IN (%s)%s\
+					 GROUP BY ge_gene_id, gt_gene_id\
+					 HAVING num_tumors > %%s" %(self.placeholderString(len(chunk)), cohortSQL)
+			try:
+				cursor.execute(query, chunk + cohortParams + [minNumberOfTumors])
+				for tup in cursor.fetchall():
+					driverDict[idToName[int(tup[0])]].append((tup[1], int(tup[2])))
+			except:
+				print "Could not execute batch query to find driver genes for a chunk of %s genes." %(len(chunk))
+				print query
+				continue
+
+		for gene in driverDict:
+			driverDict[gene] = sorted(driverDict[gene], key=lambda x: x[1], reverse = True)
+
+		return driverDict
+
+	"""
+	Batch version of 'findDEGsWithDeletion'. For each of the given genes, finds the tumors with a deletion
+	of the gene (gistic_score = -2) and counts, per DEG, the number of those tumors in which the deletion
+	was found to drive the DEG. All genes in a chunk are answered by two grouped queries.
+
+	@param gtGenes: Python list of TCGA gene names
+	@param chunkSize (optional): maximum number of genes per query
+	@param cohort (optional): cancer type abbreviation or list of patients to restrict the deletion tumors to (see 'cohortFilter')
+	@return deletionDict: dictionary where keys are gene names and values are (degDict, number of deletion tumors)
+						  tuples, as returned by 'findDEGsWithDeletion'
+	"""
+	def findDEGsWithDeletions(self, gtGenes, chunkSize = BATCH_SIZE, cohort = None):
+		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "SCNAs.patient_id")
+
+		geneIDs = self.getGeneIDs(gtGenes, chunkSize)
+		idToName = dict((v, k) for k, v in geneIDs.items())
+		degDicts = dict((gene, {}) for gene in geneIDs)
+		tumorCounts = dict((gene, 0) for gene in geneIDs)
+
+		for chunk in self.chunkList(idToName.keys(), chunkSize):
+			countQuery = "SELECT gene_id, COUNT(DISTINCT(patient_id))\
+						  FROM SCNAs\
+						  WHERE gene_id IN (%s) AND gistic_score = -2%s\
+						  GROUP BY gene_id" %(self.placeholderString(len(chunk)), cohortSQL)
+
+			degQuery = "SELECT SCNAs.gene_id, gene_name, COUNT(DISTINCT(SCNAs.patient_id))\
+						FROM SCNAs JOIN TDI_Results ON TDI_Results.patient_id = SCNAs.patient_id AND TDI_Results.gt_gene_id = SCNAs.gene_id\
+						JOIN Genes ON TDI_Results.ge_gene_id = Genes.gene_id\
+						WHERE SCNAs.gene_id IN (%s) AND gistic_score = -2%s\
+						GROUP BY SCNAs.gene_id, ge_gene_id" %(self.placeholderString(len(chunk)), cohortSQL)
+			try:
+				cursor.execute(countQuery, chunk + cohortParams)
+				for tup in cursor.fetchall():
+					tumorCounts[idToName[int(tup[0])]] = int(tup[1])
+
+				cursor.execute(degQuery, chunk + cohortParams)
+				for tup in cursor.fetchall():
+					degDicts[idToName[int(tup[0])]][tup[1]] = int(tup[2])
+			except:
+				print "Error retrieving tumors with deletion for a chunk of %s genes." %(len(chunk))
+				continue
+
+		return dict((gene, (degDicts[gene], tumorCounts[gene])) for gene in geneIDs)
+
+	"""
+	Batch version of 'getDEGsForPatientAndGT'. Retrieves the DEGs driven by the given driver gene(s)
+	in each of the given patients with one query per chunk of patients.
+
+	@param gtGenes: Python list of TCGA driver gene names
+	@param patientIDs: Python list of patient IDs
+	@param chunkSize (optional): maximum number of patients per query
+	@return degDict: dictionary where keys are (driver gene name, patient ID) tuples and values are lists of DEG names
+	"""
+	def getDEGsForPatientsAndGTs(self, gtGenes, patientIDs, chunkSize = BATCH_SIZE):
+		cursor = self.db.cursor()
+
+		geneIDs = self.getGeneIDs(gtGenes, chunkSize)
+		idToName = dict((v, k) for k, v in geneIDs.items())
+		gtIDs = idToName.keys()
+		degDict = {}
+
+		if len(gtIDs) == 0:
+			return degDict
+
+		for gtChunk in self.chunkList(gtIDs, chunkSize):
+			for chunk in self.chunkList(list(set(patientIDs)), chunkSize):
+				degQuery = "SELECT DISTINCT gt_gene_id, patient_id, gene_name\
+							FROM TDI_Results JOIN Genes ON TDI_Results.ge_gene_id = Genes.gene_id\
+							WHERE gt_gene_id IN (%s) AND patient_id IN (%s)" %(self.placeholderString(len(gtChunk)), self.placeholderString(len(chunk)))
+				try:
+					cursor.execute(degQuery, gtChunk + chunk)
+					for tup in cursor.fetchall():
+						degDict.setdefault((idToName[int(tup[0])], tup[1]), []).append(tup[2])
+				except:
+					print "Error retrieving DEGs for a chunk of %s patients." %(len(chunk))
+					continue
+
+		return degDict
+
+	"""
+	Genomic profile of one or more tumors, fetched with five batched queries per chunk of patients instead of one
+	query per driver or alteration type. Profiles are cached per patient on the object, in an LRU cache of at most
+	'profileCacheSize' profiles (default 'PROFILE_CACHE_SIZE', 0 disables it); the populate functions of the patient and
+	alteration tables clear the cache. Each profile is a dictionary:
+		'patient_id', 'name', 'cancer_type': the patient and the abbreviation of its cancer type
+		'mutations': list of (gene name, normal AA, AA location, mutated AA, mutation type), the AA change as parsed
+					 by 'parseAACode' when the mutations were loaded
+		'scnas': list of (gene name, gistic score)
+		'degs': list of (gene name, value)
+		'drivers': dictionary driver name (gene or SGA unit/group) -> list of (target gene name, posterior) from
+				   TDI_Results, by decreasing posterior
+
+	@param patients: patient ID or name, or a Python list of them
+	@param refresh (optional): fetch the profiles again instead of using the cache
+	@return the profile of a single patient (None if the patient is unknown), or for a list a dictionary
+			patient ID -> profile
+	"""
+	def getPatientProfile(self, patients, refresh = False):
+		import numbers
+
+		#numbers.Integral covers NumPy integers too, e.g. IDs taken from a ResultTable column
+		single = isinstance(patients, (basestring, numbers.Integral))
+		patientList = [patients] if single else list(patients)
+
+		names = [x for x in patientList if isinstance(x, basestring)]
+		patientIDs = [int(x) for x in patientList if not isinstance(x, basestring)]
+		if len(names) > 0:
+			patientIDs += self.getPatientIDs(names).values()
+
+		missing = sorted(set(x for x in patientIDs if refresh or x not in self.patientProfiles))
+		profiles = self.fetchPatientProfiles(missing) if len(missing) > 0 else {}
+		for x in set(patientIDs):
+			if x not in profiles and x in self.patientProfiles:
+				profiles[x] = self.patientProfiles[x]
+		#the result is built before caching, since a list longer than the cache evicts its own first profiles
+		self.cacheProfiles(profiles)
+
+		if single:
+			return profiles.get(patientIDs[0]) if len(patientIDs) > 0 else None
+		return profiles
+
+	"""
+	Adds profiles to the cache of 'getPatientProfile' as the most recently used, evicting the least recently used
+	beyond 'profileCacheSize'.
+	"""
+	def cacheProfiles(self, profiles):
+		for patientID in sorted(profiles):
+			self.patientProfiles.pop(patientID, None)
+			self.patientProfiles[patientID] = profiles[patientID]
+		while len(self.patientProfiles) > max(self.profileCacheSize, 0):
+			self.patientProfiles.popitem(last=False)
+
+	"""
+	Fetches the profiles of a whole cohort into the cache of 'getPatientProfile', in chunks of patients that are
+	fetched in parallel on separate connections of a 'TDISQLPool'. A cohort larger than 'profileCacheSize' only keeps
+	its last profiles cached.
+
+	@param cohort: cancer type abbreviation or Python list of patients (see 'cohortFilter')
+	@param chunkSize (optional): number of patients fetched by each batch of queries
+	@param numThreads (optional): number of connections fetching chunks at the same time
+	@param refresh (optional): fetch the profiles of patients that are already cached as well
+	@return number of profiles fetched
+	"""
+	def prefetchPatientProfiles(self, cohort, chunkSize = BATCH_SIZE, numThreads = 4, refresh = False):
+		import threading
+
+		cursor = self.db.cursor()
+		cohortSQL, cohortParams = self.cohortFilter(cohort, "patient_id")
+		patientQuery = "SELECT patient_id\
+						FROM Patients\
+						WHERE 1 = 1%s" %(cohortSQL)
+		try:
+			cursor.execute(patientQuery, cohortParams)
+			patientIDs = sorted(int(x[0]) for x in cursor.fetchall())
+		except:
+			print "Error retrieving the patients of the cohort."
+			print patientQuery
+			return
+
+		missing = [x for x in patientIDs if refresh or x not in self.patientProfiles]
+		if len(missing) > self.profileCacheSize:
+			print "Warning: %s profiles to prefetch but only %s are cached; raise profileCacheSize to keep the whole cohort." %(len(missing), self.profileCacheSize)
+		chunks = list(self.chunkList(missing, chunkSize))
+		if numThreads <= 1 or len(chunks) <= 1:
+			numFetched = 0
+			for chunk in chunks:
+				profiles = self.fetchPatientProfiles(chunk, chunkSize)
+				self.cacheProfiles(profiles)
+				numFetched += len(profiles)
+			return numFetched
+
+		#the workers share the name maps of this connection instead of reading them again
+		geneNames = self.getGeneNameArray()
+		maps = self.getDimensionMaps()
+		def shareMaps(tdi):
+			tdi.geneNameArray = geneNames
+			tdi.dimensionMaps = maps
+
+		pool = TDISQLPool(None, None, None, None, size=min(numThreads, len(chunks)), setup=shareMaps, backend=self.backend)
+		lock = threading.Lock()
+		results = []
+
+		def worker():
+			while True:
+				with lock:
+					if len(chunks) == 0:
+						return
+					chunk = chunks.pop()
+				profiles = pool.run(TDISQL.fetchPatientProfiles, chunk, chunkSize)
+				with lock:
+					results.append(profiles)
+
+		threads = [threading.Thread(target=worker) for i in range(pool.size)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		pool.close()
+
+		for profiles in results:
+			self.cacheProfiles(profiles)
+		return sum(len(x) for x in results)
+
+	"""
+	Builds the profiles described in 'getPatientProfile' for a list of patient IDs, without the cache.
+
+	@return dictionary patient ID -> profile
+	"""
+	def fetchPatientProfiles(self, patientIDs, chunkSize = BATCH_SIZE):
+		cursor = self.db.cursor()
+		geneNames = self.getGeneNameArray()
+		groupNames = dict((v, k) for k, v in self.getDimensionMaps()['group'].items())
+		def geneName(geneID):
+			return geneNames[geneID] if geneID is not None and geneID < len(geneNames) else None
+
+		profiles = {}
+		for chunk in self.chunkList(list(patientIDs), chunkSize):
+			placeholders = self.placeholderString(len(chunk))
+			patientQuery = "SELECT patient_id, name, abbv\
+							FROM Patients LEFT JOIN Cancer_Types ON Cancer_Types.cancer_type_id = Patients.cancer_type_id\
+							WHERE patient_id IN (%s)" %(placeholders)
+			smQuery = "SELECT patient_id, gene_id, aa_norm, aa_loc, aa_mut, mut_type\
+					   FROM Somatic_Mutations\
+					   WHERE patient_id IN (%s)" %(placeholders)
+			scnaQuery = "SELECT patient_id, gene_id, gistic_score\
+						 FROM SCNAs\
+						 WHERE patient_id IN (%s)" %(placeholders)
+			degQuery = "SELECT patient_id, gene_id, value\
+						FROM DEGs\
+						WHERE patient_id IN (%s)" %(placeholders)
+			tdiQuery = "SELECT patient_id, gt_gene_id, gt_unit_group_id, ge_gene_id, posterior\
+						FROM TDI_Results\
+						WHERE patient_id IN (%s)" %(placeholders)
+			try:
+				cursor.execute(patientQuery, chunk)
+				for patientID, name, cancerType in cursor.fetchall():
+					profiles[int(patientID)] = {'patient_id': int(patientID), 'name': name, 'cancer_type': cancerType,
+												'mutations': [], 'scnas': [], 'degs': [], 'drivers': {}}
+
+				cursor.execute(smQuery, chunk)
+				for patientID, geneID, aaNorm, aaLoc, aaMut, mutType in cursor.fetchall():
+					profiles[int(patientID)]['mutations'].append((geneName(geneID), aaNorm, aaLoc, aaMut, mutType))
+
+				cursor.execute(scnaQuery, chunk)
+				for patientID, geneID, gisticScore in cursor.fetchall():
+					profiles[int(patientID)]['scnas'].append((geneName(geneID), gisticScore))
+
+				cursor.execute(degQuery, chunk)
+				for patientID, geneID, value in cursor.fetchall():
+					profiles[int(patientID)]['degs'].append((geneName(geneID), int(value) if value is not None else None))
+
+				cursor.execute(tdiQuery, chunk)
+				for patientID, gtGeneID, groupID, geGeneID, posterior in cursor.fetchall():
+					driver = geneName(gtGeneID) if gtGeneID is not None else groupNames.get(groupID)
+					profiles[int(patientID)]['drivers'].setdefault(driver, []).append((geneName(geGeneID), posterior))
+			except:
+				print "Error retrieving profiles for a chunk of %s patients." %(len(chunk))
+				continue
+
+		for profile in profiles.values():
+			profile['mutations'].sort()
+			profile['scnas'].sort()
+			profile['degs'].sort()
+			for targets in profile['drivers'].values():
+				targets.sort(key=lambda x: x[1], reverse=True)
+		return profiles
+
 	"""
 	Closes connection to the database.
 	"""
 	def closeDB(self):
+		self.closeStatements()
 		self.db.close()
+
+class GeneIntervalIndex:
+	'In-memory index of gene coordinates and cytobands for region queries'
+
+	"""
+	Builds sorted per-chromosome arrays of gene start and end positions from rows of the Genes table.
+	Alongside the ends sorted by start we keep their running maximum, which is monotonic and so can be
+	binary searched for the first gene that could still reach a query start.
+
+	@param geneRows: iterable of (gene_id, gene_name, chromosome, start_pos, end_pos, cytoband) tuples
+	"""
+	def __init__(self, geneRows):
+		import numpy as np
+
+		byChromosome = {}
+		cytobands = []
+		for geneID, geneName, chromosome, start, end, cytoband in geneRows:
+			if chromosome is None:
+				continue
+			chromosome = self.normalizeChromosome(chromosome)
+			if start is not None and end is not None:
+				byChromosome.setdefault(chromosome, []).append((int(start), int(end), int(geneID), geneName))
+			if cytoband is not None and cytoband != "":
+				if not cytoband.startswith(chromosome):
+					cytoband = chromosome + cytoband
+				cytobands.append((cytoband, geneName))
+
+		self.chromosomes = {}
+		for chromosome, genes in byChromosome.items():
+			genes.sort()
+			starts = np.array([x[0] for x in genes], dtype=np.int64)
+			ends = np.array([x[1] for x in genes], dtype=np.int64)
+			self.chromosomes[chromosome] = {
+				'starts': starts,
+				'ends': ends,
+				'maxEnds': np.maximum.accumulate(ends),
+				'geneIDs': np.array([x[2] for x in genes], dtype=np.int64),
+				'names': [x[3] for x in genes],
+			}
+
+		cytobands.sort()
+		self.cytobandKeys = [x[0] for x in cytobands]
+		self.cytobandGenes = [x[1] for x in cytobands]
+
+	"""
+	Strips a leading 'chr' so that 'chr17' and '17' refer to the same chromosome.
+	"""
+	@staticmethod
+	def normalizeChromosome(chromosome):
+		chromosome = str(chromosome).strip()
+		if chromosome.lower().startswith("chr"):
+			chromosome = chromosome[3:]
+		return chromosome
+
+	"""
+	For arrays of query intervals on one chromosome, returns for each query the half-open range [lo, hi) of
+	positions in the sorted gene arrays that can overlap it.
+	"""
+	def candidateRanges(self, chromosome, starts, ends):
+		import numpy as np
+
+		genes = self.chromosomes[chromosome]
+		lo = np.searchsorted(genes['maxEnds'], starts, side='left')
+		hi = np.searchsorted(genes['starts'], ends, side='right')
+		return lo, np.maximum(hi, lo)
+
+	"""
+	Find the genes overlapping a genomic region.
+
+	@param chromosome: chromosome name, with or without a 'chr' prefix
+	@param start: start position of the region (inclusive)
+	@param end: end position of the region (inclusive)
+	@return list of gene names sorted by start position
+	"""
+	def findOverlappingGenes(self, chromosome, start, end):
+		chromosome = self.normalizeChromosome(chromosome)
+		if chromosome not in self.chromosomes:
+			return []
+		genes = self.chromosomes[chromosome]
+		lo, hi = self.candidateRanges(chromosome, [start], [end])
+		return [genes['names'][i] for i in range(lo[0], hi[0]) if genes['ends'][i] >= start]
+
+	"""
+	Expands many segments on one chromosome to the genes they overlap in a few vectorized passes.
+
+	@param chromosome: chromosome name, with or without a 'chr' prefix
+	@param starts: NumPy array of segment start positions (inclusive)
+	@param ends: NumPy array of segment end positions (inclusive)
+	@return (segmentIndex, geneIDs): NumPy arrays with one entry per overlapping (segment, gene) pair, where segmentIndex
+			indexes into 'starts'/'ends'
+	"""
+	def expandSegments(self, chromosome, starts, ends):
+		import numpy as np
+
+		chromosome = self.normalizeChromosome(chromosome)
+		if chromosome not in self.chromosomes or len(starts) == 0:
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+		genes = self.chromosomes[chromosome]
+
+		starts = np.asarray(starts, dtype=np.int64)
+		lo, hi = self.candidateRanges(chromosome, starts, ends)
+		counts = hi - lo
+
+		#expand every [lo, hi) range into its positions without a Python loop over segments
+		segmentIndex = np.repeat(np.arange(len(starts)), counts)
+		offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+		positions = np.repeat(lo, counts) + offsets
+
+		overlaps = genes['ends'][positions] >= starts[segmentIndex]
+		return segmentIndex[overlaps], genes['geneIDs'][positions[overlaps]]
+
+	"""
+	Find the genes in a cytoband. Bands match hierarchically by prefix, so '17p13' also returns genes in '17p13.1'
+	and '17p' returns the whole arm.
+
+	@param cytoband: cytoband name including its chromosome (e.g. '17p13.1'), or a chromosome name for the whole chromosome
+	@return list of gene names
+	"""
+	def findGenesInCytoband(self, cytoband):
+		import bisect
+
+		cytoband = self.normalizeChromosome(cytoband)
+		wholeChromosome = "p" not in cytoband and "q" not in cytoband
+		first = bisect.bisect_left(self.cytobandKeys, cytoband)
+		genes = []
+		for i in range(first, len(self.cytobandKeys)):
+			key = self.cytobandKeys[i]
+			if not key.startswith(cytoband):
+				break
+			#a bare chromosome name such as '1' must not match the bands of chromosome '10'
+			if wholeChromosome and (len(key) == len(cytoband) or key[len(cytoband)] not in "pq"):
+				continue
+			genes.append(self.cytobandGenes[i])
+		return genes
+
+
+class ResultTable:
+	'Compact column-oriented query result backed by typed NumPy arrays'
+
+	"""
+	Stores a query result as one NumPy array per column (e.g. int32 IDs and counts, float32 posteriors) instead of
+	one Python tuple per row. Gene columns hold gene IDs and are decoded through a shared array of interned gene
+	names ('TDISQL.getGeneNameArray'), so a name string is never stored more than once.
+	Iterating or indexing yields 'ResultRow' views that unpack, index and compare like the tuples returned by the
+	plain queries, with gene IDs decoded to names.
+
+	@param columnNames: list of column names
+	@param columns: list of NumPy arrays, one per column, all of the same length
+	@param geneNames (optional): NumPy object array mapping gene ID -> gene name, used to decode 'geneColumns'
+	@param geneColumns (optional): names of the columns that hold gene IDs
+	"""
+	def __init__(self, columnNames, columns, geneNames = None, geneColumns = ()):
+		self.columnNames = list(columnNames)
+		self.columns = list(columns)
+		self.geneNames = geneNames
+		self.geneColumns = frozenset(geneColumns)
+		self.columnIndex = dict((name, i) for i, name in enumerate(self.columnNames))
+		#per column, the array used to decode values when building row views (None leaves the value as is)
+		self.decoders = [geneNames if name in self.geneColumns else None for name in self.columnNames]
+
+	def __len__(self):
+		return len(self.columns[0]) if len(self.columns) > 0 else 0
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return ResultTable(self.columnNames, [x[i] for x in self.columns], self.geneNames, self.geneColumns)
+		if i < 0:
+			i += len(self)
+		if i < 0 or i >= len(self):
+			raise IndexError("ResultTable index out of range")
+		return ResultRow(self, i)
+
+	def __iter__(self):
+		for i in xrange(len(self)):
+			yield ResultRow(self, i)
+
+	def __repr__(self):
+		return "ResultTable(%s rows: %s)" %(len(self), ", ".join(self.columnNames))
+
+	"""
+	Decodes one value of a column for a row view.
+	"""
+	def value(self, column, i):
+		value = self.columns[column][i]
+		decoder = self.decoders[column]
+		if decoder is not None:
+			return decoder[value]
+		return value.item()
+
+	"""
+	@param name: column name
+	@return the NumPy array backing the column (not a copy)
+	"""
+	def column(self, name):
+		return self.columns[self.columnIndex[name]]
+
+	"""
+	@param name: name of a gene column
+	@return NumPy object array of the gene names of the column, built by one indexing operation
+	"""
+	def geneNameColumn(self, name):
+		return self.geneNames[self.column(name)]
+
+	"""
+	@return dictionary mapping each column name to the NumPy array backing it (not copies)
+	"""
+	def toNumpy(self):
+		return dict(zip(self.columnNames, self.columns))
+
+	"""
+	Builds a pandas DataFrame over the columns. Gene columns become categoricals whose codes are the gene IDs and whose
+	categories are the shared gene names, so names are not repeated per row.
+
+	@param decodeGenes (optional): if False, gene columns are kept as plain integer ID columns
+	@return pandas DataFrame
+	"""
+	def toDataFrame(self, decodeGenes = True):
+		import pandas as pd
+
+		data = {}
+		categories = None
+		for name, column in zip(self.columnNames, self.columns):
+			if decodeGenes and name in self.geneColumns:
+				if categories is None:
+					#categories must be unique, so unused gene IDs get placeholder names that no row refers to
+					categories = pd.Index([x if x is not None else "<gene_id %s>" %(i) for i, x in enumerate(self.geneNames)], dtype=object)
+				data[name] = pd.Categorical.from_codes(column, categories=categories)
+			else:
+				data[name] = column
+		return pd.DataFrame(data, columns=self.columnNames, copy=False)
+
+	"""
+	@return list of plain tuples, the shape returned by the non-compact queries
+	"""
+	def toTuples(self):
+		return [tuple(x) for x in self]
+
+	"""
+	@param keyColumn (optional): column used as key (default: first column)
+	@param valueColumn (optional): column used as value (default: last column)
+	@return dictionary from the decoded key column to the value column
+	"""
+	def toDict(self, keyColumn = None, valueColumn = None):
+		keyColumn = self.columnIndex[keyColumn] if keyColumn is not None else 0
+		valueColumn = self.columnIndex[valueColumn] if valueColumn is not None else len(self.columns) - 1
+		return dict((x[keyColumn], x[valueColumn]) for x in self)
+
+class ResultRow(object):
+	'Tuple-like view of one row of a ResultTable'
+	__slots__ = ('table', 'index')
+
+	def __init__(self, table, index):
+		self.table = table
+		self.index = index
+
+	def __len__(self):
+		return len(self.table.columns)
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return tuple(self)[i]
+		if isinstance(i, basestring):
+			return self.table.value(self.table.columnIndex[i], self.index)
+		if i < 0:
+			i += len(self.table.columns)
+		if i < 0 or i >= len(self.table.columns):
+			raise IndexError("ResultRow index out of range")
+		return self.table.value(i, self.index)
+
+	def __iter__(self):
+		for i in xrange(len(self.table.columns)):
+			yield self.table.value(i, self.index)
+
+	#rows compare equal to rows and sequences with the same values; other types are left to Python (row == None is False)
+	def __eq__(self, other):
+		if not isinstance(other, (ResultRow, tuple, list)):
+			return NotImplemented
+		return tuple(self) == tuple(other)
+
+	def __ne__(self, other):
+		equal = self.__eq__(other)
+		if equal is NotImplemented:
+			return equal
+		return not equal
+
+	def __hash__(self):
+		return hash(tuple(self))
+
+	def __repr__(self):
+		return repr(tuple(self))
+
+
+class TDISQLPool:
+	'Fixed-size pool of TDISQL connections shared between threads'
+
+	"""
+	MySQLdb connections must not be used by two threads at once, so each thread borrows a whole 'TDISQL' object
+	for the duration of a query. Connections are opened lazily, up to 'size' of them, and reused afterwards.
+
+	@param host, user, password, dbName: connection arguments passed to 'TDISQL'
+	@param size (optional): maximum number of open connections
+	@param setup (optional): function called with each new TDISQL object (e.g. to wrap its connection)
+	@param backend (optional): 'mysql' or 'sqlite', passed to 'TDISQL'
+	"""
+	def __init__(self, host, user, password, dbName, size = 4, setup = None, backend = 'mysql'):
+		import Queue
+		import threading
+
+		self.connectArgs = (host, user, password, dbName, backend)
+		self.size = size
+		self.setup = setup
+		self.idle = Queue.Queue()
+		self.numOpen = 0
+		self.lock = threading.Lock()
+
+	"""
+	Borrows a connection, opening a new one if fewer than 'size' are open, otherwise waiting for one to be returned.
+
+	@return TDISQL
+	"""
+	def get(self):
+		import Queue
+
+		try:
+			return self.idle.get_nowait()
+		except Queue.Empty:
+			pass
+		with self.lock:
+			openNew = self.numOpen < self.size
+			if openNew:
+				self.numOpen += 1
+		if not openNew:
+			return self.idle.get()
+		try:
+			tdi = TDISQL(*self.connectArgs)
+			if self.setup is not None:
+				self.setup(tdi)
+			return tdi
+		except:
+			with self.lock:
+				self.numOpen -= 1
+			raise
+
+	"""
+	Returns a borrowed connection to the pool.
+	"""
+	def put(self, tdi):
+		self.idle.put(tdi)
+
+	"""
+	Runs 'function(tdi, *args, **kwargs)' on a borrowed connection and returns its result.
+	"""
+	def run(self, function, *args, **kwargs):
+		tdi = self.get()
+		try:
+			return function(tdi, *args, **kwargs)
+		finally:
+			self.put(tdi)
+
+	"""
+	Closes the idle connections. Call it once every borrowed connection has been returned.
+	"""
+	def close(self):
+		import Queue
+
+		while True:
+			try:
+				tdi = self.idle.get_nowait()
+			except Queue.Empty:
+				break
+			tdi.closeDB()
+			with self.lock:
+				self.numOpen -= 1
+
+
+"""
+Scores one block of gene pairs for 'TDISQL.findMutualExclusivity'. Kept at module level so that it can be
+sent to 'multiprocessing' worker processes.
+
+@param block: tuple of (tumors with both genes, tumors with gene 1, tumors with gene 2, total number of tumors)
+			  where the first three are NumPy arrays with one entry per pair
+@return (exclusivity p-values, co-occurrence p-values) as NumPy arrays
+"""
+def scoreExclusivityBlock(block):
+	from scipy import stats
+
+	both, count1, count2, numPatients = block
+	#P(both <= observed) is computed as the upper tail of the tumors with gene 1 but not gene 2, which keeps small p-values accurate
+	pExclusive = stats.hypergeom.sf(count1 - both - 1, numPatients, count1, numPatients - count2)
+	pCooccur = stats.hypergeom.sf(both - 1, numPatients, count1, count2)
+	return pExclusive, pCooccur
+
+
+"""
+Cuts a file into byte ranges of about 'chunkBytes' that start and end on line boundaries. The file is memory-mapped
+and only searched for the next newline at each cut, so this does not read the file.
+
+@param inputFile: path to the file
+@param chunkBytes: approximate size of each range in bytes
+@param skipHeader (optional): start the first range after the first line
+@return list of (inputFile, start offset, end offset) tuples
+"""
+def findFileChunks(inputFile, chunkBytes, skipHeader = True):
+	import mmap
+	import os
+
+	fileSize = os.path.getsize(inputFile)
+	if fileSize == 0:
+		return []
+
+	inputData = open(inputFile, "rb")
+	mapped = mmap.mmap(inputData.fileno(), 0, access=mmap.ACCESS_READ)
+	start = 0
+	if skipHeader:
+		start = mapped.find("\n") + 1 or fileSize
+
+	chunks = []
+	while start < fileSize:
+		end = start + chunkBytes
+		if end >= fileSize:
+			end = fileSize
+		else:
+			end = mapped.find("\n", end) + 1 or fileSize
+		chunks.append((inputFile, start, end))
+		start = end
+
+	mapped.close()
+	inputData.close()
+	return chunks
+
+
+"""
+Parses one byte range of a delimited file into columns. Whole lines are split at once by joining them with the
+delimiter and splitting the block a single time, then the columns are taken as strided slices of the fields.
+Kept at module level so that it can be sent to 'multiprocessing' worker processes by 'TDISQL.readColumnChunks'.
+
+@param task: tuple of ((inputFile, start offset, end offset), delimiter, number of columns)
+@return (columns, numMalformed) where columns is a list of lists of strings, one per column, and numMalformed is the
+		number of non-empty lines dropped because they did not have the expected number of columns
+"""
+def parseFileChunk(task):
+	import mmap
+	from operator import methodcaller
+
+	(inputFile, start, end), delimiter, numColumns = task
+	inputData = open(inputFile, "rb")
+	mapped = mmap.mmap(inputData.fileno(), 0, access=mmap.ACCESS_READ)
+	block = mapped[start:end]
+	mapped.close()
+	inputData.close()
+
+	if "\r" in block:
+		block = block.replace("\r", "")
+	lines = block.split("\n")
+	if lines[-1] == "":
+		lines.pop()
+
+	numMalformed = 0
+	counts = map(methodcaller("count", delimiter), lines)
+	if counts.count(numColumns - 1) != len(counts):
+		wellFormed = [x for x, c in zip(lines, counts) if c == numColumns - 1]
+		numMalformed = len([x for x in lines if x.strip() != ""]) - len(wellFormed)
+		lines = wellFormed
+
+	if len(lines) == 0:
+		return [[] for i in range(numColumns)], numMalformed
+	fields = delimiter.join(lines).split(delimiter)
+	return [fields[i::numColumns] for i in range(numColumns)], numMalformed
+
+"""
+Encodes a set of patient IDs as the bitmap stored in SM_Positions. Bit i of the bitmap (most significant bit of each
+byte first, as in 'numpy.packbits') is set if patient 'offset * 8 + i' is in the set. Bytes before the first patient
+are dropped and counted in 'offset', so a position mutated in a single tumor takes one byte whatever its patient ID.
+
+@param patientIDs: NumPy array or list of patient IDs
+@return (offset, bitmap) where offset is a byte offset and bitmap a byte string
+"""
+def encodePatientBitmap(patientIDs):
+	import numpy as np
+
+	patientIDs = np.asarray(patientIDs, dtype=np.int64)
+	if len(patientIDs) == 0:
+		return 0, ""
+	offset = int(patientIDs.min()) >> 3
+	bits = np.zeros(((int(patientIDs.max()) >> 3) - offset + 1) * 8, dtype=np.uint8)
+	bits[patientIDs - offset * 8] = 1
+	return offset, np.packbits(bits).tostring()
+
+"""
+Decodes a bitmap written by 'encodePatientBitmap'.
+
+@return NumPy array of patient IDs in increasing order
+"""
+def decodePatientBitmap(offset, bitmap):
+	import numpy as np
+
+	bits = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8))
+	return np.flatnonzero(bits) + int(offset) * 8
@@ -114,10 +114,24 @@ CREATE TABLE Somatic_Mutations
 	transcript varchar(50),
 	mut_type varchar(50),
 	PRIMARY KEY (sm_id),
+	INDEX sm_gene_patient (gene_id, patient_id),
 	FOREIGN KEY (patient_id) REFERENCES Patients(patient_id) ON DELETE CASCADE,
 	FOREIGN KEY (gene_id) REFERENCES Genes(gene_id) ON DELETE CASCADE
 );
 
+-- tumors per mutated position, rebuilt from Somatic_Mutations after each load (TDISQL.rebuildPositionTable)
+CREATE TABLE SM_Positions
+(
+	gene_id int NOT NULL,
+	aa_loc int NOT NULL,
+	mut_type varchar(50) NOT NULL,
+	num_tumors int NOT NULL,
+	bitmap_offset int NOT NULL,
+	patient_bitmap blob,
+	PRIMARY KEY (gene_id, aa_loc, mut_type),
+	FOREIGN KEY (gene_id) REFERENCES Genes(gene_id) ON DELETE CASCADE
+);
+
 CREATE TABLE SCNAs
 (
 	scna_id int NOT NULL AUTO_INCREMENT,
@@ -127,6 +141,7 @@ CREATE TABLE SCNAs
 	gistic_score int,
 	platform_id int,
 	PRIMARY KEY (scna_id),
+	INDEX scna_gene_patient (gene_id, gistic_score, patient_id),
 	FOREIGN KEY (patient_id) REFERENCES Patients(patient_id) ON DELETE CASCADE,
 	FOREIGN KEY (gene_id) REFERENCES Genes(gene_id) ON DELETE CASCADE,
 	FOREIGN KEY (platform_id) REFERENCES Exp_Platforms(platform_id) ON DELETE CASCADE
@@ -157,6 +172,7 @@ CREATE TABLE DEGs
 	platform_id int,
 	value enum('-1', '1'),
 	PRIMARY KEY (deg_id),
+	INDEX deg_gene_patient (gene_id, patient_id),
 	FOREIGN KEY (patient_id) REFERENCES Patients(patient_id) ON DELETE CASCADE,
 	FOREIGN KEY (gene_id) REFERENCES Genes(gene_id) ON DELETE CASCADE,
 	FOREIGN KEY (platform_id) REFERENCES Exp_Platforms(platform_id) ON DELETE CASCADE
@@ -172,6 +188,10 @@ CREATE TABLE TDI_Results
 	posterior float,
 	exp_id int,
 	PRIMARY KEY (tdi_id),
+	INDEX tdi_gt_patient (gt_gene_id, patient_id),
+	INDEX tdi_ge_patient (ge_gene_id, patient_id),
+	INDEX tdi_gt_posterior (gt_gene_id, posterior, ge_gene_id, patient_id),
+	INDEX tdi_ge_posterior (ge_gene_id, posterior, gt_gene_id, patient_id),
 	FOREIGN KEY (patient_id) REFERENCES Patients(patient_id) ON DELETE CASCADE,
 	FOREIGN KEY (gt_gene_id) REFERENCES Genes(gene_id) ON DELETE CASCADE,
 	FOREIGN KEY (ge_gene_id) REFERENCES Genes(gene_id) ON DELETE CASCADE,
@@ -181,7 +201,7 @@ CREATE TABLE TDI_Results
 
 CREATE VIEW TDI_SM
 AS 
-	SELECT gt_gene_id, ge_gene_id, start_pos, TDI_Results.patient_id
+	SELECT gt_gene_id, ge_gene_id, start_pos, aa_loc, mut_type, TDI_Results.patient_id
 	FROM TDI_Results JOIN Somatic_Mutations ON TDI_Results.gt_gene_id = Somatic_Mutations.gene_id AND Somatic_Mutations.patient_id = TDI_Results.patient_id;
 
 CREATE VIEW TDI_SCNA
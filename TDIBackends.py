@@ -0,0 +1,262 @@
+import os
+import re
+from contextlib import contextmanager
+
+#schema shared by all backends; each backend translates it to its own dialect
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MakeTDITables.sql")
+
+"""
+Creates the backend for a TDISQL connection.
+
+@param backend: 'mysql' or 'sqlite' (or an already built backend object, which is returned as is)
+@param host, user, password: server connection arguments (ignored by SQLite)
+@param dbName: MySQL database name, or path of the SQLite database file
+@return backend object
+"""
+def makeBackend(backend, host, user, password, dbName):
+	if backend == 'mysql':
+		return MySQLBackend(host, user, password, dbName)
+	if backend == 'sqlite':
+		return SQLiteBackend(dbName)
+	if hasattr(backend, "connect"):
+		return backend
+	raise ValueError("Unknown backend %s. Please use 'mysql' or 'sqlite'." %(backend))
+
+"""
+Splits an SQL script into statements, dropping '--' comments.
+"""
+def splitStatements(sqlText):
+	sqlText = re.sub(r"--[^\n]*", "", sqlText)
+	return [x.strip() for x in sqlText.split(";") if x.strip() != ""]
+
+class MySQLBackend:
+	'TDISQL backend for a MySQL/MariaDB server through MySQLdb'
+
+	name = 'mysql'
+
+	def __init__(self, host, user, password, dbName):
+		self.connectArgs = (host, user, password, dbName)
+
+	def connect(self):
+		import MySQLdb
+		return MySQLdb.connect(*self.connectArgs)
+
+	"""
+	Cursor that streams rows from the server instead of buffering the whole result on the client.
+	"""
+	def streamingCursor(self, db):
+		import MySQLdb.cursors
+		return db.cursor(MySQLdb.cursors.SSCursor)
+
+	def schemaStatements(self, sqlText):
+		return splitStatements(sqlText)
+
+	"""
+	Turns off foreign key checks, and unique checks unless 'uniqueChecks' is set, for the session while loading, then
+	restores their previous values. Rows loaded meanwhile are not rechecked by the server; 'TDISQL.bulkLoad' verifies
+	the foreign keys with set-based queries. Unique checks have to stay on for loaders that skip duplicates with
+	INSERT IGNORE, which relies on them.
+	"""
+	@contextmanager
+	def bulkLoadSettings(self, db, uniqueChecks = False):
+		cursor = db.cursor()
+		cursor.execute("SELECT @@session.foreign_key_checks, @@session.unique_checks")
+		previous = cursor.fetchall()[0]
+		db.commit()
+		cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = %s", [1 if uniqueChecks else 0])
+		try:
+			yield
+		finally:
+			db.commit()
+			cursor.execute("SET SESSION foreign_key_checks = %s, unique_checks = %s", [int(previous[0]), int(previous[1])])
+
+	"""
+	Non-unique secondary indexes of a table.
+	@return list of (index name, list of columns)
+	"""
+	def secondaryIndexes(self, db, table):
+		cursor = db.cursor()
+		cursor.execute("SELECT INDEX_NAME, COLUMN_NAME\
+						FROM information_schema.STATISTICS\
+						WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 1\
+						ORDER BY INDEX_NAME, SEQ_IN_INDEX", [table])
+		indexes = []
+		for name, column in cursor.fetchall():
+			if len(indexes) == 0 or indexes[-1][0] != name:
+				indexes.append((name, []))
+			indexes[-1][1].append(column)
+		return indexes
+
+	def dropIndex(self, db, table, name):
+		db.cursor().execute("ALTER TABLE %s DROP INDEX %s" %(table, name))
+
+	"""
+	Adds the indexes in a single ALTER TABLE, so InnoDB builds them together by sorting the table once.
+	"""
+	def createIndexes(self, db, table, indexes):
+		if len(indexes) == 0:
+			return
+		clauses = ["ADD INDEX %s (%s)" %(name, ", ".join(columns)) for name, columns in indexes]
+		db.cursor().execute("ALTER TABLE %s %s" %(table, ", ".join(clauses)))
+
+class SQLiteBackend:
+	'Embedded TDISQL backend on a single SQLite database file in WAL mode'
+
+	name = 'sqlite'
+
+	#pragmas for every connection: WAL lets readers run while a load is writing, and NORMAL synchronous is safe under WAL
+	CONNECT_PRAGMAS = ["PRAGMA journal_mode = WAL", "PRAGMA synchronous = NORMAL", "PRAGMA foreign_keys = ON",
+					   "PRAGMA temp_store = MEMORY", "PRAGMA cache_size = -65536", "PRAGMA mmap_size = 1073741824"]
+
+	#pragmas while bulk loading: no fsync, a large page cache, and foreign keys checked once at the end instead of per row
+	BULK_LOAD_PRAGMAS = ["PRAGMA synchronous = OFF", "PRAGMA foreign_keys = OFF", "PRAGMA cache_size = -524288",
+						 "PRAGMA wal_autocheckpoint = 0"]
+
+	def __init__(self, path):
+		self.path = path
+
+	def connect(self):
+		import sqlite3
+
+		#a pool hands a connection to one thread at a time, so it may be used from a thread other than its creator
+		db = sqlite3.connect(self.path, check_same_thread=False, cached_statements=512)
+		db.text_factory = str
+		for pragma in self.CONNECT_PRAGMAS:
+			db.execute(pragma)
+		return SQLiteConnection(db)
+
+	def streamingCursor(self, db):
+		return db.cursor()
+
+	"""
+	Translates the MySQL schema: AUTO_INCREMENT keys become INTEGER primary keys (SQLite rowid aliases), enums become
+	text, and INDEX clauses inside CREATE TABLE become separate CREATE INDEX statements.
+	"""
+	def schemaStatements(self, sqlText):
+		statements = []
+		for statement in splitStatements(sqlText):
+			if not statement.upper().startswith("CREATE TABLE"):
+				statements.append(statement)
+				continue
+			table = statement.split()[2]
+			statement = re.sub(r"\bint NOT NULL AUTO_INCREMENT", "INTEGER NOT NULL", statement, flags=re.I)
+			statement = re.sub(r"\benum\([^)]*\)", "text", statement, flags=re.I)
+			indexes = re.findall(r"^\s*INDEX\s+(\w+)\s*(\([^)]*\))\s*,?\s*$", statement, flags=re.M)
+			statement = re.sub(r"^\s*INDEX\s+\w+\s*\([^)]*\)\s*,?\s*\n", "", statement, flags=re.M)
+			statement = re.sub(r",\s*\)\s*$", "\n)", statement)
+			statements.append(statement)
+			statements += ["CREATE INDEX %s ON %s %s" %(name, table, columns) for name, columns in indexes]
+		return statements
+
+	"""
+	Relaxes durability and foreign key checks while loading, then restores them and checkpoints the WAL. SQLite does
+	not recheck foreign keys when the pragma is turned back on; 'TDISQL.bulkLoad' verifies them with set-based queries.
+	UNIQUE constraints are always enforced, so 'uniqueChecks' has no effect here.
+	"""
+	@contextmanager
+	def bulkLoadSettings(self, db, uniqueChecks = False):
+		cursor = db.cursor()
+		db.commit()
+		for pragma in self.BULK_LOAD_PRAGMAS:
+			cursor.execute(pragma)
+		try:
+			yield
+		finally:
+			db.commit()
+			for pragma in self.CONNECT_PRAGMAS:
+				if "journal_mode" not in pragma:
+					cursor.execute(pragma)
+			cursor.execute("PRAGMA wal_autocheckpoint = 1000")
+			cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+	"""
+	Non-unique indexes created on a table (not those SQLite creates for UNIQUE and PRIMARY KEY constraints).
+	@return list of (index name, list of columns)
+	"""
+	def secondaryIndexes(self, db, table):
+		cursor = db.cursor()
+		cursor.execute("PRAGMA index_list(%s)" %(table))
+		names = [x[1] for x in cursor.fetchall() if x[2] == 0 and x[3] == "c"]
+		indexes = []
+		for name in sorted(names):
+			cursor.execute("PRAGMA index_info(%s)" %(name))
+			indexes.append((name, [x[2] for x in sorted(cursor.fetchall())]))
+		return indexes
+
+	def dropIndex(self, db, table, name):
+		db.cursor().execute("DROP INDEX %s" %(name))
+
+	def createIndexes(self, db, table, indexes):
+		cursor = db.cursor()
+		for name, columns in indexes:
+			cursor.execute("CREATE INDEX %s ON %s (%s)" %(name, table, ", ".join(columns)))
+
+class SQLiteConnection:
+	'DB-API connection wrapper that accepts the MySQLdb %s parameter style used by TDISQL'
+
+	def __init__(self, db):
+		self.db = db
+
+	def cursor(self, *args):
+		return SQLiteCursor(self.db.cursor())
+
+	def commit(self):
+		self.db.commit()
+
+	def rollback(self):
+		self.db.rollback()
+
+	def close(self):
+		self.db.close()
+
+class SQLiteCursor:
+	'DB-API cursor wrapper translating MySQLdb style statements to SQLite'
+
+	#translated statements, shared by all cursors (statement text -> SQLite text)
+	translations = {}
+
+	def __init__(self, cursor):
+		self.cursor = cursor
+
+	"""
+	Converts %s placeholders to ?, and %% to % when parameters are given (as MySQLdb does).
+	"""
+	@classmethod
+	def translate(cls, query, withParams):
+		key = (query, withParams)
+		translated = cls.translations.get(key)
+		if translated is None:
+			translated = query.replace("INSERT IGNORE", "INSERT OR IGNORE")
+			if withParams:
+				translated = re.sub(r"%(s|%)", lambda m: "?" if m.group(1) == "s" else "%", translated)
+			#textually distinct statements (values formatted into the text) would otherwise crowd out the reused ones
+			if len(cls.translations) >= 10000:
+				cls.translations.clear()
+			cls.translations[key] = translated
+		return translated
+
+	def execute(self, query, params = None):
+		if params is None:
+			return self.cursor.execute(self.translate(query, False))
+		return self.cursor.execute(self.translate(query, True), tuple(params))
+
+	def executemany(self, query, rows):
+		return self.cursor.executemany(self.translate(query, True), rows)
+
+	def fetchone(self):
+		return self.cursor.fetchone()
+
+	def fetchmany(self, size = None):
+		return self.cursor.fetchmany(size if size is not None else self.cursor.arraysize)
+
+	def fetchall(self):
+		return self.cursor.fetchall()
+
+	def close(self):
+		self.cursor.close()
+
+	def __iter__(self):
+		return iter(self.cursor)
+
+	def __getattr__(self, name):
+		return getattr(self.cursor, name)
@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+"""
+Command line driver for the TDI database.
+
+Every populate function and query method of 'TDISQL' is a subcommand named after the method. Arguments without a
+default are positional, the others are '--options' with the method's argument names:
+
+	tdisql.py --db TDI findDriversForGene TP53 --minNumberOfTumors 5 --cohort BRCA
+	tdisql.py --db TDI populateGeneTable genes.txt '\\t' --validate true
+
+Values are read as numbers, 'none', 'true'/'false' or strings; comma separated values become lists. Gene and patient
+list arguments are always lists, and a cohort is a cancer type abbreviation or a comma separated list of patients.
+
+The batch subcommand reads one command per line from a file (same syntax as above, '#' starts a comment), runs the
+commands concurrently over a pool of connections and writes each result as soon as it completes:
+
+	tdisql.py --db TDI --format json batch queries.txt --workers 8
+
+Connection arguments default to the environment variables TDISQL_HOST, TDISQL_USER, TDISQL_PASSWORD, TDISQL_DB and
+TDISQL_BACKEND ('--backend sqlite --db tdi.db' uses an embedded SQLite file instead of a server).
+'--timing' reports the time of every command and SQL statement and '--explain' the query plan of every SELECT,
+both on stderr.
+"""
+import argparse
+import inspect
+import json
+import os
+import shlex
+import sys
+import threading
+import time
+import Queue
+
+from ConnectToTDI_SQL import TDISQL, TDISQLPool, ResultTable
+
+POPULATE_COMMANDS = ["populateCancerTypeTable", "populateGeneTable", "populateExpPlatformTable", "populateExperimentTable",
+					 "populateSGAUnitGroupTable", "populatePatientTable", "populateSMTable", "populateSCNATable",
+					 "populateSCNASegmentTable", "populateDEGTable", "populateTDIResults", "bulkPopulateDEGTable",
+					 "bulkPopulateTDIResults", "rebuildPositionTable", "validateInputFile"]
+
+QUERY_COMMANDS = ["findTumorsWithGT", "findTumorsWithGTs", "numberOfTumorsWithGTAtLocation", "getTumorsMutatedWithGTAtLocation",
+				  "findDEGsAtHotspot", "getDEGsForPatientAndGT", "getDEGsForPatientsAndGTs", "findTopHotspotsAndDEGs",
+				  "findOverlappingTargets", "findAllOverlappingTargets", "findDriversForGene", "findDriversForGenes",
+				  "findTopByPosterior", "findTopTargetsForDriver", "findTopDriversForTarget", "findTopPerPatientByPosterior",
+				  "findTumorsWithoutGenes", "getTumorsAtTopHotspots", "getTumorsWithDeletion", "findDEGsForTumorsAtTopHotspots",
+				  "findDEGsWithDeletion", "findDEGsWithDeletions", "findEnrichedTargets", "findEnrichedDEGsForTumorsAtTopHotspots",
+				  "findEnrichedDEGsWithDeletion", "findMutualExclusivity", "exportFeatureMatrix", "getTDIResultTable",
+				  "findGenesInRegion", "findGenesInCytoband", "findHotspotClusters", "getGeneID", "getGeneIDs", "getPatientIDs",
+				  "getPatientProfile"]
+
+#arguments that are always lists, even with a single value
+LIST_ARGUMENTS = set(["gtGenes", "targetGenes", "driverGenes", "geneList", "patientList", "patientIDs", "patientNames",
+					  "patientOrder", "geneOrder"])
+
+#arguments that are passed through as strings ('delimiter' also understands escapes such as '\t')
+RAW_ARGUMENTS = set(["inputFile", "outputFile", "matrixFile", "delimiter", "description", "parameter_set", "name", "exp_date"])
+
+
+"""
+Converts one command line value to a Python value for the method argument 'name'.
+"""
+def parseValue(text, name):
+	if name == "delimiter":
+		return text.decode("string_escape")
+	if name in RAW_ARGUMENTS:
+		return text
+	if name in LIST_ARGUMENTS or "," in text:
+		return [parseScalar(x) for x in text.split(",") if x != ""]
+
+	value = parseScalar(text)
+	#a cohort given as a single patient ID is a list of one patient, not a cancer type
+	if name == "cohort" and isinstance(value, (int, long)):
+		return [value]
+	return value
+
+def parseScalar(text):
+	if text.lower() in ("none", "null"):
+		return None
+	if text.lower() in ("true", "false"):
+		return text.lower() == "true"
+	for numberType in (int, float):
+		try:
+			return numberType(text)
+		except ValueError:
+			pass
+	return text
+
+"""
+Builds the argument parser with one subcommand per TDISQL method, generated from the method's signature.
+
+@param parser: argparse parser to add the subcommands to
+@param withBatch (optional): also add the 'batch' subcommand
+@param parents (optional): parsers whose options every subcommand also accepts
+"""
+def addCommandParsers(parser, withBatch = False, parents = ()):
+	subparsers = parser.add_subparsers(dest="command", metavar="command")
+	for commandName in POPULATE_COMMANDS + QUERY_COMMANDS:
+		method = getattr(TDISQL, commandName)
+		argNames, varargs, keywords, defaults = inspect.getargspec(method)
+		argNames = argNames[1:]
+		numRequired = len(argNames) - len(defaults or ())
+
+		doc = method.__doc__ or ""
+		subparser = subparsers.add_parser(commandName, help="TDISQL.%s" %(commandName), description=doc, parents=list(parents))
+		subparser.set_defaults(commandName=commandName)
+		for i, argName in enumerate(argNames):
+			convert = lambda text, argName=argName: parseValue(text, argName)
+			if i < numRequired:
+				subparser.add_argument(argName, type=convert)
+			else:
+				subparser.add_argument("--" + argName, dest=argName, type=convert, default=defaults[i - numRequired],
+									   help="default: %(default)s")
+
+	if withBatch:
+		batchParser = subparsers.add_parser("batch", help="run the commands listed in a file concurrently", parents=list(parents))
+		batchParser.add_argument("batchFile", help="file with one command per line ('-' for stdin)")
+		batchParser.add_argument("--workers", type=int, default=4, help="number of concurrent connections (default: %(default)s)")
+	return subparsers
+
+"""
+Extracts the method arguments of a parsed command.
+@return (commandName, kwargs)
+"""
+def commandArguments(parsed):
+	method = getattr(TDISQL, parsed.commandName)
+	argNames = inspect.getargspec(method)[0][1:]
+	return parsed.commandName, dict((x, getattr(parsed, x)) for x in argNames)
+
+class CommandLineError(Exception):
+	pass
+
+class BatchParser(argparse.ArgumentParser):
+	'Argument parser for batch file lines that raises instead of exiting'
+
+	def error(self, message):
+		raise CommandLineError(message)
+
+"""
+Parses the lines of a batch file into commands. Blank lines and lines starting with '#' are skipped; lines that do not
+parse are reported on stderr and counted.
+@return (commands, number of invalid lines) where commands is a list of (line number, command text, commandName, kwargs) tuples
+"""
+def readBatchFile(batchFile):
+	parser = BatchParser(prog="batch", add_help=False)
+	addCommandParsers(parser)
+
+	inputData = sys.stdin if batchFile == "-" else open(batchFile, "r")
+	commands = []
+	numInvalid = 0
+	for lineNumber, line in enumerate(inputData, 1):
+		line = line.strip()
+		if line == "" or line.startswith("#"):
+			continue
+		try:
+			commandName, kwargs = commandArguments(parser.parse_args(shlex.split(line)))
+		except (CommandLineError, ValueError) as e:
+			sys.stderr.write("Line %s of %s: %s\n" %(lineNumber, batchFile, str(e).split(" (choose from")[0]))
+			numInvalid += 1
+			continue
+		commands.append((lineNumber, line, commandName, kwargs))
+	if inputData is not sys.stdin:
+		inputData.close()
+	return commands, numInvalid
+
+
+class TracingCursor:
+	'Cursor wrapper that records the time of every statement and runs EXPLAIN before SELECT statements'
+
+	def __init__(self, connection, cursor):
+		self.connection = connection
+		self.cursor = cursor
+
+	def execute(self, query, params = None):
+		if self.connection.explain and query.lstrip().upper().startswith("SELECT"):
+			self.connection.explainQuery(query, params)
+		start = time.time()
+		try:
+			return self.cursor.execute(query, params)
+		finally:
+			self.connection.statements.append((query, time.time() - start))
+
+	def executemany(self, query, rows):
+		start = time.time()
+		try:
+			return self.cursor.executemany(query, rows)
+		finally:
+			self.connection.statements.append((query, time.time() - start))
+
+	def __iter__(self):
+		return iter(self.cursor)
+
+	def __getattr__(self, name):
+		return getattr(self.cursor, name)
+
+class TracingConnection:
+	'Connection wrapper handing out TracingCursors; statements and plans are collected per command by the caller'
+
+	def __init__(self, db, explain = False, backendName = 'mysql'):
+		self.db = db
+		self.explain = explain
+		#plain EXPLAIN on SQLite lists the VDBE bytecode program rather than the plan
+		self.explainPrefix = "EXPLAIN QUERY PLAN " if backendName == 'sqlite' else "EXPLAIN "
+		self.statements = []
+		self.plans = []
+
+	def cursor(self, *args):
+		return TracingCursor(self, self.db.cursor(*args))
+
+	"""
+	Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) on a buffered cursor of its own, before the query itself, so that it never interleaves with a
+	server-side cursor that is still streaming.
+	"""
+	def explainQuery(self, query, params):
+		cursor = self.db.cursor()
+		try:
+			cursor.execute(self.explainPrefix + query, params)
+			self.plans.append((query, cursor.fetchall()))
+		except Exception as e:
+			self.plans.append((query, [("EXPLAIN failed: %s" %(e),)]))
+		finally:
+			cursor.close()
+
+	def __getattr__(self, name):
+		return getattr(self.db, name)
+
+def traceConnection(tdi, explain):
+	tdi.db = TracingConnection(tdi.db, explain, tdi.backend.name)
+
+"""
+Runs one command on a TDISQL object.
+@return (result, seconds, statements, plans) where statements is a list of (SQL, seconds) and plans a list of (SQL, EXPLAIN rows)
+"""
+def runCommand(tdi, commandName, kwargs):
+	tdi.db.statements = []
+	tdi.db.plans = []
+	start = time.time()
+	try:
+		result = getattr(tdi, commandName)(**kwargs)
+	except Exception as e:
+		result = CommandFailed("%s: %s" %(type(e).__name__, e))
+	return result, time.time() - start, tdi.db.statements, tdi.db.plans
+
+class CommandFailed:
+	'Result of a command that raised an exception'
+
+	def __init__(self, message):
+		self.message = message
+
+
+"""
+Flattens a query result into rows for TSV output. Dictionaries become one row per key (nested values add columns),
+(result, count) tuples repeat the count on every row and scalars become a single row.
+"""
+def resultRows(result):
+	if result is None or result == "null":
+		return []
+	if isinstance(result, ResultTable):
+		return result.toTuples()
+	if isinstance(result, dict):
+		rows = []
+		for key in sorted(result.keys()):
+			keyColumns = key if isinstance(key, tuple) else (key,)
+			rows.extend([keyColumns + row for row in resultRows(result[key])])
+		return rows
+	if isinstance(result, tuple) and len(result) > 0 and isinstance(result[0], (dict, ResultTable, list, set)):
+		extraColumns = tuple(result[1:])
+		return [row + extraColumns for row in resultRows(result[0])]
+	if isinstance(result, (list, tuple, set, frozenset)):
+		items = sorted(result) if isinstance(result, (set, frozenset)) else result
+		return [tuple(x) if isinstance(x, (tuple, list)) or hasattr(x, "__slots__") else (x,) for x in items]
+	return [(result,)]
+
+"""
+Converts a query result to values the json module can write.
+"""
+def jsonValue(result):
+	if isinstance(result, ResultTable):
+		return [jsonValue(tuple(x)) for x in result]
+	if isinstance(result, dict):
+		return dict((("\t".join(map(str, k)) if isinstance(k, tuple) else k), jsonValue(v)) for k, v in result.iteritems())
+	if isinstance(result, (set, frozenset)):
+		return [jsonValue(x) for x in sorted(result)]
+	if isinstance(result, (list, tuple)):
+		return [jsonValue(x) for x in result]
+	if hasattr(result, "tolist"):
+		return result.tolist()
+	if type(result).__name__ == "Decimal":
+		return float(result)
+	return result
+
+class ResultWriter:
+	'Writes command results as TSV rows or JSON lines, one command at a time'
+
+	def __init__(self, stream, outputFormat, withCommand):
+		self.stream = stream
+		self.outputFormat = outputFormat
+		self.withCommand = withCommand
+		self.lock = threading.Lock()
+
+	def write(self, commandID, commandText, result, seconds):
+		if self.outputFormat == "json":
+			if isinstance(result, CommandFailed):
+				record = {"error": result.message}
+			else:
+				record = {"result": jsonValue(result)}
+			if self.withCommand:
+				record.update({"id": commandID, "command": commandText, "seconds": round(seconds, 6)})
+				text = json.dumps(record, sort_keys=True) + "\n"
+			else:
+				text = json.dumps(record.get("result", record), sort_keys=True) + "\n"
+		else:
+			if isinstance(result, CommandFailed):
+				sys.stderr.write("[%s] %s failed: %s\n" %(commandID, commandText, result.message))
+				return
+			prefix = "%s\t" %(commandID) if self.withCommand else ""
+			text = "".join(prefix + "\t".join(formatCell(x) for x in row) + "\n" for row in resultRows(result))
+
+		with self.lock:
+			self.stream.write(text)
+			self.stream.flush()
+
+def formatCell(value):
+	if value is None:
+		return "NA"
+	if isinstance(value, unicode):
+		return value.encode("utf-8")
+	return str(value)
+
+def reportTrace(commandID, commandText, seconds, statements, plans, timing, explain):
+	lines = []
+	if explain:
+		for query, plan in plans:
+			lines.append("# [%s] EXPLAIN %s" %(commandID, " ".join(query.split())))
+			lines.extend("#\t" + "\t".join(formatCell(x) for x in row) for row in plan)
+	if timing:
+		for query, statementSeconds in statements:
+			lines.append("# [%s] %.6f s  %s" %(commandID, statementSeconds, " ".join(query.split())[:200]))
+		lines.append("# [%s] %s: %.6f s, %s statements" %(commandID, commandText, seconds, len(statements)))
+	if lines:
+		sys.stderr.write("\n".join(lines) + "\n")
+
+
+"""
+Runs the commands of a batch file over a connection pool. Worker threads each borrow a connection per command and
+results are written by the main thread in completion order. Exits non-zero if a command failed or a line did not parse.
+"""
+def runBatch(args, writer):
+	commands, numInvalid = readBatchFile(args.batchFile)
+	pool = TDISQLPool(args.host, args.user, args.password, args.db, size=args.workers,
+					  setup=lambda tdi: traceConnection(tdi, args.explain), backend=args.backend)
+	pending = Queue.Queue()
+	for command in commands:
+		pending.put(command)
+	finished = Queue.Queue()
+
+	def work():
+		while True:
+			try:
+				commandID, commandText, commandName, kwargs = pending.get_nowait()
+			except Queue.Empty:
+				return
+			try:
+				outcome = pool.run(runCommand, commandName, kwargs)
+			except Exception as e:
+				outcome = (CommandFailed("%s: %s" %(type(e).__name__, e)), 0.0, [], [])
+			finished.put((commandID, commandText) + outcome)
+
+	workers = [threading.Thread(target=work) for i in range(min(args.workers, len(commands)))]
+	for worker in workers:
+		worker.daemon = True
+		worker.start()
+
+	start = time.time()
+	numFailed = 0
+	for i in range(len(commands)):
+		commandID, commandText, result, seconds, statements, plans = finished.get()
+		numFailed += isinstance(result, CommandFailed)
+		writer.write(commandID, commandText, result, seconds)
+		reportTrace(commandID, commandText, seconds, statements, plans, args.timing, args.explain)
+
+	for worker in workers:
+		worker.join()
+	pool.close()
+	if args.timing:
+		sys.stderr.write("# %s commands (%s failed, %s invalid lines) in %.6f s with %s workers\n" %(len(commands), numFailed, numInvalid, time.time() - start, args.workers))
+	return 1 if numFailed > 0 or numInvalid > 0 else 0
+
+"""
+Adds the output options, which are accepted both before and after the subcommand.
+@param default: if False, options that are not given are left unset (for the subcommand parsers)
+"""
+def addOutputOptions(parser, default = True):
+	unset = argparse.SUPPRESS
+	parser.add_argument("--format", dest="outputFormat", choices=["tsv", "json"], default="tsv" if default else unset)
+	parser.add_argument("--output", default=None if default else unset, help="write results to this file instead of stdout")
+	parser.add_argument("--timing", action="store_true", default=False if default else unset, help="report command and statement times on stderr")
+	parser.add_argument("--explain", action="store_true", default=False if default else unset, help="report the EXPLAIN plan of every SELECT on stderr")
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description="Run TDISQL populate functions and queries from the command line.")
+	parser.add_argument("--host", default=os.environ.get("TDISQL_HOST", "localhost"))
+	parser.add_argument("--user", default=os.environ.get("TDISQL_USER", ""))
+	parser.add_argument("--password", default=os.environ.get("TDISQL_PASSWORD", ""))
+	parser.add_argument("--db", default=os.environ.get("TDISQL_DB", "TDI"))
+	parser.add_argument("--backend", choices=["mysql", "sqlite"], default=os.environ.get("TDISQL_BACKEND", "mysql"),
+						help="database backend; with sqlite, --db is the path of the database file (default: %(default)s)")
+	addOutputOptions(parser)
+	outputOptions = argparse.ArgumentParser(add_help=False)
+	addOutputOptions(outputOptions, default=False)
+	addCommandParsers(parser, withBatch=True, parents=[outputOptions])
+	args = parser.parse_args(argv)
+
+	stdout = sys.stdout
+	stream = open(args.output, "w") if args.output else stdout
+	#the results own stdout: diagnostics that TDISQL prints while the commands run go to stderr
+	sys.stdout = sys.stderr
+	try:
+		if args.command == "batch":
+			writer = ResultWriter(stream, args.outputFormat, withCommand=True)
+			return runBatch(args, writer)
+
+		writer = ResultWriter(stream, args.outputFormat, withCommand=False)
+		tdi = TDISQL(args.host, args.user, args.password, args.db, backend=args.backend)
+		traceConnection(tdi, args.explain)
+		commandName, kwargs = commandArguments(args)
+		result, seconds, statements, plans = runCommand(tdi, commandName, kwargs)
+		tdi.closeDB()
+		writer.write(1, commandName, result, seconds)
+		reportTrace(1, commandName, seconds, statements, plans, args.timing, args.explain)
+		return 1 if isinstance(result, CommandFailed) else 0
+	finally:
+		sys.stdout = stdout
+		if stream is not stdout:
+			stream.close()
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Benchmark of statement execution in TDISQL: the same inserts and point lookups are run once with the values
+interpolated into the statement text (a textually distinct statement per row, as the loaders used to build them) and
+once with bound parameters through 'TDISQL.executeStatement' (one statement text, prepared once per connection and
+re-bound for every row).
+
+	tdisql_benchmark.py --backend sqlite --db tdi.db --rows 50000
+	tdisql_benchmark.py --host localhost --user tdi --password secret --db TDI --rows 20000 --repeat 3
+
+The rows go to a temporary table, so the benchmark can run against a loaded database without touching its data.
+"""
+import argparse
+import os
+import sys
+import time
+
+from ConnectToTDI_SQL import TDISQL
+
+BENCH_TABLE = "Statement_Bench"
+
+def createBenchTable(tdi):
+	cursor = tdi.db.cursor()
+	cursor.execute("CREATE TEMPORARY TABLE %s (bench_id int, name varchar(100), value int)" %(BENCH_TABLE))
+	cursor.execute("CREATE INDEX statement_bench_name ON %s (name)" %(BENCH_TABLE))
+	tdi.db.commit()
+
+def clearBenchTable(tdi):
+	cursor = tdi.db.cursor()
+	cursor.execute("DELETE FROM %s" %(BENCH_TABLE))
+	tdi.db.commit()
+
+"""
+Name of the i-th benchmark row. Every name has a quote, which the interpolated statements have to escape.
+"""
+def rowName(i):
+	return "gene'%s" %(i)
+
+def interpolatedInserts(tdi, numRows):
+	cursor = tdi.db.cursor()
+	for i in range(numRows):
+		cursor.execute("INSERT INTO %s (bench_id, name, value) VALUES(%s, '%s', %s)" %(BENCH_TABLE, i, rowName(i).replace("'", "''"), i % 97))
+	tdi.db.commit()
+
+def boundInserts(tdi, numRows):
+	sqlInsert = "INSERT INTO %s (bench_id, name, value) VALUES(%%s, %%s, %%s)" %(BENCH_TABLE)
+	for i in range(numRows):
+		tdi.executeStatement(sqlInsert, [i, rowName(i), i % 97])
+	tdi.db.commit()
+
+def interpolatedLookups(tdi, numRows):
+	cursor = tdi.db.cursor()
+	found = 0
+	for i in range(numRows):
+		cursor.execute("SELECT bench_id FROM %s WHERE name = '%s'" %(BENCH_TABLE, rowName(i).replace("'", "''")))
+		found += len(cursor.fetchall())
+	return found
+
+def boundLookups(tdi, numRows):
+	sqlQuery = "SELECT bench_id FROM %s WHERE name = %%s" %(BENCH_TABLE)
+	found = 0
+	for i in range(numRows):
+		found += len(tdi.executeStatement(sqlQuery, [rowName(i)]).fetchall())
+	return found
+
+"""
+Runs every phase 'repeat' times and keeps the fastest run of each.
+@return list of (phase, mode, seconds)
+"""
+def runBenchmark(tdi, numRows, repeat):
+	modes = [("interpolated", interpolatedInserts, interpolatedLookups), ("bound", boundInserts, boundLookups)]
+	best = {}
+	for run in range(repeat):
+		for mode, insertFunction, lookupFunction in modes:
+			clearBenchTable(tdi)
+			start = time.time()
+			insertFunction(tdi, numRows)
+			seconds = time.time() - start
+			best[("insert", mode)] = min(best.get(("insert", mode), seconds), seconds)
+
+			start = time.time()
+			found = lookupFunction(tdi, numRows)
+			seconds = time.time() - start
+			if found != numRows:
+				print "Warning: %s lookups found %s of %s rows." %(mode, found, numRows)
+			best[("lookup", mode)] = min(best.get(("lookup", mode), seconds), seconds)
+	clearBenchTable(tdi)
+	return [(phase, mode, best[(phase, mode)]) for phase in ("insert", "lookup") for mode in ("interpolated", "bound")]
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description="Benchmark interpolated against bound, prepared statements.")
+	parser.add_argument("--host", default=os.environ.get("TDISQL_HOST", "localhost"))
+	parser.add_argument("--user", default=os.environ.get("TDISQL_USER", ""))
+	parser.add_argument("--password", default=os.environ.get("TDISQL_PASSWORD", ""))
+	parser.add_argument("--db", default=os.environ.get("TDISQL_DB", "TDI"))
+	parser.add_argument("--backend", choices=["mysql", "sqlite"], default=os.environ.get("TDISQL_BACKEND", "mysql"))
+	parser.add_argument("--rows", dest="numRows", type=int, default=20000)
+	parser.add_argument("--repeat", type=int, default=3)
+	args = parser.parse_args(argv)
+
+	tdi = TDISQL(args.host, args.user, args.password, args.db, backend=args.backend)
+	createBenchTable(tdi)
+	results = runBenchmark(tdi, args.numRows, args.repeat)
+	tdi.closeDB()
+
+	print "backend\t%s" %(args.backend)
+	print "rows\t%s" %(args.numRows)
+	print "phase\tmode\tseconds\tus_per_statement"
+	for phase, mode, seconds in results:
+		print "%s\t%s\t%.3f\t%.2f" %(phase, mode, seconds, 1e6 * seconds / args.numRows)
+	for phase in ("insert", "lookup"):
+		times = dict((mode, seconds) for p, mode, seconds in results if p == phase)
+		if times["bound"] > 0:
+			print "%s_speedup\t%.2fx" %(phase, times["interpolated"] / times["bound"])
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
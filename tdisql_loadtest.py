@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Load test for 'tdisql_service.py'. Sends requests from a number of concurrent clients and reports the latency
+percentiles and throughput.
+
+	tdisql_loadtest.py --url http://127.0.0.1:8080 --paths paths.txt --requests 2000 --concurrency 16
+	tdisql_loadtest.py --url http://127.0.0.1:8080 --genes TP53,PIK3CA,EGFR --requests 500
+
+Request paths are read from a file (one per line, e.g. '/drivers/TP53?cohort=BRCA') or generated from a list of genes,
+and are sent round robin.
+"""
+import argparse
+import sys
+import threading
+import time
+import urllib2
+
+"""
+Nearest-rank percentile of a sorted list.
+"""
+def percentile(sortedValues, fraction):
+	if len(sortedValues) == 0:
+		return float("nan")
+	rank = int(round(fraction * len(sortedValues) + 0.5)) - 1
+	return sortedValues[min(max(rank, 0), len(sortedValues) - 1)]
+
+def generatePaths(genes):
+	paths = []
+	for gene in genes:
+		paths += ["/drivers/%s" %(gene), "/targets/%s?k=20" %(gene), "/hotspots/%s" %(gene), "/tumors/%s" %(gene)]
+	for i in range(len(genes) - 1):
+		paths.append("/overlap?g1=%s&g2=%s" %(genes[i], genes[i + 1]))
+	return paths
+
+"""
+Sends 'numRequests' requests from 'concurrency' threads.
+@return (sorted latencies in seconds, number of failed requests, wall clock seconds)
+"""
+def runLoad(baseURL, paths, numRequests, concurrency, timeout):
+	latencies = []
+	failures = [0]
+	lock = threading.Lock()
+	counter = [0]
+
+	def client():
+		while True:
+			with lock:
+				i = counter[0]
+				counter[0] += 1
+			if i >= numRequests:
+				return
+			url = baseURL.rstrip("/") + paths[i % len(paths)]
+			start = time.time()
+			try:
+				response = urllib2.urlopen(url, timeout=timeout)
+				response.read()
+				failed = response.getcode() != 200
+			except Exception:
+				failed = True
+			elapsed = time.time() - start
+			with lock:
+				latencies.append(elapsed)
+				failures[0] += failed
+
+	start = time.time()
+	clients = [threading.Thread(target=client) for i in range(concurrency)]
+	for thread in clients:
+		thread.start()
+	for thread in clients:
+		thread.join()
+	return sorted(latencies), failures[0], time.time() - start
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description="Load test the TDISQL HTTP service.")
+	parser.add_argument("--url", default="http://127.0.0.1:8080")
+	parser.add_argument("--paths", help="file with one request path per line")
+	parser.add_argument("--genes", help="comma separated genes to generate request paths from")
+	parser.add_argument("--requests", dest="numRequests", type=int, default=1000)
+	parser.add_argument("--concurrency", type=int, default=8)
+	parser.add_argument("--timeout", type=float, default=60.0)
+	args = parser.parse_args(argv)
+
+	if args.paths:
+		paths = [x.strip() for x in open(args.paths) if x.strip() != "" and not x.startswith("#")]
+	elif args.genes:
+		paths = generatePaths([x for x in args.genes.split(",") if x != ""])
+	else:
+		parser.error("either --paths or --genes is required")
+
+	latencies, numFailed, seconds = runLoad(args.url, paths, args.numRequests, args.concurrency, args.timeout)
+	print "requests\t%s" %(len(latencies))
+	print "failed\t%s" %(numFailed)
+	print "concurrency\t%s" %(args.concurrency)
+	print "throughput_per_s\t%.1f" %(len(latencies) / seconds if seconds > 0 else 0.0)
+	print "mean_ms\t%.3f" %(1000.0 * sum(latencies) / len(latencies) if latencies else float("nan"))
+	for name, fraction in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99)):
+		print "%s_ms\t%.3f" %(name, 1000.0 * percentile(latencies, fraction))
+	print "max_ms\t%.3f" %(1000.0 * latencies[-1] if latencies else float("nan"))
+	return 1 if numFailed > 0 else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+"""
+Local HTTP/JSON service for the TDI queries, so lab tools can share one pool of database connections instead of
+each opening its own.
+
+	tdisql_service.py --db TDI --port 8080 --pool-size 8
+
+Routes (query parameters are the method's argument names, parsed like 'tdisql.py' arguments):
+
+	/drivers/{gene}                 findDriversForGene          (?minNumberOfTumors=&cohort=)
+	/targets/{gene}                 findTopTargetsForDriver     (?k=&rankBy=&minPosterior=&cohort=)
+	/hotspots/{gene}                findTopHotspotsAndDEGs      (?numHotspots=5&cohort=)
+	/tumors/{gene}                  findTumorsWithGT            (?mutType=&cohort=)
+	/deletions/{gene}               findDEGsWithDeletion        (?cohort=)
+	/overlap?g1=&g2=                findOverlappingTargets      (?minNumberOfTumors=&cohort=)
+	/region/{chromosome}/{start}/{end}  findGenesInRegion
+	/query/{method}?...             any query method without side effects (SERVICE_COMMANDS)
+	/stats                          cache and pool counters
+
+Responses are {"total", "offset", "limit", "results"} pages of the result ('offset' and 'limit' parameters, dictionaries
+are paged by key). With 'stream=1' the whole result is sent as JSON lines, one row per line, as it is serialized.
+Results are kept in an in-process LRU cache, and identical requests that arrive while the first one is still
+running wait for its result instead of querying the database again.
+"""
+import argparse
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import OrderedDict
+
+from ConnectToTDI_SQL import TDISQL, TDISQLPool
+from tdisql import QUERY_COMMANDS, parseValue, jsonValue, resultRows
+
+#route name -> (method, names of the path arguments, {query parameter name: method argument name})
+ROUTES = {
+	"drivers": ("findDriversForGene", ["targetGene"], {}),
+	"targets": ("findTopTargetsForDriver", ["gtGene"], {}),
+	"hotspots": ("findTopHotspotsAndDEGs", ["geneName"], {}),
+	"tumors": ("findTumorsWithGT", ["gtGene"], {}),
+	"deletions": ("findDEGsWithDeletion", ["gtGene"], {}),
+	"overlap": ("findOverlappingTargets", [], {"g1": "gene1", "g2": "gene2"}),
+	"region": ("findGenesInRegion", ["chromosome", "start", "end"], {}),
+}
+
+#query methods of 'tdisql.QUERY_COMMANDS' that always write files, which the service does not run
+SIDE_EFFECT_COMMANDS = ["exportFeatureMatrix"]
+
+#query methods served by /query/{method}
+SERVICE_COMMANDS = [x for x in QUERY_COMMANDS if x not in SIDE_EFFECT_COMMANDS]
+
+#arguments naming files on the server, which requests may not set (e.g. the optional outputs of 'findAllOverlappingTargets')
+FILE_ARGUMENTS = set(["inputFile", "outputFile", "matrixFile", "schemaFile"])
+
+#defaults for required arguments that the routes make optional
+ROUTE_DEFAULTS = {
+	"findTopHotspotsAndDEGs": {"numHotspots": 5},
+}
+
+#query parameters handled by the service rather than passed to the query method
+PAGE_PARAMETERS = set(["offset", "limit", "stream"])
+
+class HTTPError(Exception):
+	def __init__(self, status, message):
+		Exception.__init__(self, message)
+		self.status = status
+
+class QueryCache:
+	'Thread-safe LRU cache of query results that also coalesces identical concurrent queries'
+
+	"""
+	@param maxEntries: number of results kept (0 disables caching but still coalesces)
+	@param ttl: seconds a result stays valid (None keeps it until evicted)
+	"""
+	def __init__(self, maxEntries, ttl = None):
+		self.maxEntries = maxEntries
+		self.ttl = ttl
+		self.entries = OrderedDict()
+		self.inflight = {}
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.coalesced = 0
+
+	"""
+	Returns the cached result for 'key', or computes it with 'compute()'. If another thread is already computing the
+	same key, waits for that result instead. Exceptions are passed on to every waiting caller and are not cached.
+	"""
+	def get(self, key, compute):
+		with self.lock:
+			if key in self.entries:
+				storedAt, value = self.entries[key]
+				if self.ttl is None or time.time() - storedAt < self.ttl:
+					self.entries[key] = self.entries.pop(key)
+					self.hits += 1
+					return value
+				del self.entries[key]
+			if key in self.inflight:
+				waiter = self.inflight[key]
+				self.coalesced += 1
+				leader = False
+			else:
+				waiter = {"event": threading.Event()}
+				self.inflight[key] = waiter
+				self.misses += 1
+				leader = True
+
+		if not leader:
+			waiter["event"].wait()
+			if "error" in waiter:
+				raise waiter["error"]
+			return waiter["value"]
+
+		try:
+			value = compute()
+			waiter["value"] = value
+		except Exception as e:
+			waiter["error"] = e
+			raise
+		finally:
+			with self.lock:
+				del self.inflight[key]
+				if "value" in waiter and self.maxEntries > 0:
+					self.entries[key] = (time.time(), waiter["value"])
+					while len(self.entries) > self.maxEntries:
+						self.entries.popitem(last=False)
+			waiter["event"].set()
+		return value
+
+	def stats(self):
+		with self.lock:
+			return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+class QueryService:
+	'Resolves request paths to TDISQL queries and runs them over a connection pool with caching'
+
+	def __init__(self, pool, cache, maxLimit = 10000):
+		self.pool = pool
+		self.cache = cache
+		self.maxLimit = maxLimit
+
+	"""
+	Maps a request path and its query parameters to a method call.
+	@return (methodName, kwargs)
+	"""
+	def resolve(self, path, params):
+		parts = [x for x in path.split("/") if x != ""]
+		if len(parts) == 0:
+			raise HTTPError(404, "no route for /")
+
+		if parts[0] == "query":
+			if len(parts) != 2 or parts[1] not in SERVICE_COMMANDS:
+				raise HTTPError(404, "unknown query method: %s" %("/".join(parts[1:])))
+			methodName, pathArgs, renames = parts[1], [], {}
+		elif parts[0] in ROUTES:
+			methodName, pathArgs, renames = ROUTES[parts[0]]
+		else:
+			raise HTTPError(404, "no route for /%s" %(parts[0]))
+
+		values = parts[1:] if parts[0] != "query" else []
+		if len(values) != len(pathArgs):
+			raise HTTPError(404, "/%s expects %s path arguments" %(parts[0], len(pathArgs)))
+
+		argNames, varargs, keywords, defaults = inspect.getargspec(getattr(TDISQL, methodName))
+		argNames = argNames[1:]
+		numRequired = len(argNames) - len(defaults or ())
+
+		kwargs = dict(ROUTE_DEFAULTS.get(methodName, {}))
+		for name, value in zip(pathArgs, values):
+			kwargs[name] = parseValue(value, name)
+		for name, value in params.iteritems():
+			if name in PAGE_PARAMETERS:
+				continue
+			name = renames.get(name, name)
+			if name in FILE_ARGUMENTS:
+				raise HTTPError(400, "file arguments are not accepted: %s" %(name))
+			if name not in argNames:
+				raise HTTPError(400, "unknown parameter for %s: %s" %(methodName, name))
+			kwargs[name] = parseValue(value, name)
+
+		missing = [x for x in argNames[:numRequired] if x not in kwargs]
+		if missing:
+			raise HTTPError(400, "missing parameters for %s: %s" %(methodName, ", ".join(missing)))
+		return methodName, kwargs
+
+	"""
+	Runs a query through the cache (identical queries share one result) and returns its result.
+	"""
+	def query(self, methodName, kwargs):
+		key = (methodName, tuple(sorted((k, repr(v)) for k, v in kwargs.iteritems())))
+
+		def compute():
+			result = self.pool.run(lambda tdi: getattr(tdi, methodName)(**kwargs))
+			if result is None:
+				raise HTTPError(500, "query %s failed" %(methodName))
+			if isinstance(result, str) and result == "null":
+				raise HTTPError(404, "unknown gene")
+			return result
+
+		return self.cache.get(key, compute)
+
+	"""
+	@return (total, page) where page is the JSON-ready slice [offset, offset + limit) of the result
+	"""
+	def page(self, result, offset, limit):
+		if isinstance(result, dict):
+			keys = sorted(result.keys())
+			return len(keys), jsonValue(dict((k, result[k]) for k in keys[offset:offset + limit]))
+		if isinstance(result, (list, tuple, set, frozenset)) or hasattr(result, "toTuples"):
+			rows = result.toTuples() if hasattr(result, "toTuples") else (sorted(result) if isinstance(result, (set, frozenset)) else result)
+			return len(rows), jsonValue(list(rows[offset:offset + limit]))
+		return 1, jsonValue(result)
+
+class RequestHandler(BaseHTTPRequestHandler):
+	server_version = "TDISQL/1.0"
+
+	def do_GET(self):
+		start = time.time()
+		url = urlparse.urlparse(self.path)
+		params = dict((k, v[-1]) for k, v in urlparse.parse_qs(url.query).iteritems())
+		service = self.server.service
+		try:
+			if url.path.rstrip("/") == "/stats":
+				self.sendJSON(200, {"cache": service.cache.stats(), "pool": {"size": service.pool.size, "open": service.pool.numOpen}})
+				return
+
+			methodName, kwargs = service.resolve(url.path, params)
+			try:
+				offset = int(params.get("offset", 0))
+				limit = min(int(params.get("limit", service.maxLimit)), service.maxLimit)
+			except ValueError:
+				raise HTTPError(400, "offset and limit must be integers")
+			result = service.query(methodName, kwargs)
+
+			if params.get("stream") in ("1", "true"):
+				self.streamRows(result)
+			else:
+				total, page = service.page(result, offset, limit)
+				self.sendJSON(200, {"total": total, "offset": offset, "limit": limit, "results": page})
+		except HTTPError as e:
+			self.sendJSON(e.status, {"error": str(e)})
+		except Exception as e:
+			self.sendJSON(500, {"error": "%s: %s" %(type(e).__name__, e)})
+		finally:
+			if self.server.verbose:
+				sys.stderr.write("%s %s %.6f s\n" %(self.command, self.path, time.time() - start))
+
+	def sendJSON(self, status, value):
+		body = json.dumps(value, sort_keys=True)
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	"""
+	Sends every row of a result as a line of JSON without a Content-Length; the end of the response is marked by
+	closing the connection (HTTP/1.0).
+	"""
+	def streamRows(self, result):
+		self.send_response(200)
+		self.send_header("Content-Type", "application/x-ndjson")
+		self.end_headers()
+		lines = []
+		for row in resultRows(result):
+			lines.append(json.dumps(jsonValue(row)))
+			if len(lines) >= 1000:
+				self.wfile.write("\n".join(lines) + "\n")
+				lines = []
+		if lines:
+			self.wfile.write("\n".join(lines) + "\n")
+
+	def log_message(self, format, *args):
+		pass
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description="Serve TDISQL queries over HTTP/JSON.")
+	parser.add_argument("--host", default=os.environ.get("TDISQL_HOST", "localhost"))
+	parser.add_argument("--user", default=os.environ.get("TDISQL_USER", ""))
+	parser.add_argument("--password", default=os.environ.get("TDISQL_PASSWORD", ""))
+	parser.add_argument("--db", default=os.environ.get("TDISQL_DB", "TDI"))
+	parser.add_argument("--backend", choices=["mysql", "sqlite"], default=os.environ.get("TDISQL_BACKEND", "mysql"),
+						help="database backend; with sqlite, --db is the path of the database file (default: %(default)s)")
+	parser.add_argument("--bind", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+	parser.add_argument("--port", type=int, default=8080)
+	parser.add_argument("--pool-size", dest="poolSize", type=int, default=8, help="number of database connections (default: %(default)s)")
+	parser.add_argument("--cache-size", dest="cacheSize", type=int, default=1024, help="number of cached results (default: %(default)s)")
+	parser.add_argument("--cache-ttl", dest="cacheTTL", type=float, default=None, help="seconds a cached result stays valid (default: until evicted)")
+	parser.add_argument("--max-limit", dest="maxLimit", type=int, default=10000, help="largest page size (default: %(default)s)")
+	parser.add_argument("--verbose", action="store_true", help="log every request and its time on stderr")
+	args = parser.parse_args(argv)
+
+	pool = TDISQLPool(args.host, args.user, args.password, args.db, size=args.poolSize, backend=args.backend)
+	server = ThreadedHTTPServer((args.bind, args.port), RequestHandler)
+	server.service = QueryService(pool, QueryCache(args.cacheSize, args.cacheTTL), args.maxLimit)
+	server.verbose = args.verbose
+	sys.stderr.write("Serving TDI queries on http://%s:%s/\n" %(args.bind, server.server_port))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		pool.close()
+
+if __name__ == "__main__":
+	main()